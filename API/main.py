@@ -1,32 +1,81 @@
-from fastapi import FastAPI, HTTPException
+import time
+STARTED = time.perf_counter()  # import start, the origin of the startup timings
+
+from fastapi import FastAPI, HTTPException, Query, Request, Header, Response, Depends
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, ValidationError
-from datetime import date, datetime
-import sys, os
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import Literal
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from dotenv import load_dotenv
+import sys, os, csv, json, uuid, codecs, asyncio, logging
 
+# The project root holds the `src` package, whether the app is started from
+# the root (uvicorn API.main:app) or from API/ (python main.py).
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Settings are read from the environment when src modules are imported, so
+# .env is loaded before any of them.
+load_dotenv()
+logging.basicConfig(level=logging.INFO)
 
-# Fix the import path - try multiple approaches
-try:
-    # Method 1: Direct import if src is in the same directory
-    from src.logic import GymratManager, PaymentManager
-except ImportError:
-    try:
-        # Method 2: Add current directory to path
-        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-        from src.logic import GymratManager, PaymentManager
-    except ImportError:
-        try:
-            # Method 3: Import from current directory
-            from logic import GymratManager, PaymentManager
-        except ImportError:
-            # Method 4: Manual path addition
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            src_dir = os.path.join(current_dir, 'src')
-            sys.path.insert(0, src_dir)
-            from logic import GymratManager, PaymentManager
+from src.logic import GymratManager, PaymentManager, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, BULK_CHUNK_SIZE, MAX_BULK_CHUNK_SIZE
+from src.logic import CheckinManager, RenewalEngine, summarize_branches
+from src.branches import BRANCHES, DEFAULT_BRANCH, check_branch
+from src.async_db import close_client, warm_up
+from src.db import member_payload, payment_payload, select_columns, MEMBER_FIELDS, PAYMENT_FIELDS
+from src import cache
+from src.expiry import ExpiryIndex, ExpirySweeper, parse_within
+from src.analytics import AnalyticsStore
+from src.snapshot import SnapshotStore
+from src.search import MemberSearchIndex, SEARCH_FIELDS, SEARCH_LIMIT, MAX_SEARCH_LIMIT
+from src import export
+from src import encoding
+from src import metrics
+from src.profiler import SamplingProfiler
+from src.events import ChangeFeed, EVENT_TABLES
+from src.versions import TableVersion, etag_matches
+from src.checkins import CheckinCounters, CheckinStore, parse_window, CHECKIN_RETENTION
+from src.startup import Startup, FirstRequestMiddleware, load_until_ready
+from src.write_queue import (
+    WriteQueue, WriteQueueFlusher, IdempotencyConflict, request_hash, WRITE_QUEUE_MODE, WRITE_THROUGH_GRACE
+)
+
+logger = logging.getLogger(__name__)
+
+startup = Startup(STARTED)
+
+async def warm_up_branches():
+    await asyncio.gather(*(branch.warm_up() for branch in branches.values()))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup.mark("lifespan")
+    profiler.start()
+    for branch in branches.values():
+        branch.start()
+    write_flusher.start()
+    await startup.start(warm_up_branches)
+    yield
+    await startup.stop()
+    await write_flusher.stop()
+    for branch in branches.values():
+        await branch.stop()
+    await close_client()
+    profiler.stop()
 
-app = FastAPI(title="Gym Membership API", version="1.0")
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson that reports its rendering time to the request metrics."""
+
+    def render(self, content):
+        start = time.perf_counter()
+        body = encoding.encode_json(content)
+        metrics.add_timing("render", time.perf_counter() - start)
+        return body
+
+app = FastAPI(title="Gym Membership API", version="1.0", lifespan=lifespan,
+              default_response_class=TimedJSONResponse)
 
 # -------------------- CORS --------------------
 app.add_middleware(
@@ -37,8 +86,140 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
-gymrat_mgr = GymratManager()
-payment_mgr = PaymentManager()
+# -------------------- Metrics --------------------
+profiler = SamplingProfiler()
+app.add_middleware(metrics.MetricsMiddleware, profiler=profiler)
+app.add_middleware(FirstRequestMiddleware, startup=startup)
+
+# -------------------- Branches --------------------
+class Branch:
+    """Managers and in-process indexes of one branch.
+
+    Every branch has its own data partition, so its indexes, analytics and
+    change feed only follow its own managers' writes.
+    """
+
+    def __init__(self, branch_id):
+        self.id = branch_id
+        # Columnar copies of both tables that the managers count and sum over.
+        self.snapshots = SnapshotStore()
+        self.gymrat_mgr = GymratManager(branch_id, self.snapshots)
+        self.payment_mgr = PaymentManager(branch_id, self.snapshots)
+        self.gymrat_mgr.add_listener(self.snapshots.on_member_write)
+        self.payment_mgr.add_listener(self.snapshots.on_payment_write)
+        self.renewals = RenewalEngine(self.gymrat_mgr, self.payment_mgr)
+
+        self.expiry_index = ExpiryIndex()
+        self.expiry_sweeper = ExpirySweeper(self.expiry_index, self.gymrat_mgr)
+        self.gymrat_mgr.add_listener(self.expiry_index.on_write)
+        self.gymrat_mgr.add_listener(self.expiry_sweeper.on_write)
+
+        self.search_index = MemberSearchIndex()
+        self.gymrat_mgr.add_listener(self.search_index.on_write)
+
+        self.analytics = AnalyticsStore()
+        self.gymrat_mgr.add_listener(self.analytics.on_member_write)
+        self.payment_mgr.add_listener(self.analytics.on_payment_write)
+
+        self.change_feed = ChangeFeed()
+        self.gymrat_mgr.add_listener(self.change_feed.listener("gymrats"))
+        self.payment_mgr.add_listener(self.change_feed.listener("payments"))
+
+        # Validators and delta syncs of the member and payment lists.
+        self.members_version = TableVersion("gymrats")
+        self.payments_version = TableVersion("payments")
+        self.gymrat_mgr.add_listener(self.members_version.on_write)
+        self.payment_mgr.add_listener(self.payments_version.on_write)
+
+        # Check-ins are validated against the expiry index's members.
+        self.checkin_mgr = CheckinManager(branch_id)
+        self.checkin_counters = CheckinCounters()
+        self.checkins = CheckinStore(self.checkin_mgr, self.expiry_index, self.checkin_counters)
+        self._loads = {}  # index name -> its load_until_ready task
+
+    @property
+    def ready(self):
+        return (self.expiry_index.ready and self.search_index.ready and self.analytics.ready
+                and self.snapshots.ready and self.checkin_counters.ready)
+
+    def start(self):
+        """Bind the change feed and start the check-in flusher (call from the lifespan)."""
+        self.change_feed.bind(asyncio.get_running_loop())
+        self.checkins.start()
+
+    async def warm_up(self):
+        """Open the branch's pooled connections, prime its first list pages, then start its index loads.
+
+        Raises when the database cannot be reached, so the warm-up is retried.
+        """
+        await warm_up(self.id)
+        for result in await asyncio.gather(self.gymrat_mgr.get_members_page_async(),
+                                           self.payment_mgr.get_payments_page_async()):
+            if not result["success"]:
+                raise RuntimeError(result.get("error"))
+        if not self._loads:
+            self.expiry_sweeper.start()
+            for name in self.loaders:
+                self._keep_loading(name)
+
+    @property
+    def loaders(self):
+        """name -> (blocking load, readiness check) of every index loaded from full scans."""
+        return {
+            "analytics": (lambda: self.analytics.load(self.gymrat_mgr, self.payment_mgr),
+                          lambda: self.analytics.ready),
+            "snapshots": (lambda: self.snapshots.load(self.gymrat_mgr, self.payment_mgr),
+                          lambda: self.snapshots.ready),
+            "search index": (lambda: self.search_index.load(self.gymrat_mgr.iter_members(SEARCH_FIELDS)),
+                             lambda: self.search_index.ready),
+            "check-in counters": (lambda: self.checkin_counters.load(self.checkin_mgr.iter_checkins(
+                                      datetime.now() - timedelta(seconds=CHECKIN_RETENTION))),
+                                  lambda: self.checkin_counters.ready),
+        }
+
+    def _keep_loading(self, name):
+        """Load one index in the background, retrying with backoff until it is ready."""
+        task = self._loads.get(name)
+        if task is not None and not task.done():
+            return
+        load, ready = self.loaders[name]
+        self._loads[name] = asyncio.create_task(load_until_ready(f"{name} of branch {self.id}", load, ready))
+
+    async def rebuild(self):
+        """Reload the analytics and snapshots now; one that fails keeps retrying in the background."""
+        names = ("analytics", "snapshots")
+        await asyncio.gather(*(asyncio.to_thread(self.loaders[name][0]) for name in names))
+        for name in names:
+            if not self.loaders[name][1]():
+                self._keep_loading(name)
+
+    async def stop(self):
+        for task in self._loads.values():
+            task.cancel()
+        await self.expiry_sweeper.stop()
+        await self.checkins.stop()
+        self.change_feed.close()
+
+branches = {branch_id: Branch(branch_id) for branch_id in BRANCHES}
+default_branch = branches[DEFAULT_BRANCH]
+
+def get_branch(branch: str | None = Query(None, description="Branch id; the default branch when left out.")):
+    """Route dependency resolving ?branch= to its Branch (404 for branches this deployment does not serve)."""
+    try:
+        return branches[check_branch(branch)]
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+def body_branch(model, branch):
+    """A branch named in a request body wins over ?branch=."""
+    return get_branch(model.branch) if model.branch else branch
+
+# Single-row member and payment writes go through the local write queue.
+write_queue = WriteQueue()
+write_flusher = WriteQueueFlusher(write_queue, {
+    b.id: {"member": b.gymrat_mgr.add_members_once, "payment": b.payment_mgr.add_payments_once}
+    for b in branches.values()
+})
 
 # -------------------- Schemas --------------------
 class MemberCreate(BaseModel):
@@ -47,6 +228,22 @@ class MemberCreate(BaseModel):
     plan: str
     start_date: date | None = None
     end_date: date | None = None
+    branch: str | None = None
+
+class MemberLookup(BaseModel):
+    ids: list[str] = Field(..., min_length=1, max_length=MAX_PAGE_SIZE)
+    include: Literal["payments"] | None = None
+    limit: int = Field(10, ge=1, le=MAX_PAGE_SIZE)
+
+class Renewal(BaseModel):
+    member_id: str
+    plan: str | None = None  # the member's current plan when left out
+
+class MemberRenewal(BaseModel):
+    renewals: list[Renewal] = Field(..., min_length=1, max_length=MAX_BULK_CHUNK_SIZE)
+    method: str | None = None
+    record_payments: bool = True
+    branch: str | None = None
 
 class MemberUpdate(BaseModel):
     new_plan: str
@@ -57,6 +254,183 @@ class PaymentCreate(BaseModel):
     amount: float
     payment_date: datetime | None = None
     method: str | None = None
+    branch: str | None = None
+
+class CheckinCreate(BaseModel):
+    member_id: str
+    checked_in_at: datetime | None = None  # now when left out
+
+# -------------------- Write Queue --------------------
+async def submit_write(kind, key, body, payload, ref, branch, response: Response):
+    """Queue a single-row write for `branch` under its idempotency key and answer for it.
+
+    The queue's SQLite calls run in the threadpool, off the event loop.
+    A repeated key answers with the stored outcome instead of writing again.
+    """
+    sync = WRITE_QUEUE_MODE == "sync"
+    try:
+        entry, created = await run_in_threadpool(
+            write_queue.enqueue, kind, key, payload, request_hash(kind, {**body, "branch": branch.id}),
+            ref, delay=WRITE_THROUGH_GRACE if sync else 0.0, branch=branch.id)
+    except IdempotencyConflict:
+        raise HTTPException(status_code=409, detail="Idempotency-Key was already used for a different request.")
+    if not created:
+        response.headers["Idempotent-Replayed"] = "true"
+    elif sync:
+        entry = await write_flusher.write_through(entry)
+    else:
+        write_flusher.wake()
+    return write_response(entry, response)
+
+def write_response(entry, response: Response):
+    """200 with the stored row once written, 202 while queued, 400 when the database rejected it."""
+    response.headers["Idempotency-Key"] = entry["key"]
+    if entry["status"] == "failed":
+        raise HTTPException(status_code=400, detail=entry["result"].get("error"),
+                            headers={"Idempotency-Key": entry["key"]})
+    if entry["status"] == "done":
+        return {**entry["result"], "idempotency_key": entry["key"]}
+    response.status_code = 202
+    return {"success": True, "queued": True, "status": "pending", "idempotency_key": entry["key"],
+            "message": f"Accepted; the {entry['kind']} will be written shortly.", "data": [entry["payload"]]}
+
+def negotiate_format(request: Request, fmt=None):
+    try:
+        return encoding.negotiate(request.headers.get("accept"), fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=406, detail=str(e))
+
+def list_response(request: Request, result, fmt=None, headers=None):
+    """Encode a list envelope straight to bytes in the negotiated format.
+
+    Returning a Response skips FastAPI's jsonable_encoder pass, which walks
+    every row again before it is serialized.
+    """
+    fmt = negotiate_format(request, fmt)
+    start = time.perf_counter()
+    body = encoding.encode(result, fmt)
+    metrics.add_timing("render", time.perf_counter() - start)
+    return Response(body, media_type=encoding.MEDIA_TYPES[fmt], headers={"Vary": "Accept", **(headers or {})})
+
+def versioned_list(request: Request, version, fmt, since, fields, allowed, filtered, variant=()):
+    """Answer a list request from its table version, without a query, when possible.
+
+    Returns (response or None, validator headers): a 304 when If-None-Match
+    names the current ETag, or the rows changed after `since`.
+    """
+    headers = {**version.headers(negotiate_format(request, fmt), *variant),
+               "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers={"Vary": "Accept", **headers}), headers
+    if since is None:
+        return None, headers
+    if filtered:
+        raise HTTPException(status_code=400, detail="since cannot be combined with cursor or filters.")
+    try:
+        select_columns(fields, allowed, "id")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    delta = version.changes_since(since, fields)
+    if delta is None:
+        raise HTTPException(status_code=410, detail=f"Version {since} is no longer available; reload the list.")
+    delta["message"] = f"{len(delta['data'])} changed, {len(delta['deleted'])} deleted since {since}."
+    return list_response(request, delta, fmt, headers), headers
+
+def parse_fields(fields):
+    """Split a comma separated ?fields= projection into a list."""
+    if not fields:
+        return None
+    return [f.strip() for f in fields.split(",") if f.strip()]
+
+# -------------------- Bulk Ingestion --------------------
+async def iter_request_lines(request: Request):
+    """Yield decoded text lines from a streamed request body."""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    async for chunk in request.stream():
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer.strip():
+        yield buffer.rstrip("\r")
+
+async def iter_bulk_rows(request: Request):
+    """Yield raw rows from a JSON array, CSV (one record per line) or NDJSON body.
+
+    Unparseable NDJSON lines are yielded as the exception so they show up
+    in the per-row report instead of aborting the whole upload.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type == "text/csv":
+        header = None
+        async for line in iter_request_lines(request):
+            if not line.strip():
+                continue
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [h.strip() for h in values]
+                continue
+            yield {k: (v if v != "" else None) for k, v in zip(header, values)}
+    elif content_type in ("application/x-ndjson", "application/jsonl"):
+        async for line in iter_request_lines(request):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield e
+    else:
+        rows = await request.json()
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of rows.")
+        for row in rows:
+            yield row
+
+async def ingest_bulk(request: Request, model, insert_many, chunk_size, branch):
+    """Validate streamed rows with `model` and write them to `branch`, `chunk_size` at a time."""
+    results = []
+    pending, pending_rows = [], []
+
+    async def flush():
+        report = await run_in_threadpool(insert_many, pending, chunk_size)
+        if report["success"]:
+            for row, outcome in zip(pending_rows, report["results"]):
+                results.append({"row": row, **outcome})
+        else:
+            error = report.get("error", report["message"])
+            results.extend({"row": row, "success": False, "error": error} for row in pending_rows)
+        pending.clear()
+        pending_rows.clear()
+
+    index = 0
+    async for raw in iter_bulk_rows(request):
+        try:
+            if isinstance(raw, Exception):
+                raise raw
+            row = model(**raw)
+            if row.branch not in (None, branch.id):
+                raise ValueError(f"Row is for branch '{row.branch}'; upload it with ?branch={row.branch}.")
+            pending.append(row.model_dump(exclude={"branch"}))
+            pending_rows.append(index)
+        except (ValueError, TypeError) as e:
+            results.append({"row": index, "success": False, "error": str(e)})
+        index += 1
+        if len(pending) >= chunk_size:
+            await flush()
+    if pending:
+        await flush()
+
+    results.sort(key=lambda r: r["row"])
+    inserted = sum(1 for r in results if r["success"])
+    return {
+        "success": True,
+        "message": f"Processed {index} rows: {inserted} inserted, {index - inserted} failed.",
+        "inserted": inserted,
+        "failed": index - inserted,
+        "results": results,
+    }
 
 # -------------------- Debug Routes --------------------
 @app.get("/debug/model-info")
@@ -98,6 +472,22 @@ def debug_payment_schema():
             "error_details": e.errors()
         }
 
+@app.get("/debug/cache")
+def debug_cache():
+    """Hit, miss and eviction counters of the read cache"""
+    return cache.stats()
+
+@app.get("/debug/profiler")
+def debug_profiler():
+    """Sampling profiler settings and how many slow requests it has dumped"""
+    return profiler.status()
+
+@app.post("/debug/profiler")
+def debug_profiler_toggle(slow_ms: float = Query(..., ge=0)):
+    """Dump stacks of requests slower than `slow_ms` (0 turns the profiler off)"""
+    profiler.configure(slow_ms)
+    return profiler.status()
+
 @app.post("/debug/test-payment")
 def debug_test_payment(data: dict):
     """Debug endpoint to test raw payment data"""
@@ -123,67 +513,475 @@ def debug_test_payment(data: dict):
 def root():
     return {"status": "API running 🚀", "timestamp": datetime.now().isoformat()}
 
+def cache_samples():
+    stats = cache.stats()
+    return [
+        ("cache_hits_total", "counter", "Read cache hits.", stats["hits"]),
+        ("cache_misses_total", "counter", "Read cache misses.", stats["misses"]),
+        ("cache_evictions_total", "counter", "Read cache LRU evictions.", stats["evictions"]),
+        ("cache_entries", "gauge", "Entries in the read cache.", stats["size"]),
+    ]
+
+metrics.add_collector(cache_samples)
+
+def write_queue_samples():
+    stats = write_flusher.stats()
+    return [
+        ("write_queue_pending", "gauge", "Accepted writes not yet in the database.", stats["pending"]),
+        ("write_queue_failed", "gauge", "Queued writes the database rejected or that ran out of retries.", stats["failed"]),
+        ("write_queue_flushed_total", "counter", "Queued writes stored in the database.", stats["flushed"]),
+        ("write_queue_retries_total", "counter", "Queued writes rescheduled after a failure.", stats["retries"]),
+    ]
+
+metrics.add_collector(write_queue_samples)
+
+def event_samples():
+    feeds = [branch.change_feed.stats() for branch in branches.values()]
+    stats = {key: sum(feed[key] for feed in feeds) for key in ("subscribers", "published")}
+    return [
+        ("events_subscribers", "gauge", "Open /events streams.", stats["subscribers"]),
+        ("events_published_total", "counter", "Change events published to /events.", stats["published"]),
+    ]
+
+metrics.add_collector(event_samples)
+
+def checkin_samples():
+    stores = [branch.checkins.stats() for branch in branches.values()]
+    stats = {key: sum(store[key] for store in stores) for key in ("buffered", "flushed", "rejected")}
+    return [
+        ("checkins_buffered", "gauge", "Accepted check-ins not yet written.", stats["buffered"]),
+        ("checkins_flushed_total", "counter", "Check-ins written in bulk.", stats["flushed"]),
+        ("checkins_rejected_total", "counter", "Buffered check-ins the database refused.", stats["rejected"]),
+    ]
+
+metrics.add_collector(checkin_samples)
+
+@app.get("/events")
+async def events(tables: str | None = None, last_event_id: str | None = Header(None),
+                 branch: Branch = Depends(get_branch)):
+    """Server-sent member and payment insert/update/delete deltas.
+
+    A client applies `change` events to its copy and reloads on `reset`;
+    reconnecting with Last-Event-ID replays only the missed events.
+    """
+    wanted = parse_fields(tables) or list(EVENT_TABLES)
+    unknown = [t for t in wanted if t not in EVENT_TABLES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown tables: {', '.join(unknown)}")
+    return StreamingResponse(branch.change_feed.stream(wanted, last_event_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+metrics.add_collector(startup.samples)
+
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving. Checks no dependency, so a database outage never restarts it."""
+    return {"status": "ok", "uptime": round(time.perf_counter() - STARTED, 3)}
+
+@app.get("/readyz")
+def readyz(response: Response):
+    """Readiness: 200 once the connections are warm and every branch's indexes are loaded, 503 until then."""
+    checks = {"warm_up": startup.warm, **{f"indexes.{b.id}": b.ready for b in branches.values()}}
+    ready = all(checks.values())
+    if ready:
+        startup.mark("ready")
+    else:
+        response.status_code = 503
+    return {"ready": ready, "checks": checks, "error": startup.error, "startup": startup.timings}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Request, database and cache metrics in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # --- Members ---
 @app.post("/members/")
-def add_member(member: MemberCreate):
-    result = gymrat_mgr.add_member(member.name, member.phone, member.plan, member.start_date, member.end_date)
+async def add_member(member: MemberCreate, response: Response,
+                     idempotency_key: str | None = Header(None, max_length=255),
+                     branch: Branch = Depends(get_branch)):
+    """Add a member; retries with the same Idempotency-Key never add it twice."""
+    branch = body_branch(member, branch)
+    body = member.model_dump(mode="json", exclude={"branch"})
+    payload = {"id": str(uuid.uuid4()), **member_payload(**body)}
+    return await submit_write("member", idempotency_key or str(uuid.uuid4()), body, payload, payload["id"],
+                              branch, response)
+
+@app.post("/members/bulk")
+async def add_members_bulk(request: Request, chunk_size: int = Query(BULK_CHUNK_SIZE, ge=1, le=MAX_BULK_CHUNK_SIZE),
+                           branch: Branch = Depends(get_branch)):
+    """Bulk insert members from a JSON array, CSV or NDJSON body."""
+    return await ingest_bulk(request, MemberCreate, branch.gymrat_mgr.add_members_bulk, chunk_size, branch)
+
+@app.get("/members/")
+async def get_all_members(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    fields: str | None = None,
+    plan: str | None = None,
+    status: str | None = Query(None, pattern="^(active|expired)$"),
+    start_from: date | None = None,
+    start_to: date | None = None,
+    since: str | None = Query(None, description="A version (X-Table-Version); only rows changed after it."),
+    format: str | None = None,
+    branch: Branch = Depends(get_branch),
+):
+    """A page of members as JSON, columnar JSON or MessagePack (see Accept), or the changes since a version."""
+    fields = parse_fields(fields)
+    # Active and expired depend on the day as well as on the writes.
+    response, headers = versioned_list(request, branch.members_version, format, since, fields, MEMBER_FIELDS,
+                                       any((cursor, plan, status, start_from, start_to)),
+                                       (date.today(),) if status else ())
+    if response is not None:
+        return response
+    result = await branch.gymrat_mgr.get_members_page_async(limit, cursor, fields, plan, status,
+                                                            start_from, start_to)
     if result["success"]:
-        return result
+        return list_response(request, result, format, headers)
     raise HTTPException(status_code=400, detail=result.get("error", result["message"]))
 
-@app.get("/members/")
-def get_all_members():
-    result = gymrat_mgr.get_all_members()
+@app.get("/members/expiring")
+async def get_expiring_members(request: Request, within: str = "7d", format: str | None = None,
+                               branch: Branch = Depends(get_branch)):
+    """Members whose plan ends between today and today + `within` (e.g. 7d, 2w)."""
+    try:
+        days = parse_within(within)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not branch.expiry_index.ready:
+        raise HTTPException(status_code=503, detail="Expiry index is still loading.")
+    today = date.today()
+    rows = branch.expiry_index.expiring(today, today + timedelta(days=days))
+    return list_response(request, {"success": True, "data": rows,
+                                   "message": f"{len(rows)} memberships expire within {days} days."}, format)
+
+@app.get("/members/search")
+async def search_members(q: str = Query(..., min_length=2, max_length=100),
+                         limit: int = Query(SEARCH_LIMIT, ge=1, le=MAX_SEARCH_LIMIT),
+                         branch: Branch = Depends(get_branch)):
+    """Find members by phone prefix (digits) or partial/misspelt name."""
+    if not branch.search_index.ready:
+        raise HTTPException(status_code=503, detail="Search index is still loading.")
+    rows = branch.search_index.search(q, limit)
+    return {"success": True, "data": rows, "message": f"{len(rows)} members match '{q}'."}
+
+@app.post("/members/lookup")
+async def lookup_members(lookup: MemberLookup, branch: Branch = Depends(get_branch)):
+    """Resolve many member ids at once, optionally with each member's latest payments."""
+    result = await branch.gymrat_mgr.lookup_members_async(lookup.ids, lookup.include == "payments", lookup.limit)
     if result["success"]:
         return result
     raise HTTPException(status_code=400, detail=result.get("error", result["message"]))
 
+@app.post("/members/renew")
+async def renew_members(renewal: MemberRenewal, response: Response,
+                        idempotency_key: str | None = Header(None, max_length=255),
+                        branch: Branch = Depends(get_branch)):
+    """Renew or upgrade many members; end dates and amounts follow the plan rules.
+
+    A retry with the same Idempotency-Key answers with the first outcome
+    instead of extending the members again.
+    """
+    branch = body_branch(renewal, branch)
+    if idempotency_key is None:
+        result = await run_in_threadpool(branch.renewals.renew, renewal.model_dump()["renewals"], renewal.method,
+                                         renewal.record_payments)
+        if result["success"]:
+            return result
+        raise HTTPException(status_code=400, detail=result.get("error", result["message"]))
+
+    body = renewal.model_dump(mode="json", exclude={"branch"})
+    try:
+        entry, created = await run_in_threadpool(write_queue.enqueue, "renewal", idempotency_key, body,
+                                                 request_hash("renewal", {**body, "branch": branch.id}),
+                                                 branch=branch.id)
+    except IdempotencyConflict:
+        raise HTTPException(status_code=409, detail="Idempotency-Key was already used for a different request.")
+    response.headers["Idempotency-Key"] = idempotency_key
+    if not created:
+        response.headers["Idempotent-Replayed"] = "true"
+        if entry["status"] == "pending":
+            raise HTTPException(status_code=409, detail="A renewal with this Idempotency-Key is still running.",
+                                headers={"Idempotency-Key": idempotency_key})
+        result = entry["result"]
+    else:
+        try:
+            result = await run_in_threadpool(branch.renewals.renew, body["renewals"], renewal.method,
+                                             renewal.record_payments)
+        except Exception as e:
+            # Some members may already be renewed; the key keeps answering with this error.
+            result = {"success": False, "message": "Failed to renew members.", "error": str(e)}
+            await run_in_threadpool(write_queue.fail, idempotency_key, result)
+        else:
+            if result["success"]:
+                await run_in_threadpool(write_queue.complete, idempotency_key, result)
+            else:  # the lookup or the update failed as a whole, nothing changed: a retry may run
+                await run_in_threadpool(write_queue.forget, idempotency_key)
+    if result["success"]:
+        return {**result, "idempotency_key": idempotency_key}
+    raise HTTPException(status_code=400, detail=result.get("error", result["message"]),
+                        headers={"Idempotency-Key": idempotency_key})
+
+# Declared after every fixed /members/<name> GET route so it does not shadow them.
+@app.get("/members/{member_id}")
+async def get_member(member_id: str, include: Literal["payments"] | None = None,
+                     limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE), branch: Branch = Depends(get_branch)):
+    """One member; with include=payments their `limit` latest payments come in the same query."""
+    result = await branch.gymrat_mgr.get_member_async(member_id, include == "payments", limit)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result.get("error", result["message"]))
+    if result["data"] is None:
+        raise HTTPException(status_code=404, detail=result["message"])
+    return result
+
 @app.put("/members/{member_id}")
-def update_member(member_id: str, update: MemberUpdate):
-    result = gymrat_mgr.update_member(member_id, update.new_plan, update.new_end_date)
+async def update_member(member_id: str, update: MemberUpdate, branch: Branch = Depends(get_branch)):
+    result = await branch.gymrat_mgr.update_member_async(member_id, update.new_plan, update.new_end_date)
     if result["success"]:
         return result
     raise HTTPException(status_code=400, detail=result.get("error", result["message"]))
 
 @app.delete("/members/{member_id}")
-def delete_member(member_id: str):
-    result = gymrat_mgr.delete_member(member_id)
+async def delete_member(member_id: str, branch: Branch = Depends(get_branch)):
+    result = await branch.gymrat_mgr.delete_member_async(member_id)
     if result["success"]:
         return result
     raise HTTPException(status_code=400, detail=result.get("error", result["message"]))
 
 # --- Payments ---
 @app.post("/payments/")
-def add_payment(payment: PaymentCreate):
-    print(f"DEBUG: Received payment data: {payment}")  # Debug print
-    print(f"DEBUG: member_id type: {type(payment.member_id)}")  # Debug print
-    
-    result = payment_mgr.add_payment(payment.member_id, payment.amount, payment.payment_date, payment.method)
+async def add_payment(payment: PaymentCreate, response: Response,
+                      idempotency_key: str | None = Header(None, max_length=255),
+                      branch: Branch = Depends(get_branch)):
+    """Record a payment; retries with the same Idempotency-Key never record it twice."""
+    logger.debug("Received payment data: %s", payment)
+    branch = body_branch(payment, branch)
+    body = payment.model_dump(mode="json", exclude={"branch"})
+    key = idempotency_key or str(uuid.uuid4())
+    payload = {**payment_payload(**body), "idempotency_key": key}
+    return await submit_write("payment", key, body, payload, payload["gymrat_id"], branch, response)
+
+@app.post("/payments/bulk")
+async def add_payments_bulk(request: Request, chunk_size: int = Query(BULK_CHUNK_SIZE, ge=1, le=MAX_BULK_CHUNK_SIZE),
+                            branch: Branch = Depends(get_branch)):
+    """Bulk insert payments from a JSON array, CSV or NDJSON body."""
+    return await ingest_bulk(request, PaymentCreate, branch.payment_mgr.add_payments_bulk, chunk_size, branch)
+
+@app.get("/payments/")
+async def get_all_payments(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    fields: str | None = None,
+    method: str | None = None,
+    member_id: str | None = None,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    since: str | None = Query(None, description="A version (X-Table-Version); only rows changed after it."),
+    format: str | None = None,
+    branch: Branch = Depends(get_branch),
+):
+    """A page of payments as JSON, columnar JSON or MessagePack (see Accept), or the changes since a version."""
+    fields = parse_fields(fields)
+    response, headers = versioned_list(request, branch.payments_version, format, since, fields, PAYMENT_FIELDS,
+                                       any((cursor, method, member_id, date_from, date_to)))
+    if response is not None:
+        return response
+    result = await branch.payment_mgr.get_payments_page_async(limit, cursor, fields, method, member_id,
+                                                              date_from, date_to)
     if result["success"]:
-        return result
+        return list_response(request, result, format, headers)
     raise HTTPException(status_code=400, detail=result.get("error", result["message"]))
 
-@app.get("/payments/")
-def get_all_payments():
-    result = payment_mgr.get_all_payments()
+@app.get("/payments/member/{member_id}")
+async def get_payments_by_member(request: Request, member_id: str,
+                                 limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE), format: str | None = None,
+                                 branch: Branch = Depends(get_branch)):
+    """A member's payments, newest first."""
+    result = await branch.payment_mgr.get_payments_by_member_async(member_id, limit)
+    if result["success"]:
+        return list_response(request, result, format)
+    raise HTTPException(status_code=400, detail=result.get("error", result["message"]))
+
+# --- Check-ins ---
+@app.post("/checkins", status_code=202)
+async def add_checkins(checkins: CheckinCreate | list[CheckinCreate], branch: Branch = Depends(get_branch)):
+    """Check members in: one tap or a list of taps, buffered and written in bulk.
+
+    A single tap answers 403 without an active membership and 503 when the
+    buffer is full; a list is answered tap by tap.
+    """
+    if not branch.checkins.ready:
+        raise HTTPException(status_code=503, detail="Active members are still loading.")
+    if isinstance(checkins, list):
+        if len(checkins) > MAX_BULK_CHUNK_SIZE:
+            raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_CHUNK_SIZE} check-ins per request.")
+        results = branch.checkins.accept([c.model_dump() for c in checkins])
+        accepted = sum(1 for r in results if r["success"])
+        return {"success": True, "message": f"Accepted {accepted} of {len(results)} check-ins.",
+                "accepted": accepted, "rejected": len(results) - accepted, "results": results}
+    result = branch.checkins.accept([checkins.model_dump()])[0]
+    if not result["success"]:
+        raise HTTPException(status_code=503 if result.get("retry") else 403, detail=result["message"])
+    return {"success": True, "message": result["message"], "data": result}
+
+@app.get("/checkins/stats")
+async def checkin_stats(window: str = "1h", branch: Branch = Depends(get_branch)):
+    """Visits, unique members and current occupancy over a rolling window (e.g. 15m, 1h, 1d)."""
+    try:
+        seconds = parse_window(window)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not branch.checkin_counters.ready:
+        raise HTTPException(status_code=503, detail="Check-in counters are still loading.")
+    data = {**branch.checkin_counters.stats(seconds), **branch.checkins.stats()}
+    return {"success": True, "data": data, "message": f"{data['visits']} check-ins in the last {window}."}
+
+@app.get("/writes/{key}")
+async def get_write(key: str):
+    """Status of a queued member or payment write (or a renewal) by its Idempotency-Key."""
+    entry = await run_in_threadpool(write_queue.get, key)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"No write with key '{key}'.")
+    fields = ("key", "kind", "status", "attempts", "error", "result", "created_at", "updated_at")
+    return {"success": True, "data": {f: entry[f] for f in fields}}
+
+@app.delete("/payments/{payment_id}")
+async def delete_payment(payment_id: str, branch: Branch = Depends(get_branch)):
+    result = await branch.payment_mgr.delete_payment_async(payment_id)
     if result["success"]:
         return result
     raise HTTPException(status_code=400, detail=result.get("error", result["message"]))
 
-@app.get("/payments/member/{member_id}")
-def get_payments_by_member(member_id: str):
-    result = payment_mgr.get_payments_by_member(member_id)
+# --- Export ---
+async def export_response(pages, fmt, fields, allowed, name):
+    try:
+        export.check(fmt, fields, allowed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        pages = await export.prefetch(pages)
+    except RuntimeError as e:  # the managers' page iterators raise the db error
+        raise HTTPException(status_code=400, detail=str(e))
+    body = export.encode(pages, fmt, fields, allowed)
+    filename = f"{name}-{date.today().isoformat()}.{fmt}"
+    return StreamingResponse(body, media_type=export.MEDIA_TYPES[fmt],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.get("/export/members")
+async def export_members(
+    format: str = "csv",
+    fields: str | None = None,
+    plan: str | None = None,
+    status: str | None = Query(None, pattern="^(active|expired)$"),
+    start_from: date | None = None,
+    start_to: date | None = None,
+    branch: Branch = Depends(get_branch),
+):
+    """Stream every matching member as CSV, NDJSON or Parquet."""
+    columns = parse_fields(fields) or export.MEMBER_EXPORT_FIELDS
+    pages = branch.gymrat_mgr.iter_member_pages_async(columns, plan=plan, status=status,
+                                                      start_from=start_from, start_to=start_to)
+    return await export_response(pages, format, columns, export.MEMBER_FIELDS, "members")
+
+@app.get("/export/payments")
+async def export_payments(
+    format: str = "csv",
+    fields: str | None = None,
+    method: str | None = None,
+    member_id: str | None = None,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    branch: Branch = Depends(get_branch),
+):
+    """Stream every matching payment as CSV, NDJSON or Parquet."""
+    columns = parse_fields(fields) or export.PAYMENT_EXPORT_FIELDS
+    pages = branch.payment_mgr.iter_payment_pages_async(columns, method=method, member_id=member_id,
+                                                        date_from=date_from, date_to=date_to)
+    return await export_response(pages, format, columns, export.PAYMENT_FIELDS, "payments")
+
+# --- Analytics ---
+def require_analytics(branch):
+    if not branch.analytics.ready:
+        raise HTTPException(status_code=503, detail="Analytics are still loading.")
+    return branch.analytics
+
+@app.get("/analytics/revenue")
+async def revenue(period: str = Query("day", pattern="^(day|week|month)$"),
+                  start: date | None = None, end: date | None = None, branch: Branch = Depends(get_branch)):
+    analytics = require_analytics(branch)
+    return {"success": True, "period": period, "summary": analytics.revenue.summary(),
+            "data": analytics.revenue.series(period, start, end)}
+
+@app.get("/analytics/revenue/methods")
+async def revenue_by_method(branch: Branch = Depends(get_branch)):
+    return {"success": True, "data": require_analytics(branch).revenue.methods()}
+
+@app.get("/analytics/members/active")
+async def active_members_per_plan(branch: Branch = Depends(get_branch)):
+    return {"success": True, "data": require_analytics(branch).membership.active_per_plan()}
+
+@app.get("/analytics/members/churn")
+async def churn(days: int = Query(30, ge=1, le=3650), branch: Branch = Depends(get_branch)):
+    """Share of members active `days` ago whose plan has ended since then."""
+    analytics = require_analytics(branch)
+    today = date.today()
+    return {"success": True, "data": analytics.membership.churn(today - timedelta(days=days), today)}
+
+@app.get("/analytics/members/count")
+async def count_members(plan: str | None = None, status: str | None = Query(None, pattern="^(active|expired)$"),
+                        start_from: date | None = None, start_to: date | None = None,
+                        branch: Branch = Depends(get_branch)):
+    """Members matching the GET /members/ filters, counted in memory once the snapshot is loaded."""
+    result = await branch.gymrat_mgr.count_members_async(plan, status, start_from, start_to)
     if result["success"]:
         return result
     raise HTTPException(status_code=400, detail=result.get("error", result["message"]))
 
-@app.delete("/payments/{payment_id}")
-def delete_payment(payment_id: str):
-    result = payment_mgr.delete_payment(payment_id)
+@app.get("/analytics/payments/totals")
+async def payment_totals(method: str | None = None, member_id: str | None = None,
+                         date_from: date | None = None, date_to: date | None = None,
+                         branch: Branch = Depends(get_branch)):
+    """Count and sum of the payments matching the GET /payments/ filters."""
+    result = await branch.payment_mgr.payment_totals_async(method, member_id, date_from, date_to)
     if result["success"]:
         return result
     raise HTTPException(status_code=400, detail=result.get("error", result["message"]))
 
+@app.post("/analytics/rebuild")
+async def rebuild_analytics(branch: Branch = Depends(get_branch)):
+    """Recompute every aggregate and snapshot from full scans (e.g. after a direct database import)."""
+    await branch.rebuild()
+    analytics = require_analytics(branch)
+    return {"success": True, "message": "Analytics rebuilt.", "summary": analytics.revenue.summary()}
+
+# --- Branches ---
+@app.get("/branches")
+async def list_branches():
+    """Branches served by this deployment; requests without ?branch= go to the default one."""
+    return {"success": True, "default": DEFAULT_BRANCH, "data": list(branches)}
+
+@app.get("/branches/summary")
+async def branches_summary(branch_ids: str | None = Query(None, alias="branches"),
+                           date_from: date | None = None, date_to: date | None = None):
+    """Members, active members, payments and revenue per branch and in total.
+
+    Branches answer from their snapshots once loaded; until then every
+    branch partition is queried at the same time, so the summary takes
+    about as long as the slowest branch rather than the sum of all.
+    """
+    wanted = parse_fields(branch_ids) or list(branches)
+    unknown = [b for b in wanted if b not in branches]
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown branches: {', '.join(unknown)}")
+    result = await summarize_branches({b: (branches[b].gymrat_mgr, branches[b].payment_mgr) for b in wanted},
+                                      date_from, date_to)
+    if result["success"]:
+        return result
+    raise HTTPException(status_code=400, detail=result["message"])
+
+startup.mark("imported")
+
 # -------------------- Run --------------------
 #def start():
 #    import uvicorn
@@ -0,0 +1,586 @@
+"""Latency, throughput and memory benchmark for every route in API/main.py.
+
+Seeds an embedded SQLite database (STORAGE_BACKEND=sqlite) with a
+deterministic dataset, starts the app in-process (lifespan included) and
+drives each route at a fixed concurrency. For every route it reports
+p50/p95/p99 latency, requests per second, errors and the peak RSS seen
+while that route was running, then writes everything as JSON.
+
+Seeded databases are kept under bench/.data and reused by later runs with
+the same size and seed. Write routes clean up after themselves, so a
+reused database stays the same between runs.
+
+Pass a previous result file as --baseline to flag regressions. The exit
+code is 1 when any route got slower or failed more than the baseline
+allows.
+
+Usage:
+    python bench/api_suite.py --members 10000 --clients 20 --requests 500
+    python bench/api_suite.py --members 1000000 --baseline bench/results/api-1000000-old.json
+    python bench/api_suite.py --members 1000 --routes members,payments
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+import argparse
+import platform
+import resource
+import sqlite3
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "API"))
+
+import httpx
+
+DATA_DIR = os.path.join(ROOT, "bench", ".data")
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+PLANS = {"Monthly": (30, 1000.0), "Quarterly": (90, 2700.0), "Yearly": (365, 9600.0)}
+METHODS = ("Cash", "Card", "UPI")
+
+# -------------------- Seeding --------------------
+def seed_path(members, payments_per_member, seed):
+    return os.path.join(DATA_DIR, f"gym-{members}-{payments_per_member}-{seed}.sqlite3")
+
+def member_rows(members, rng, today):
+    for i in range(members):
+        plan = rng.choice(tuple(PLANS))
+        start = today - timedelta(days=rng.randrange(730))
+        end = start + timedelta(days=PLANS[plan][0])
+        yield (str(uuid.UUID(int=rng.getrandbits(128), version=4)), f"Member {i}", rng.randrange(16, 70),
+               f"9{i:09d}", plan, start.isoformat(), end.isoformat())
+
+def seed(path, members, payments_per_member, seed_value):
+    """Create and fill the benchmark database unless an identical one exists."""
+    meta_path = path + ".json"
+    meta = {"members": members, "payments_per_member": payments_per_member, "seed": seed_value}
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            if json.load(f) == meta:
+                return 0.0
+    for suffix in ("", "-wal", "-shm", ".json"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.makedirs(DATA_DIR, exist_ok=True)
+
+    from src.storage.sqlite_backend import SQLiteStorage
+    started = time.perf_counter()
+    SQLiteStorage(path).close()  # creates the schema and indexes
+    rng = random.Random(seed_value)
+    today = date.today()
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("BEGIN")
+    payments = []
+    for row in member_rows(members, rng, today):
+        conn.execute("INSERT INTO gymrats (id, name, age, phone, plan, start_date, end_date) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+        start, end = date.fromisoformat(row[5]), min(date.fromisoformat(row[6]), today)
+        span = max((end - start).days, 1)
+        for _ in range(payments_per_member):
+            paid = datetime.combine(start + timedelta(days=rng.randrange(span)), datetime.min.time())
+            paid += timedelta(seconds=rng.randrange(86400))
+            payments.append((row[0], PLANS[row[4]][1], paid.isoformat(), rng.choice(METHODS)))
+        if len(payments) >= 50000:
+            conn.executemany("INSERT INTO payments (gymrat_id, amount, payment_date, method) VALUES (?, ?, ?, ?)", payments)
+            payments.clear()
+    conn.executemany("INSERT INTO payments (gymrat_id, amount, payment_date, method) VALUES (?, ?, ?, ?)", payments)
+    conn.execute("COMMIT")
+    conn.execute("ANALYZE")
+    conn.close()
+    with open(meta_path, "w") as f:
+        json.dump(meta, f)
+    return time.perf_counter() - started
+
+def sample_members(path, n, seed_value):
+    conn = sqlite3.connect(path)
+    total = conn.execute("SELECT count(*) FROM gymrats").fetchone()[0]
+    rowids = random.Random(seed_value).sample(range(1, total + 1), min(n, total)) if total else []
+    rows = conn.execute(f"SELECT id, plan, end_date FROM gymrats WHERE rowid IN ({','.join('?' * len(rowids))})",
+                        rowids).fetchall()
+    conn.close()
+    return [{"id": r[0], "plan": r[1], "end_date": r[2]} for r in rows]
+
+# -------------------- Memory --------------------
+def current_rss():
+    """Resident set size in bytes (Linux /proc), else the process peak so far."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class RSSSampler:
+    """Samples RSS in a thread so the peak of a single route run can be reported."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+# -------------------- Scenarios --------------------
+class Context:
+    """Ids shared between scenarios, plus the rows written that must be removed afterwards."""
+
+    def __init__(self, members, rng):
+        self.members = members
+        self.rng = rng
+        self.counter = 0
+        self.created_members = []
+        self.created_payments = []
+        self.payment_keys = []
+        self.bulk_members = []
+        self.bulk_payments = []
+        self.member_cursor = None
+        self.payment_cursor = None
+        self.replay_key = f"bench-replay-{uuid.uuid4()}"
+        self.versions = {}  # list path -> (ETag, X-Table-Version) of its last full response
+
+    def member(self):
+        return self.rng.choice(self.members)
+
+    def active_member(self):
+        today = date.today().isoformat()
+        return self.rng.choice([m for m in self.members if m["end_date"] >= today] or self.members)
+
+    def next_phone(self):
+        self.counter += 1
+        return f"8{os.getpid() % 1000:03d}{self.counter:07d}"
+
+def ndjson(rows):
+    return "\n".join(json.dumps(r) for r in rows).encode()
+
+def bulk_members_body(ctx, n=100):
+    return ndjson({"name": "Bulk", "phone": ctx.next_phone(), "plan": "Monthly"} for _ in range(n))
+
+def bulk_payments_body(ctx, n=100):
+    return ndjson({"member_id": ctx.member()["id"], "amount": 100.0, "method": "Cash"} for _ in range(n))
+
+def record_ids(target, key="data"):
+    def hook(resp):
+        data = resp.json().get(key) or []
+        target.extend(row["id"] for row in data)
+    return hook
+
+def record_payment(ctx):
+    # In async write-queue mode the 202 carries no payment id yet, only its key.
+    def hook(resp):
+        body = resp.json()
+        ctx.payment_keys.append(body["idempotency_key"])
+        if resp.status_code == 200:
+            ctx.created_payments.extend(row["id"] for row in body["data"])
+    return hook
+
+def renewals_body(ctx, n=100):
+    # Renews members the bench added itself, so the seeded ones keep their end dates between runs.
+    if not ctx.bulk_members:
+        return None
+    ids = ctx.rng.sample(ctx.bulk_members, min(n, len(ctx.bulk_members)))
+    return ("/members/renew", {"json": {"renewals": [{"member_id": i, "plan": ctx.rng.choice(tuple(PLANS))} for i in ids],
+                                        "method": "Cash"}})
+
+def record_renewals(ctx):
+    def hook(resp):
+        ctx.bulk_payments.extend(r["payment"]["id"] for r in resp.json()["results"] if r.get("payment"))
+    return hook
+
+def record_bulk(target):
+    def hook(resp):
+        target.extend(r["data"]["id"] for r in resp.json()["results"] if r["success"])
+    return hook
+
+def record_version(ctx, path):
+    def hook(resp):
+        ctx.versions[path] = (resp.headers["etag"], resp.headers["x-table-version"])
+    return hook
+
+def revalidate(ctx, path):
+    # Conditional refresh of an unchanged list: 304, no query.
+    if path not in ctx.versions:
+        return None
+    return (f"{path}?limit=100", {"headers": {"If-None-Match": ctx.versions[path][0]}})
+
+def delta_since(ctx, path):
+    if path not in ctx.versions:
+        return None
+    return (f"{path}?since={ctx.versions[path][1]}", {})
+
+# Each scenario: (name, method, route template, weight, request builder, response hook).
+# `weight` scales --requests for expensive routes; the builder returns (url, httpx kwargs).
+def scenarios(ctx):
+    ndjson_headers = {"content-type": "application/x-ndjson"}
+    today = date.today()
+    return [
+        ("root", "GET", "/", 1, lambda: ("/", {}), None),
+        ("debug.model_info", "GET", "/debug/model-info", 1, lambda: ("/debug/model-info", {}), None),
+        ("debug.payment_schema", "GET", "/debug/payment-schema", 1, lambda: ("/debug/payment-schema", {}), None),
+        ("debug.cache", "GET", "/debug/cache", 1, lambda: ("/debug/cache", {}), None),
+        ("debug.profiler", "GET", "/debug/profiler", 1, lambda: ("/debug/profiler", {}), None),
+        ("debug.profiler_toggle", "POST", "/debug/profiler", 0.01, lambda: ("/debug/profiler?slow_ms=0", {}), None),
+        ("metrics", "GET", "/metrics", 1, lambda: ("/metrics", {}), None),
+        ("healthz", "GET", "/healthz", 1, lambda: ("/healthz", {}), None),
+        ("readyz", "GET", "/readyz", 1, lambda: ("/readyz", {}), None),
+        ("debug.test_payment", "POST", "/debug/test-payment", 1,
+         lambda: ("/debug/test-payment", {"json": {"member_id": ctx.member()["id"], "amount": 10}}), None),
+
+        ("members.create", "POST", "/members/", 1,
+         lambda: ("/members/", {"json": {"name": "Bench", "phone": ctx.next_phone(), "plan": "Monthly"}}),
+         record_ids(ctx.created_members)),
+        ("members.bulk", "POST", "/members/bulk", 0.05,
+         lambda: ("/members/bulk", {"content": bulk_members_body(ctx), "headers": ndjson_headers}),
+         record_bulk(ctx.bulk_members)),
+        ("members.renew", "POST", "/members/renew", 0.05, lambda: renewals_body(ctx), record_renewals(ctx)),
+        ("members.list", "GET", "/members/", 1, lambda: ("/members/?limit=100", {}), record_version(ctx, "/members/")),
+        ("members.list_not_modified", "GET", "/members/", 1, lambda: revalidate(ctx, "/members/"), None),
+        ("members.list_since", "GET", "/members/", 1, lambda: delta_since(ctx, "/members/"), None),
+        ("members.list_cursor", "GET", "/members/", 1,
+         lambda: (f"/members/?limit=100&cursor={ctx.member_cursor}", {}), None),
+        ("members.list_fields", "GET", "/members/", 1, lambda: ("/members/?limit=100&fields=id,name", {}), None),
+        ("members.list_filtered", "GET", "/members/", 1,
+         lambda: (f"/members/?limit=100&plan=Monthly&status=active&start_from={today - timedelta(days=365)}", {}), None),
+        ("members.expiring", "GET", "/members/expiring", 1, lambda: ("/members/expiring?within=7d", {}), None),
+        ("members.search_phone", "GET", "/members/search", 1,
+         lambda: (f"/members/search?q=9{ctx.rng.randrange(10 ** 4):04d}", {}), None),
+        ("members.search_name", "GET", "/members/search", 1,
+         lambda: (f"/members/search?q=membr {ctx.rng.randrange(1000)}", {}), None),
+        ("members.detail", "GET", "/members/{member_id}", 1, lambda: (f"/members/{ctx.member()['id']}", {}), None),
+        ("members.detail_payments", "GET", "/members/{member_id}", 1,
+         lambda: (f"/members/{ctx.member()['id']}?include=payments&limit=10", {}), None),
+        ("members.lookup", "POST", "/members/lookup", 1,
+         lambda: ("/members/lookup", {"json": {"ids": [ctx.member()["id"] for _ in range(20)],
+                                               "include": "payments", "limit": 5}}), None),
+        ("members.update", "PUT", "/members/{member_id}", 1,
+         lambda: (lambda m: (f"/members/{m['id']}", {"json": {"new_plan": m["plan"], "new_end_date": m["end_date"]}}))(ctx.member()),
+         None),
+
+        ("checkins.single", "POST", "/checkins", 1,
+         lambda: ("/checkins", {"json": {"member_id": ctx.active_member()["id"]}}), None),
+        ("checkins.batch", "POST", "/checkins", 0.2,
+         lambda: ("/checkins", {"json": [{"member_id": ctx.active_member()["id"]} for _ in range(100)]}), None),
+        ("checkins.stats", "GET", "/checkins/stats", 1, lambda: ("/checkins/stats?window=1h", {}), None),
+
+        ("payments.create", "POST", "/payments/", 1,
+         lambda: ("/payments/", {"json": {"member_id": ctx.member()["id"], "amount": 500.0, "method": "Card"}}),
+         record_payment(ctx)),
+        ("payments.create_replay", "POST", "/payments/", 1,
+         lambda: ("/payments/", {"json": {"member_id": ctx.members[0]["id"], "amount": 1.0, "method": "Cash"},
+                                 "headers": {"Idempotency-Key": ctx.replay_key}}), None),
+        ("writes.status", "GET", "/writes/{key}", 1,
+         lambda: (f"/writes/{ctx.payment_keys[-1] if ctx.payment_keys else ctx.replay_key}", {}), None),
+        ("payments.bulk", "POST", "/payments/bulk", 0.05,
+         lambda: ("/payments/bulk", {"content": bulk_payments_body(ctx), "headers": ndjson_headers}),
+         record_bulk(ctx.bulk_payments)),
+        ("payments.list", "GET", "/payments/", 1, lambda: ("/payments/?limit=100", {}),
+         record_version(ctx, "/payments/")),
+        ("payments.list_not_modified", "GET", "/payments/", 1, lambda: revalidate(ctx, "/payments/"), None),
+        ("payments.list_since", "GET", "/payments/", 1, lambda: delta_since(ctx, "/payments/"), None),
+        ("payments.list_cursor", "GET", "/payments/", 1,
+         lambda: (f"/payments/?limit=100&cursor={ctx.payment_cursor}", {}), None),
+        ("payments.list_filtered", "GET", "/payments/", 1,
+         lambda: (f"/payments/?limit=100&method=UPI&date_from={today - timedelta(days=90)}&date_to={today}", {}), None),
+        ("payments.list_member", "GET", "/payments/", 1,
+         lambda: (f"/payments/?member_id={ctx.member()['id']}", {}), None),
+        ("payments.by_member", "GET", "/payments/member/{member_id}", 1,
+         lambda: (f"/payments/member/{ctx.member()['id']}", {}), None),
+
+        ("export.members_csv", "GET", "/export/members", 0.01, lambda: ("/export/members?format=csv", {}), None),
+        ("export.members_ndjson", "GET", "/export/members", 0.01,
+         lambda: ("/export/members?format=ndjson&status=active", {}), None),
+        ("export.payments_csv", "GET", "/export/payments", 0.01, lambda: ("/export/payments?format=csv", {}), None),
+        ("export.payments_parquet", "GET", "/export/payments", 0.01,
+         lambda: ("/export/payments?format=parquet", {}), None),
+
+        ("analytics.revenue", "GET", "/analytics/revenue", 1, lambda: ("/analytics/revenue?period=month", {}), None),
+        ("analytics.revenue_methods", "GET", "/analytics/revenue/methods", 1,
+         lambda: ("/analytics/revenue/methods", {}), None),
+        ("analytics.active", "GET", "/analytics/members/active", 1, lambda: ("/analytics/members/active", {}), None),
+        ("analytics.churn", "GET", "/analytics/members/churn", 1, lambda: ("/analytics/members/churn?days=30", {}), None),
+        ("analytics.member_count", "GET", "/analytics/members/count", 1,
+         lambda: ("/analytics/members/count?status=active&plan=" + ctx.rng.choice(tuple(PLANS)), {}), None),
+        ("analytics.payment_totals", "GET", "/analytics/payments/totals", 1,
+         lambda: (f"/analytics/payments/totals?date_from={date.today() - timedelta(days=90)}&method=Cash", {}), None),
+        ("analytics.rebuild", "POST", "/analytics/rebuild", 0.002, lambda: ("/analytics/rebuild", {}), None),
+
+        ("branches.list", "GET", "/branches", 1, lambda: ("/branches", {}), None),
+        ("branches.summary", "GET", "/branches/summary", 0.05,
+         lambda: (f"/branches/summary?date_from={today - timedelta(days=30)}&date_to={today}", {}), None),
+
+        # Deletes run last and only remove what the create scenarios added.
+        ("members.delete", "DELETE", "/members/{member_id}", 1,
+         lambda: (f"/members/{ctx.created_members.pop()}", {}) if ctx.created_members else None, None),
+        ("payments.delete", "DELETE", "/payments/{payment_id}", 1,
+         lambda: (f"/payments/{ctx.created_payments.pop()}", {}) if ctx.created_payments else None, None),
+    ]
+
+def uncovered_routes(app, covered):
+    """Routes declared on the app that no scenario drives."""
+    from fastapi.routing import APIRoute
+    declared = {(method, route.path) for route in app.routes if isinstance(route, APIRoute)
+                for method in route.methods}
+    return sorted(f"{m} {p}" for m, p in declared - covered)
+
+async def events_fanout(main, subscribers=50, events=200):
+    """Publish-to-delivery latency of change events across `subscribers` open /events streams.
+
+    Streams are driven directly: an ASGI test transport buffers whole
+    responses, so an endless SSE body cannot go through it.
+    """
+    feed = main.default_branch.change_feed
+    streams = [feed.stream(["gymrats"], heartbeat=3600) for _ in range(subscribers)]
+    for stream in streams:
+        await stream.__anext__()  # the retry hint; the stream is subscribed from here on
+    sent, latencies = {}, []
+
+    async def reader(stream):
+        for _ in range(events):
+            message = await stream.__anext__()
+            seq = int(message.split(b"\n", 1)[0].rsplit(b"-", 1)[1])
+            latencies.append(time.perf_counter() - sent[seq])
+        await stream.aclose()
+
+    row = {"id": "bench", "name": "Bench", "plan": "Monthly"}
+    readers = [asyncio.create_task(reader(stream)) for stream in streams]
+    started = time.perf_counter()
+    for _ in range(events):
+        sent[feed.stats()["seq"] + 1] = time.perf_counter()
+        feed.publish("gymrats", "update", [row])
+        await asyncio.sleep(0)  # let deliveries interleave with publishing, as with real writes
+    await asyncio.gather(*readers)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "name": "events.fanout", "method": "GET", "route": "/events", "requests": len(latencies), "errors": 0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+    }
+
+# -------------------- Load driver --------------------
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+async def drive(client, name, method, template, build, hook, clients, total):
+    latencies, errors = [], 0
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            request = build()
+            if request is None:
+                return
+            url, kwargs = request
+            start = time.perf_counter()
+            resp = await client.request(method, url, **kwargs)
+            await resp.aread()
+            latencies.append(time.perf_counter() - start)
+            if resp.status_code >= 400:
+                errors += 1
+            elif hook:
+                hook(resp)
+
+    with RSSSampler() as rss:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(min(clients, total))))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    if not latencies:
+        return {"name": name, "method": method, "route": template, "requests": 0}
+    return {
+        "name": name,
+        "method": method,
+        "route": template,
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "rps": round(len(latencies) / elapsed, 1),
+        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+    }
+
+async def wait_ready(main, timeout):
+    deadline = time.perf_counter() + timeout
+    while not (main.startup.warm and all(branch.ready for branch in main.branches.values())):
+        if time.perf_counter() > deadline:
+            raise RuntimeError("App did not finish loading its indexes in time.")
+        await asyncio.sleep(0.05)
+
+async def run(args, ctx):
+    import main
+    from src import db
+    logging.getLogger().setLevel(logging.WARNING)  # per-request INFO lines would dominate timings
+
+    results, covered = [], set()
+    app = main.app
+    started, started_at = time.perf_counter(), datetime.now()
+    async with app.router.lifespan_context(app):
+        await wait_ready(main, args.ready_timeout)
+        startup = time.perf_counter() - started
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            ctx.member_cursor = (await client.get("/members/?limit=100")).json().get("next_cursor") or ""
+            ctx.payment_cursor = (await client.get("/payments/?limit=100")).json().get("next_cursor") or ""
+            for name, method, template, weight, build, hook in scenarios(ctx):
+                covered.add((method, template))
+                if args.routes and not any(name.startswith(prefix) for prefix in args.routes):
+                    continue
+                total = max(1, int(args.requests * weight))
+                result = await drive(client, name, method, template, build, hook, args.clients, total)
+                results.append(result)
+                print(f"{name:28s} {result.get('p50_ms', '-'):>9} {result.get('p95_ms', '-'):>9} "
+                      f"{result.get('p99_ms', '-'):>9} {result.get('rps', '-'):>9} {result.get('errors', '-'):>6}",
+                      file=sys.stderr)
+
+            covered.add(("GET", "/events"))
+            if not args.routes or any("events.fanout".startswith(prefix) for prefix in args.routes):
+                result = await events_fanout(main)
+                results.append(result)
+                print(f"{result['name']:28s} {result['p50_ms']:>9} {result['p95_ms']:>9} "
+                      f"{result['p99_ms']:>9} {result['rps']:>9} {0:>6}", file=sys.stderr)
+
+        # Land every queued write before cleaning up, including ones still in their write-through grace.
+        for _ in range(1000):
+            if not main.write_queue.counts()["pending"]:
+                break
+            await asyncio.to_thread(main.write_flusher.flush_once, time.time() + main.WRITE_THROUGH_GRACE)
+
+    # Remove whatever the write scenarios left behind so the seeded database can be reused.
+    storage = db.get_storage()
+    storage.delete("payments", [("id", "in", ctx.created_payments + ctx.bulk_payments)])
+    storage.delete("payments", [("idempotency_key", "in", [*ctx.payment_keys, ctx.replay_key])])
+    storage.delete("checkins", [("checked_in_at", "gte", started_at.isoformat())])
+    db.delete_members(ctx.created_members + ctx.bulk_members)
+    return results, startup, uncovered_routes(app, covered)
+
+# -------------------- Regressions --------------------
+def compare(results, baseline, threshold, min_delta_ms):
+    """Routes whose p95 grew or whose throughput dropped by more than `threshold`.
+
+    Changes smaller than `min_delta_ms` are ignored, so timer noise on
+    sub-millisecond routes is not reported.
+    """
+    previous = {r["name"]: r for r in baseline.get("routes", [])}
+    regressions = []
+    for result in results:
+        old = previous.get(result["name"])
+        if not old or not result.get("requests") or not old.get("requests"):
+            continue
+        if (result["p95_ms"] > old["p95_ms"] * (1 + threshold)
+                and result["p95_ms"] - old["p95_ms"] > min_delta_ms):
+            regressions.append({"name": result["name"], "metric": "p95_ms",
+                                "baseline": old["p95_ms"], "current": result["p95_ms"]})
+        if (result["rps"] < old["rps"] * (1 - threshold)
+                and result["mean_ms"] - old["mean_ms"] > min_delta_ms):
+            regressions.append({"name": result["name"], "metric": "rps",
+                                "baseline": old["rps"], "current": result["rps"]})
+        if result["errors"] > old.get("errors", 0):
+            regressions.append({"name": result["name"], "metric": "errors",
+                                "baseline": old.get("errors", 0), "current": result["errors"]})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=10000, help="seeded members (1k to 1M)")
+    parser.add_argument("--payments-per-member", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--clients", type=int, default=20, help="concurrent clients per route")
+    parser.add_argument("--requests", type=int, default=500, help="requests per route before weighting")
+    parser.add_argument("--routes", type=lambda s: [r.strip() for r in s.split(",") if r.strip()],
+                        help="only run scenarios whose name starts with one of these prefixes")
+    parser.add_argument("--cache", default="none", choices=("none", "memory", "sqlite"),
+                        help="CACHE_BACKEND for the run; none measures the data layer itself")
+    parser.add_argument("--write-queue", default="sync", choices=("sync", "async"),
+                        help="WRITE_QUEUE_MODE: write through before answering, or answer 202 once queued")
+    parser.add_argument("--ready-timeout", type=float, default=600.0)
+    parser.add_argument("--out", help="result file (default bench/results/api-<members>-<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="ignore latency changes below this")
+    args = parser.parse_args()
+
+    path = seed_path(args.members, args.payments_per_member, args.seed)
+    seed_seconds = seed(path, args.members, args.payments_per_member, args.seed)
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = path
+    os.environ["CACHE_BACKEND"] = args.cache
+    os.environ["EXPIRY_SWEEP_MODE"] = "off"
+    os.environ["WRITE_QUEUE_MODE"] = args.write_queue
+    os.environ["WRITE_QUEUE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-"), "write_queue.sqlite3")
+
+    ctx = Context(sample_members(path, 1000, args.seed), random.Random(args.seed))
+    rss_before = current_rss()
+    results, startup, uncovered = asyncio.run(run(args, ctx))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "members": args.members,
+            "payments": args.members * args.payments_per_member,
+            "clients": args.clients,
+            "requests": args.requests,
+            "cache": args.cache,
+            "write_queue": args.write_queue,
+            "seed_seconds": round(seed_seconds, 2),
+            "startup_seconds": round(startup, 3),
+            "rss_before_start_mb": round(rss_before / 2 ** 20, 1),
+            "process_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        },
+        "routes": results,
+        "uncovered_routes": uncovered,
+        "regressions": [],
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        for key in ("members", "payments", "clients", "cache", "write_queue"):
+            if baseline.get("meta", {}).get(key) != report["meta"][key]:
+                print(f"WARNING: baseline {key} differs ({baseline.get('meta', {}).get(key)} vs "
+                      f"{report['meta'][key]}), results are not comparable", file=sys.stderr)
+        report["regressions"] = compare(results, baseline, args.threshold, args.min_delta_ms)
+
+    out = args.out or os.path.join(RESULTS_DIR, f"api-{args.members}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {out}", file=sys.stderr)
+    for route in uncovered:
+        print(f"WARNING: no scenario for {route}", file=sys.stderr)
+    for r in report["regressions"]:
+        print(f"REGRESSION {r['name']} {r['metric']}: {r['baseline']} -> {r['current']}", file=sys.stderr)
+    sys.exit(1 if report["regressions"] else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Compare sync (threadpool) and async route latency under concurrency.
+
+Starts a stub PostgREST server on localhost that answers every request
+after a fixed delay, points SUPABASE_URL at it and then fires many
+concurrent clients at two otherwise identical member-list routes:
+
+  /sync/members   plain `def` route -> GymratManager.get_members_page
+  /async/members  `async def` route -> GymratManager.get_members_page_async
+
+Usage:
+    python bench/async_latency.py --clients 200 --requests 4000 --delay-ms 20
+"""
+import os
+import sys
+import time
+import json
+import socket
+import asyncio
+import logging
+import argparse
+import statistics
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from starlette.applications import Starlette
+from starlette.responses import Response
+from starlette.routing import Route
+
+ROWS = [
+    {"id": f"00000000-0000-0000-0000-{i:012d}", "name": f"Member {i}", "age": 30,
+     "phone": f"90000{i:05d}", "plan": "Monthly", "start_date": "2024-01-01", "end_date": "2024-02-01"}
+    for i in range(10)
+]
+
+# -------------------- Stub backend --------------------
+def stub_app(delay):
+    body = json.dumps(ROWS).encode()
+
+    async def rest(request):
+        await asyncio.sleep(delay)
+        return Response(body, media_type="application/json")
+
+    return Starlette(routes=[Route("/rest/v1/{path:path}", rest, methods=["GET", "POST", "PATCH", "DELETE"])])
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def serve_stub(delay, port):
+    uvicorn.run(stub_app(delay), host="127.0.0.1", port=port, log_level="warning")
+
+def start_stub(delay):
+    """Run the stub in its own process so it does not compete with the app for the GIL."""
+    port = free_port()
+    process = multiprocessing.Process(target=serve_stub, args=(delay, port), daemon=True)
+    process.start()
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(500):
+        try:
+            httpx.get(f"{url}/rest/v1/ping")
+            break
+        except httpx.TransportError:
+            time.sleep(0.01)
+    return process, url
+
+# -------------------- Load driver --------------------
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+async def drive(app, path, clients, total):
+    latencies = []
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                resp = await client.get(path)
+                latencies.append(time.perf_counter() - start)
+                resp.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(clients)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "route": path,
+        "requests": total,
+        "clients": clients,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 2),
+        "rps": round(total / elapsed, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--delay-ms", type=float, default=20.0, help="stub backend latency per query")
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub(args.delay_ms / 1000)
+    os.environ["SUPABASE_URL"] = stub_url
+    os.environ["SUPABASE_KEY"] = "bench-key"
+    os.environ["STORAGE_BACKEND"] = "supabase"
+    os.environ["CACHE_BACKEND"] = "none"  # measure the backend round trip, not cache hits
+
+    from src.logic import GymratManager
+    from src.async_db import close_client
+    logging.getLogger("httpx").setLevel(logging.WARNING)  # per-request INFO lines would dominate timings
+
+    mgr = GymratManager()
+    app = FastAPI()
+
+    @app.get("/sync/members")
+    def sync_members():
+        return mgr.get_members_page(limit=10)
+
+    @app.get("/async/members")
+    async def async_members():
+        return await mgr.get_members_page_async(limit=10)
+
+    async def run():
+        results = []
+        for path in ("/sync/members", "/async/members"):
+            await drive(app, path, min(args.clients, 20), 100)  # warm up connections
+            results.append(await drive(app, path, args.clients, args.requests))
+        await close_client()
+        return results
+
+    results = asyncio.run(run())
+    stub.terminate()
+    print(json.dumps({"stub_delay_ms": args.delay_ms, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
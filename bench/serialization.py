@@ -0,0 +1,93 @@
+"""Encode time and payload size of large member and payment lists.
+
+Builds synthetic member and payment pages and encodes each envelope the
+way the list routes can answer:
+
+  fastapi   jsonable_encoder + json.dumps (a route returning the dict)
+  json      orjson, returned as bytes (list_response)
+  columnar  orjson with one array per column
+  msgpack   MessagePack, when the msgpack package is installed
+
+Reports the median encode time over --repeat runs and the body size, raw
+and gzipped.
+
+Usage:
+    python bench/serialization.py --rows 10000 100000 --repeat 5
+"""
+import os
+import sys
+import gzip
+import json
+import time
+import uuid
+import random
+import argparse
+import statistics
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from src import encoding
+
+PLANS = ("Monthly", "Quarterly", "Yearly")
+METHODS = ("Cash", "Card", "UPI")
+
+def members(n, rng):
+    today = date.today()
+    rows = []
+    for i in range(n):
+        start = today - timedelta(days=rng.randrange(730))
+        rows.append({"id": str(uuid.UUID(int=rng.getrandbits(128), version=4)), "name": f"Member {i}",
+                     "age": rng.randrange(16, 70), "phone": f"9{i:09d}", "plan": rng.choice(PLANS),
+                     "start_date": start.isoformat(), "end_date": (start + timedelta(days=30)).isoformat()})
+    return rows
+
+def payments(n, rng):
+    now = datetime.now()
+    return [{"id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+             "gymrat_id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+             "amount": float(rng.choice((1000, 2700, 9600))),
+             "payment_date": (now - timedelta(minutes=rng.randrange(10 ** 6))).isoformat(),
+             "method": rng.choice(METHODS)} for _ in range(n)]
+
+def fastapi_encode(content):
+    return JSONResponse(jsonable_encoder(content)).body
+
+def encoders():
+    found = {"fastapi": fastapi_encode}
+    for fmt in encoding.available_formats():
+        found[fmt] = lambda content, fmt=fmt: encoding.encode(content, fmt)
+    return found
+
+def measure(encode, content, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = encode(content)
+        times.append(time.perf_counter() - start)
+    return {"encode_ms": round(statistics.median(times) * 1000, 2), "bytes": len(body),
+            "gzip_bytes": len(gzip.compress(body, 6))}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    results = []
+    for n in args.rows:
+        for table, build in (("members", members), ("payments", payments)):
+            content = {"success": True, "data": build(n, rng), "next_cursor": None, "message": f"{n} rows"}
+            for fmt, encode in encoders().items():
+                entry = {"table": table, "rows": n, "format": fmt, **measure(encode, content, args.repeat)}
+                results.append(entry)
+                print(f"{table:9} {n:>7} {fmt:9} {entry['encode_ms']:>9} ms {entry['bytes']:>11} B "
+                      f"{entry['gzip_bytes']:>10} B gz", file=sys.stderr)
+    print(json.dumps({"formats": list(encoders()), "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Memory per row and aggregate latency: list of dicts vs the columnar snapshot.
+
+Builds --payments payment rows and --members member rows the way src/db.py
+returns them (decoded JSON, one dict per row), then loads the same rows
+into src/snapshot.py's PaymentSnapshot and MemberSnapshot and compares:
+
+  memory      bytes per row held, measured with tracemalloc
+  load        seconds to build the snapshot from the row dicts
+  aggregates  median time of each query over --repeat runs, as a Python
+              loop over the dicts and as the snapshot's vectorized query
+
+Usage:
+    python bench/snapshot.py --payments 1000000 --members 100000 --repeat 5
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import statistics
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+import orjson
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.snapshot import PaymentSnapshot, MemberSnapshot
+
+PLANS = ("Monthly", "Quarterly", "Yearly")
+METHODS = ("Cash", "Card", "UPI")
+
+def build_rows(members, payments, rng):
+    """JSON bodies of both tables; decoding them gives each row its own strings, like resp.data."""
+    today = date.today()
+    member_rows, ids = [], []
+    for i in range(members):
+        start = today - timedelta(days=rng.randrange(730))
+        member_id = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+        ids.append(member_id)
+        member_rows.append({"id": member_id, "name": f"Member {i}", "age": rng.randrange(16, 70),
+                            "phone": f"9{i:09d}", "plan": rng.choice(PLANS), "start_date": start.isoformat(),
+                            "end_date": (start + timedelta(days=rng.choice((30, 90, 365)))).isoformat(),
+                            "expired": False})
+    now = datetime.now()
+    payment_rows = [{"id": i + 1, "gymrat_id": rng.choice(ids), "amount": float(rng.choice((1000, 2700, 9600))),
+                     "payment_date": (now - timedelta(seconds=rng.randrange(730 * 86400))).isoformat(),
+                     "method": rng.choice(METHODS), "idempotency_key": None} for i in range(payments)]
+    return orjson.dumps(member_rows), orjson.dumps(payment_rows), ids
+
+def traced(build):
+    """(result, bytes allocated by `build` and still held)."""
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        return result, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+def median_ms(query, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = query()
+        times.append(time.perf_counter() - start)
+    return round(statistics.median(times) * 1000, 3), result
+
+def payment_queries(ids, rng):
+    """(name, dict loop, snapshot query), the same question asked both ways."""
+    date_from, date_to = date.today() - timedelta(days=90), date.today() - timedelta(days=60)
+    lo, hi = date_from.isoformat(), (date_to + timedelta(days=1)).isoformat()
+    member_id = rng.choice(ids)
+
+    def loop(rows, match):
+        count, total = 0, 0.0
+        for row in rows:
+            if match(row):
+                count += 1
+                total += row["amount"]
+        return {"count": count, "sum": round(total, 2)}
+
+    return [
+        ("payments.total", lambda rows: loop(rows, lambda r: True), lambda s: s.totals()),
+        ("payments.range_30d", lambda rows: loop(rows, lambda r: lo <= r["payment_date"] < hi),
+         lambda s: s.totals(date_from=date_from, date_to=date_to)),
+        ("payments.range_method", lambda rows: loop(rows, lambda r: lo <= r["payment_date"] < hi
+                                                    and r["method"] == "Card"),
+         lambda s: s.totals("Card", date_from=date_from, date_to=date_to)),
+        ("payments.member", lambda rows: loop(rows, lambda r: r["gymrat_id"] == member_id),
+         lambda s: s.totals(member_id=member_id)),
+    ]
+
+def member_queries():
+    today = date.today().isoformat()
+    return [
+        ("members.active", lambda rows: sum(1 for r in rows if r["end_date"] and r["end_date"] >= today),
+         lambda s: s.count(status="active")),
+        ("members.active_plan", lambda rows: sum(1 for r in rows if r["plan"] == "Monthly"
+                                                 and r["end_date"] and r["end_date"] >= today),
+         lambda s: s.count("Monthly", "active")),
+    ]
+
+def compare(table, body, snapshot_cls, load, queries, repeat):
+    rows, dict_bytes = traced(lambda: orjson.loads(body))
+    start = time.perf_counter()
+    snapshot, snapshot_bytes = traced(lambda: load(snapshot_cls(), rows))
+    load_s = time.perf_counter() - start
+    n = len(rows)
+    memory = {"table": table, "rows": n, "dict_bytes_per_row": round(dict_bytes / n, 1),
+              "snapshot_bytes_per_row": round(snapshot_bytes / n, 1), "snapshot_load_s": round(load_s, 2)}
+    print(f"{table:9} {n:>8} rows  dicts {memory['dict_bytes_per_row']:>7} B/row  "
+          f"snapshot {memory['snapshot_bytes_per_row']:>6} B/row  load {memory['snapshot_load_s']} s", file=sys.stderr)
+    results = []
+    for name, loop, vectorized in queries:
+        dict_ms, expected = median_ms(lambda: loop(rows), repeat)
+        snapshot_ms, got = median_ms(lambda: vectorized(snapshot), repeat)
+        if expected != got:
+            raise AssertionError(f"{name}: dicts gave {expected}, snapshot {got}")
+        results.append({"query": name, "dicts_ms": dict_ms, "snapshot_ms": snapshot_ms,
+                        "speedup": round(dict_ms / snapshot_ms, 1) if snapshot_ms else None})
+        print(f"  {name:22} dicts {dict_ms:>9} ms  snapshot {snapshot_ms:>7} ms", file=sys.stderr)
+    return memory, results
+
+def load_payments(snapshot, rows, page=1000):
+    snapshot.backfill(rows[i:i + page] for i in range(0, len(rows), page))
+    return snapshot
+
+def load_members(snapshot, rows):
+    snapshot.backfill(rows)
+    return snapshot
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payments", type=int, default=1_000_000)
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    member_body, payment_body, ids = build_rows(args.members, args.payments, rng)
+    memory, results = [], []
+    for table, body, cls, load, queries in (
+            ("payments", payment_body, PaymentSnapshot, load_payments, payment_queries(ids, rng)),
+            ("members", member_body, MemberSnapshot, load_members, member_queries())):
+        table_memory, table_results = compare(table, body, cls, load, queries, args.repeat)
+        memory.append(table_memory)
+        results.extend(table_results)
+    print(json.dumps({"memory": memory, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
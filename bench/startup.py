@@ -0,0 +1,87 @@
+"""Cold start time of the API, from process spawn to the first served request.
+
+Starts `uvicorn API.main:app` as a fresh process --runs times against a
+seeded SQLite database (the one bench/api_suite.py uses) and reports the
+median of:
+
+  import         API/main.py import time, as the app reports it on /readyz
+  healthz        spawn until GET /healthz answers (the process accepts traffic)
+  ready          spawn until GET /readyz answers 200 (connections warm, indexes loaded)
+  first_request  spawn until the first GET /members/ sent after /readyz has returned
+
+Usage:
+    python bench/startup.py --members 10000 --runs 5
+"""
+import os
+import sys
+import json
+import time
+import socket
+import tempfile
+import argparse
+import statistics
+import subprocess
+
+import httpx
+
+from api_suite import ROOT, seed, seed_path
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for(client, url, timeout, status=200):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            resp = client.get(url)
+            if resp.status_code == status:
+                return resp
+        except httpx.TransportError:
+            pass
+        time.sleep(0.005)
+    raise RuntimeError(f"{url} did not answer {status} within {timeout}s.")
+
+def one_run(env, timeout):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "API.main:app", "--port", str(port),
+                             "--log-level", "warning"], cwd=ROOT, env=env)
+    try:
+        with httpx.Client(timeout=5) as client:
+            wait_for(client, f"{base}/healthz", timeout)
+            healthz = time.perf_counter() - started
+            startup = wait_for(client, f"{base}/readyz", timeout).json()["startup"]
+            ready = time.perf_counter() - started
+            client.get(f"{base}/members/").raise_for_status()
+            first_request = time.perf_counter() - started
+    finally:
+        proc.terminate()
+        proc.wait()
+    return {"import": startup["imported"], "healthz": healthz, "ready": ready, "first_request": first_request}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=10000)
+    parser.add_argument("--payments-per-member", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    path = seed_path(args.members, args.payments_per_member, args.seed)
+    seed(path, args.members, args.payments_per_member, args.seed)
+    env = {**os.environ, "STORAGE_BACKEND": "sqlite", "SQLITE_PATH": path, "EXPIRY_SWEEP_MODE": "off",
+           "WRITE_QUEUE_PATH": os.path.join(tempfile.mkdtemp(prefix="bench-"), "write_queue.sqlite3")}
+
+    runs = []
+    for i in range(args.runs):
+        runs.append(one_run(env, args.timeout))
+        print(f"run {i + 1}: " + "  ".join(f"{k} {v * 1000:.0f} ms" for k, v in runs[-1].items()), file=sys.stderr)
+    median = {key: round(statistics.median(r[key] for r in runs) * 1000, 1) for key in runs[0]}
+    print(json.dumps({"members": args.members, "runs": args.runs, "median_ms": median}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,35 @@
 import streamlit as st
+import pandas as pd
 import requests
 import json
+import time
+import uuid
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 API_URL = "http://127.0.0.1:8001"  # FastAPI backend
+BRANCH = None         # branch this terminal works for (GET /branches); None is the API's default branch
+PAGE_SIZE = 50        # rows per "Load more" click
+LOOKUP_PAGE_SIZE = 1000  # rows per request when filling dropdowns
+REQUEST_TIMEOUT = (3.05, 30)  # connect, read (seconds)
+LIST_TTL = 30         # seconds a fetched page or search result is reused
+VALIDATED_PAGES = 200 # list pages kept with their ETag for conditional refreshes
+ANALYTICS_TTL = 60
+LIVE_INTERVAL = 2     # seconds between live list refreshes
+FEED_BACKLOG = 1000   # change events kept for sessions that have not caught up yet
+LISTS = {"members_list": "/members/", "payments_list": "/payments/"}
+LIST_TABLES = {"gymrats": "members_list", "payments": "payments_list"}
 
 st.set_page_config(page_title="Gym Membership System", layout="centered")
 
 st.title("🏋️ Gym Membership System")
 
 # ------------------ Sidebar Navigation ------------------
-menu = st.sidebar.radio("Navigation", ["Members", "Payments"])
+menu = st.sidebar.radio("Navigation", ["Members", "Payments", "Analytics"])
+st.sidebar.toggle("Live updates", value=True, key="live", help="Apply changes from other terminals as they happen")
 
 # ------------------ Helper Functions ------------------
 def safe_id_display(id_value, length=8):
@@ -22,6 +42,227 @@ def safe_get(dictionary, key, default="N/A"):
     """Safely get value from dictionary"""
     return dictionary.get(key, default)
 
+# ------------------ API Client ------------------
+class NotReady(Exception):
+    """The API answered 503 while it builds its in-memory indexes"""
+
+@st.cache_resource
+def get_session():
+    """One keep-alive connection pool shared by every rerun and browser tab"""
+    session = requests.Session()
+    # Only failed connects are retried: the request never reached the API.
+    retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2)
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=16, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if BRANCH:
+        session.params = {"branch": BRANCH}  # sent with every request
+    return session
+
+@st.cache_resource
+def get_executor():
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="api")
+
+def api_get(path, **params):
+    return get_session().get(f"{API_URL}{path}", params=params, timeout=REQUEST_TIMEOUT)
+
+def api_post(path, payload, headers=None):
+    return get_session().post(f"{API_URL}{path}", json=payload, headers=headers, timeout=REQUEST_TIMEOUT)
+
+def fetch_many(calls):
+    """Run independent GETs ({name: (path, params)}) concurrently, returns {name: response}"""
+    session = get_session()  # resolved here, st.cache_resource needs the script thread
+    futures = {
+        name: get_executor().submit(session.get, f"{API_URL}{path}", params=params, timeout=REQUEST_TIMEOUT)
+        for name, (path, params) in calls.items()
+    }
+    return {name: future.result() for name, future in futures.items()}
+
+@st.cache_resource
+def get_validated():
+    """Last body and ETag of every list page, shared by all sessions: {(path, params): (etag, body)}"""
+    return {}
+
+@st.cache_data(ttl=LIST_TTL, show_spinner=False)
+def fetch_page(path, cursor=None, **params):
+    """Fetch one page from a paginated list endpoint, returns (rows, next_cursor)
+
+    A page fetched before is revalidated: the API answers 304 without a
+    body (or a query) while the table has not changed.
+    """
+    if cursor:
+        params["cursor"] = cursor
+    key = (path, tuple(sorted(params.items())))
+    validated = get_validated()
+    etag, body = validated.get(key, (None, None))
+    res = get_session().get(f"{API_URL}{path}", params=params, timeout=REQUEST_TIMEOUT,
+                            headers={"If-None-Match": etag} if etag else None)
+    if res.status_code != 304:
+        res.raise_for_status()
+        body = res.json()
+        if res.headers.get("ETag"):
+            validated.pop(key, None)
+            validated[key] = (res.headers["ETag"], body)
+            if len(validated) > VALIDATED_PAGES:
+                validated.pop(next(iter(validated)), None)
+    return body.get("data", []), body.get("next_cursor")
+
+def fetch_all(path, **params):
+    """Walk every page of a paginated list endpoint"""
+    rows, cursor = fetch_page(path, limit=LOOKUP_PAGE_SIZE, **params)
+    while cursor:
+        page, cursor = fetch_page(path, cursor, limit=LOOKUP_PAGE_SIZE, **params)
+        rows.extend(page)
+    return rows
+
+@st.cache_data(ttl=LIST_TTL, show_spinner=False)
+def search_members(query):
+    res = api_get("/members/search", q=query)
+    if res.status_code != 200:
+        raise NotReady(res.json().get("detail", "Search is unavailable right now."))
+    return res.json().get("data", [])
+
+@st.cache_data(ttl=ANALYTICS_TTL, show_spinner=False)
+def load_analytics(period):
+    """Revenue series plus method and plan breakdowns, fetched in parallel"""
+    responses = fetch_many({
+        "revenue": ("/analytics/revenue", {"period": period}),
+        "methods": ("/analytics/revenue/methods", {}),
+        "active": ("/analytics/members/active", {}),
+    })
+    if any(res.status_code == 503 for res in responses.values()):
+        raise NotReady()
+    for res in responses.values():
+        res.raise_for_status()
+    return {name: res.json() for name, res in responses.items()}
+
+@st.cache_data(ttl=ANALYTICS_TTL, show_spinner=False)
+def load_churn(days):
+    res = api_get("/analytics/members/churn", days=days)
+    res.raise_for_status()
+    return res.json().get("data", {})
+
+def invalidate_cache():
+    """Forget cached lists and analytics after one of our own writes"""
+    fetch_page.clear()
+    search_members.clear()
+    load_analytics.clear()
+    load_churn.clear()
+
+def load_into_state(key, path, reset=False, **params):
+    """Append the next page of `path` to st.session_state[key]"""
+    if reset or key not in st.session_state:
+        st.session_state[key] = {"rows": [], "cursor": None, "done": False}
+    state = st.session_state[key]
+    if state["done"]:
+        return
+    rows, cursor = fetch_page(path, state["cursor"], limit=PAGE_SIZE, **params)
+    state["rows"].extend(rows)
+    state["cursor"] = cursor
+    state["done"] = cursor is None
+
+# ------------------ Live Updates ------------------
+class ChangeFollower:
+    """Reads GET /events in a background thread on behalf of every browser session.
+
+    Events are numbered locally and each session remembers the last one it
+    applied. A server reset, or falling out of the kept backlog, makes a
+    session reload its lists instead.
+    """
+
+    def __init__(self):
+        self.deltas = deque(maxlen=FEED_BACKLOG)  # (number, delta)
+        self.count = 0
+        self.reset_at = 0
+        self.connected = False
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name="change-feed", daemon=True).start()
+
+    def since(self, seen):
+        """Returns (deltas after `seen` or None when a reload is needed, latest number)"""
+        with self._lock:
+            if seen < self.reset_at or (self.deltas and self.deltas[0][0] > seen + 1):
+                return None, self.count
+            return [d for n, d in self.deltas if n > seen], self.count
+
+    def _push(self, delta=None):
+        with self._lock:
+            self.count += 1
+            if delta is None:
+                self.reset_at = self.count
+            else:
+                self.deltas.append((self.count, delta))
+
+    def _run(self):
+        session = requests.Session()  # a long-lived stream of its own, outside the shared pool
+        if BRANCH:
+            session.params = {"branch": BRANCH}
+        last_id = None
+        while True:
+            try:
+                headers = {"Last-Event-ID": last_id} if last_id else {}
+                with session.get(f"{API_URL}/events", headers=headers, stream=True, timeout=(3.05, 60)) as res:
+                    res.raise_for_status()
+                    self.connected = True
+                    event, data = None, []
+                    for line in res.iter_lines(decode_unicode=True):
+                        if line.startswith("id:"):
+                            last_id = line[3:].strip()
+                        elif line.startswith("event:"):
+                            event = line[6:].strip()
+                        elif line.startswith("data:"):
+                            data.append(line[5:].strip())
+                        elif not line:
+                            if event == "change":
+                                self._push(json.loads("\n".join(data)))
+                            elif event == "reset":
+                                self._push()
+                            event, data = None, []
+            except (requests.exceptions.RequestException, ValueError):
+                pass
+            self.connected = False
+            time.sleep(2)
+
+@st.cache_resource
+def get_follower():
+    return ChangeFollower()
+
+def live_interval():
+    return LIVE_INTERVAL if st.session_state.get("live", True) else None
+
+def apply_delta(delta):
+    """Apply one insert/update/delete event to the loaded list it belongs to"""
+    state = st.session_state.get(LIST_TABLES.get(delta["table"]))
+    if state is None:
+        return
+    changed = {str(row.get("id")): row for row in delta["rows"]}
+    if delta["op"] == "update":
+        state["rows"] = [{**row, **changed[str(row.get("id"))]} if str(row.get("id")) in changed else row
+                         for row in state["rows"]]
+        return
+    rows = [row for row in state["rows"] if str(row.get("id")) not in changed]
+    state["rows"] = list(changed.values()) + rows if delta["op"] == "insert" else rows
+
+def apply_changes():
+    """Bring this session's lists up to date with writes made anywhere"""
+    follower = get_follower()
+    seen = st.session_state.setdefault("feed_seen", follower.count)
+    deltas, latest = follower.since(seen)
+    if deltas is None:
+        fetch_page.clear()
+        try:
+            for key, path in LISTS.items():
+                if key in st.session_state:
+                    load_into_state(key, path, reset=True)
+        except requests.exceptions.RequestException:
+            return  # retried on the next run
+    else:
+        for delta in deltas:
+            apply_delta(delta)
+        if deltas:
+            invalidate_cache()
+    st.session_state["feed_seen"] = latest
+
 # ------------------ Members Section ------------------
 if menu == "Members":
     st.header("👤 Manage Members")
@@ -42,10 +283,14 @@ if menu == "Members":
                 "end_date": str(end_date),
             }
             try:
-                res = requests.post(f"{API_URL}/members/", json=payload)
+                res = api_post("/members/", payload)
+                if res.status_code in (200, 202):
+                    invalidate_cache()
                 if res.status_code == 200:
                     st.success("✅ Member added successfully!")
                     st.rerun()  # Refresh the page
+                elif res.status_code == 202:
+                    st.info("⏳ Member accepted, it will be saved as soon as the database responds.")
                 else:
                     error_detail = res.json().get('detail', 'Unknown error')
                     st.error(f"❌ Error: {error_detail}")
@@ -54,29 +299,85 @@ if menu == "Members":
         elif submit:
             st.warning("⚠️ Please fill in all required fields")
 
-    st.subheader("📋 Current Members")
-    if st.button("Refresh Members"):
-        try:
-            res = requests.get(f"{API_URL}/members/")
-            if res.status_code == 200:
-                members = res.json().get("data", [])
-                if members:
-                    for m in members:
-                        # Handle both string and integer IDs
-                        member_id_display = safe_id_display(m.get('id', 'Unknown'))
-                        with st.expander(f"👤 {safe_get(m, 'name')} - {safe_get(m, 'plan')}"):
-                            st.write(f"**ID:** `{m.get('id', 'N/A')}`")
-                            st.write(f"**Phone:** {safe_get(m, 'phone')}")
-                            st.write(f"**Plan:** {safe_get(m, 'plan')}")
-                            st.write(f"**Start Date:** {safe_get(m, 'start_date')}")
-                            st.write(f"**End Date:** {safe_get(m, 'end_date')}")
+    with st.form("renew_members_form"):
+        st.subheader("Renew Memberships")
+        ids = st.text_area("Member IDs (one per line)")
+        new_plan = st.selectbox("Plan", ["Keep current plan", "Monthly", "Quarterly", "Yearly"])
+        method = st.selectbox("Payment Method", ["Cash", "UPI", "Card"])
+        renew = st.form_submit_button("Renew")
+
+        member_ids = [i.strip() for i in ids.splitlines() if i.strip()]
+        if renew and member_ids:
+            plan_choice = None if new_plan == "Keep current plan" else new_plan
+            payload = {"renewals": [{"member_id": i, "plan": plan_choice} for i in member_ids], "method": method}
+            # One key per submitted form: a double click or a retry after a timeout is answered, not renewed again
+            if st.session_state.get("renew_payload") != payload:
+                st.session_state["renew_payload"] = payload
+                st.session_state["renew_key"] = str(uuid.uuid4())
+            try:
+                res = api_post("/members/renew", payload, headers={"Idempotency-Key": st.session_state["renew_key"]})
+                if res.status_code == 200:
+                    result = res.json()
+                    invalidate_cache()
+                    st.success(f"✅ {result['message']}")
+                    if res.headers.get("Idempotent-Replayed"):
+                        st.info("ℹ️ This form was already submitted; showing the earlier result.")
+                    for r in result["results"]:
+                        if not r["success"]:
+                            st.warning(f"`{r['member_id']}`: {r.get('message')}")
                 else:
-                    st.info("No members found.")
-            else:
-                st.error("Error fetching members.")
+                    st.error(f"❌ Error: {res.json().get('detail', 'Unknown error')}")
+            except requests.exceptions.RequestException as e:
+                st.error(f"❌ Connection error: {e}")
+        elif renew:
+            st.warning("⚠️ Please enter at least one member ID")
+
+    st.subheader("🔎 Find Member")
+    query = st.text_input("Search by phone or name")
+    if len(query.strip()) >= 2:
+        try:
+            found = search_members(query.strip())
+            if not found:
+                st.info("No matching members.")
+            for m in found:
+                st.write(f"👤 **{safe_get(m, 'name')}** · {safe_get(m, 'phone')} · "
+                         f"{safe_get(m, 'plan')} · ends {safe_get(m, 'end_date')} · `{m.get('id')}`")
+        except NotReady as e:
+            st.warning(str(e))
         except requests.exceptions.RequestException as e:
             st.error(f"❌ Connection error: {e}")
 
+    @st.fragment(run_every=live_interval())
+    def members_section():
+        apply_changes()
+        st.subheader("📋 Current Members")
+        try:
+            if st.button("Refresh Members"):
+                fetch_page.clear()
+                load_into_state("members_list", "/members/", reset=True)
+            elif st.session_state.get("load_more_members"):
+                load_into_state("members_list", "/members/")
+        except requests.exceptions.RequestException as e:
+            st.error(f"❌ Connection error: {e}")
+
+        if "members_list" in st.session_state:
+            members = st.session_state["members_list"]["rows"]
+            if members:
+                for m in members:
+                    # Handle both string and integer IDs
+                    member_id_display = safe_id_display(m.get('id', 'Unknown'))
+                    with st.expander(f"👤 {safe_get(m, 'name')} - {safe_get(m, 'plan')}"):
+                        st.write(f"**ID:** `{m.get('id', 'N/A')}`")
+                        st.write(f"**Phone:** {safe_get(m, 'phone')}")
+                        st.write(f"**Plan:** {safe_get(m, 'plan')}")
+                        st.write(f"**Start Date:** {safe_get(m, 'start_date')}")
+                        st.write(f"**End Date:** {safe_get(m, 'end_date')}")
+                if not st.session_state["members_list"]["done"]:
+                    st.button("Load more members", key="load_more_members")
+            else:
+                st.info("No members found.")
+    members_section()
+
 # ------------------ Payments Section ------------------
 elif menu == "Payments":
     st.header("💰 Manage Payments")
@@ -86,27 +387,22 @@ elif menu == "Payments":
         
         # Fetch members for dropdown
         try:
-            members_res = requests.get(f"{API_URL}/members/")
-            if members_res.status_code == 200:
-                members = members_res.json().get("data", [])
-                if members:
-                    # Create member options with safe ID handling
-                    member_options = {}
-                    for m in members:
-                        member_id = m.get('id', 'Unknown')
-                        member_name = m.get('name', 'Unknown')
-                        display_id = safe_id_display(member_id, 8)
-                        member_options[f"{member_name} ({display_id})"] = str(member_id)
-                    
-                    selected_member = st.selectbox("Select Member", list(member_options.keys()))
-                    member_id = member_options[selected_member]
-                    st.info(f"Selected Member ID: `{member_id}`")
-                else:
-                    st.warning("⚠️ No members found. Please add a member first.")
-                    member_id = st.text_input("Member ID (Manual Entry)")
+            members = fetch_all("/members/", fields="id,name")
+            if members:
+                # Create member options with safe ID handling
+                member_options = {}
+                for m in members:
+                    member_id = m.get('id', 'Unknown')
+                    member_name = m.get('name', 'Unknown')
+                    display_id = safe_id_display(member_id, 8)
+                    member_options[f"{member_name} ({display_id})"] = str(member_id)
+                
+                selected_member = st.selectbox("Select Member", list(member_options.keys()))
+                member_id = member_options[selected_member]
+                st.info(f"Selected Member ID: `{member_id}`")
             else:
-                st.warning("⚠️ Could not fetch members. Manual entry required.")
-                member_id = st.text_input("Member ID")
+                st.warning("⚠️ No members found. Please add a member first.")
+                member_id = st.text_input("Member ID (Manual Entry)")
         except:
             st.warning("⚠️ Could not fetch members. Manual entry required.")
             member_id = st.text_input("Member ID")
@@ -127,11 +423,15 @@ elif menu == "Payments":
                 st.json(payload)
             
             try:
-                res = requests.post(f"{API_URL}/payments/", json=payload)
-                
+                res = api_post("/payments/", payload)
+                if res.status_code in (200, 202):
+                    invalidate_cache()
+
                 if res.status_code == 200:
                     st.success("✅ Payment recorded successfully!")
                     st.rerun()  # Refresh the page
+                elif res.status_code == 202:
+                    st.info("⏳ Payment accepted, it will be saved as soon as the database responds.")
                 else:
                     error_detail = res.json().get('detail', 'Unknown error')
                     st.error(f"❌ Error: {error_detail}")
@@ -146,68 +446,123 @@ elif menu == "Payments":
         elif submit:
             st.warning("⚠️ Please fill in all required fields and ensure amount > 0")
 
-    st.subheader("📋 Payment Records")
-    if st.button("Refresh Payments"):
+    @st.fragment(run_every=live_interval())
+    def payments_section():
+        apply_changes()
+        st.subheader("📋 Payment Records")
         try:
-            res = requests.get(f"{API_URL}/payments/")
-            if res.status_code == 200:
-                payments = res.json().get("data", [])
-                if payments:
-                    for p in payments:
-                        # Safely handle payment ID (could be int or string)
-                        payment_id = p.get('id', 'Unknown')
-                        payment_id_display = safe_id_display(payment_id, 8)
-                        amount = p.get('amount', 0)
-                        
-                        with st.expander(f"💳 Payment #{payment_id_display} - ₹{amount}"):
-                            st.write(f"**Payment ID:** `{payment_id}`")
-                            # Handle both 'gymrat_id' and 'member_id' fields
-                            member_id = p.get('gymrat_id') or p.get('member_id', 'N/A')
-                            member_id_display = safe_id_display(member_id, 8) if member_id != 'N/A' else 'N/A'
-                            st.write(f"**Member ID:** `{member_id}` ({member_id_display})")
-                            st.write(f"**Amount:** ₹{amount}")
-                            st.write(f"**Method:** {safe_get(p, 'method')}")
-                            st.write(f"**Date:** {safe_get(p, 'payment_date')}")
-                else:
-                    st.info("No payments found.")
-            else:
-                st.error("Error fetching payments.")
+            if st.button("Refresh Payments"):
+                fetch_page.clear()
+                load_into_state("payments_list", "/payments/", reset=True)
+            elif st.session_state.get("load_more_payments"):
+                load_into_state("payments_list", "/payments/")
         except requests.exceptions.RequestException as e:
             st.error(f"❌ Connection error: {e}")
         except Exception as e:
             st.error(f"❌ Unexpected error: {e}")
 
+        if "payments_list" in st.session_state:
+            payments = st.session_state["payments_list"]["rows"]
+            if payments:
+                for p in payments:
+                    # Safely handle payment ID (could be int or string)
+                    payment_id = p.get('id', 'Unknown')
+                    payment_id_display = safe_id_display(payment_id, 8)
+                    amount = p.get('amount', 0)
+
+                    with st.expander(f"💳 Payment #{payment_id_display} - ₹{amount}"):
+                        st.write(f"**Payment ID:** `{payment_id}`")
+                        # Handle both 'gymrat_id' and 'member_id' fields
+                        member_id = p.get('gymrat_id') or p.get('member_id', 'N/A')
+                        member_id_display = safe_id_display(member_id, 8) if member_id != 'N/A' else 'N/A'
+                        st.write(f"**Member ID:** `{member_id}` ({member_id_display})")
+                        st.write(f"**Amount:** ₹{amount}")
+                        st.write(f"**Method:** {safe_get(p, 'method')}")
+                        st.write(f"**Date:** {safe_get(p, 'payment_date')}")
+                if not st.session_state["payments_list"]["done"]:
+                    st.button("Load more payments", key="load_more_payments")
+            else:
+                st.info("No payments found.")
+    payments_section()
+
+# ------------------ Analytics Section ------------------
+elif menu == "Analytics":
+    st.header("📊 Analytics")
+
+    try:
+        period = st.selectbox("Revenue by", ["day", "week", "month"], index=2)
+        analytics = load_analytics(period)
+        body = analytics["revenue"]
+        summary = body.get("summary", {})
+        col1, col2 = st.columns(2)
+        col1.metric("Total Revenue", f"₹{summary.get('revenue', 0):,.2f}")
+        col2.metric("Payments", summary.get("payments", 0))
+
+        series = body.get("data", [])
+        if series:
+            st.subheader(f"💰 Revenue per {period}")
+            st.bar_chart(pd.DataFrame(series).set_index("period")["revenue"])
+        else:
+            st.info("No payments recorded yet.")
+
+        methods = analytics["methods"].get("data", [])
+        if methods:
+            st.subheader("💳 Revenue by Method")
+            st.bar_chart(pd.DataFrame(methods).set_index("method")["revenue"])
+
+        active = analytics["active"].get("data", {})
+        if active:
+            st.subheader("👥 Active Members per Plan")
+            st.bar_chart(pd.Series(active, name="members"))
+
+        days = st.slider("Churn window (days)", 7, 365, 30)
+        churn = load_churn(days)
+        if churn:
+            st.subheader("📉 Churn")
+            rate = churn.get("churn_rate")
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Churn Rate", f"{rate:.1%}" if rate is not None else "N/A")
+            col2.metric("Ended", churn.get("ended", 0))
+            col3.metric("Active at Start", churn.get("active_at_start", 0))
+    except NotReady:
+        st.info("⏳ Analytics are still loading on the server, try again in a moment.")
+    except requests.exceptions.HTTPError:
+        st.error("Error fetching analytics.")
+    except requests.exceptions.RequestException as e:
+        st.error(f"❌ Connection error: {e}")
+
 # ------------------ Debug Section ------------------
 st.sidebar.markdown("---")
 if st.sidebar.button("🔍 Debug API"):
     st.subheader("🔍 API Debug Info")
     
     try:
-        # Test API connection
-        res = requests.get(f"{API_URL}/")
+        # The three checks are independent, so they go out together
+        responses = fetch_many({
+            "root": ("/", {}),
+            "model": ("/debug/model-info", {}),
+            "schema": ("/debug/payment-schema", {}),
+        })
+        res = responses["root"]
         st.write("**API Status:**", "✅ Connected" if res.status_code == 200 else "❌ Error")
-        
+
         if res.status_code == 200:
             st.json(res.json())
-        
+
         # Test model info (if you added the debug endpoint)
-        try:
-            model_res = requests.get(f"{API_URL}/debug/model-info")
-            if model_res.status_code == 200:
-                st.write("**PaymentCreate Model Info:**")
-                st.json(model_res.json())
-        except:
+        if responses["model"].status_code == 200:
+            st.write("**PaymentCreate Model Info:**")
+            st.json(responses["model"].json())
+        else:
             st.write("Debug endpoint not available")
-            
+
         # Test payment schema
-        try:
-            schema_res = requests.get(f"{API_URL}/debug/payment-schema")
-            if schema_res.status_code == 200:
-                st.write("**Payment Schema Test:**")
-                st.json(schema_res.json())
-        except:
+        if responses["schema"].status_code == 200:
+            st.write("**Payment Schema Test:**")
+            st.json(responses["schema"].json())
+        else:
             st.write("Payment schema test not available")
-            
+
     except requests.exceptions.RequestException as e:
         st.error(f"❌ Cannot connect to API: {e}")
-        st.info(f"Make sure your FastAPI server is running on {API_URL}")
\ No newline at end of file
+        st.info(f"Make sure your FastAPI server is running on {API_URL}")
@@ -0,0 +1,269 @@
+import bisect
+import logging
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Utility --------------------
+def to_day(value):
+    """Calendar day of a date, or of an ISO date/timestamp string."""
+    if isinstance(value, date):
+        return value if type(value) is date else value.date()
+    return date.fromisoformat(str(value)[:10])
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+def month_start(day):
+    return day.replace(day=1)
+
+PERIODS = {"day": lambda d: d, "week": week_start, "month": month_start}
+
+# -------------------- Revenue --------------------
+class RevenueAggregates:
+    """Running revenue totals by day, week, month and payment method.
+
+    Payment inserts and deletes adjust the totals in O(1). A backfill
+    aggregates scanned pages with NumPy instead of row by row. Reads only
+    touch the buckets in the requested range, never the payment history.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.buckets = {name: defaultdict(lambda: [0.0, 0]) for name in PERIODS}  # period -> start -> [revenue, count]
+        self.by_method = defaultdict(lambda: [0.0, 0])
+        self.total = 0.0
+        self.count = 0
+
+    def _add(self, day, method, amount, count):
+        for name, bucket_of in PERIODS.items():
+            bucket = self.buckets[name][bucket_of(day)]
+            bucket[0] += amount
+            bucket[1] += count
+        entry = self.by_method[method or "Unknown"]
+        entry[0] += amount
+        entry[1] += count
+        self.total += amount
+        self.count += count
+
+    def apply(self, event, rows):
+        """PaymentManager listener."""
+        sign = {"insert": 1, "delete": -1}.get(event)
+        if sign is None:
+            return
+        with self._lock:
+            for row in rows:
+                self._add(to_day(row["payment_date"]), row.get("method"), sign * float(row["amount"]), sign)
+
+    def backfill(self, pages):
+        """Rebuild from an iterable of payment row lists; returns the ids it scanned.
+
+        Pages are fetched and aggregated without the lock, which is only
+        held to fold each page into the totals.
+        """
+        with self._lock:
+            self._reset()
+        scanned = []
+        for rows in pages:
+            if not rows:
+                continue
+            scanned.append(np.fromiter((int(r["id"]) for r in rows), np.int64, len(rows)))
+            days = np.array([str(r["payment_date"])[:10] for r in rows], dtype="datetime64[D]")
+            amounts = np.array([float(r["amount"]) for r in rows])
+            methods = np.array([r.get("method") or "Unknown" for r in rows], dtype=object)
+
+            unique_days, day_idx = np.unique(days, return_inverse=True)
+            day_sums = np.bincount(day_idx, weights=amounts)
+            day_counts = np.bincount(day_idx)
+            unique_methods, method_idx = np.unique(methods, return_inverse=True)
+            method_sums = np.bincount(method_idx, weights=amounts)
+            method_counts = np.bincount(method_idx)
+
+            with self._lock:
+                for day, amount, count in zip(unique_days.tolist(), day_sums.tolist(), day_counts.tolist()):
+                    for name, bucket_of in PERIODS.items():
+                        bucket = self.buckets[name][bucket_of(day)]
+                        bucket[0] += amount
+                        bucket[1] += count
+                for method, amount, count in zip(unique_methods.tolist(), method_sums.tolist(), method_counts.tolist()):
+                    entry = self.by_method[method]
+                    entry[0] += amount
+                    entry[1] += count
+                self.total += float(amounts.sum())
+                self.count += len(rows)
+        return np.concatenate(scanned) if scanned else np.zeros(0, np.int64)
+
+    def replay(self, writes, scanned):
+        """Apply (event, rows) writes queued during a backfill that returned `scanned`.
+
+        Each payment is counted once: an insert the scan already counted is
+        skipped, and so is a delete of a payment that was never counted.
+        """
+        ids = [int(row["id"]) for _, rows in writes for row in rows]
+        counted = {i for i, seen in zip(ids, np.isin(np.array(ids, np.int64), scanned).tolist()) if seen}
+        for event, rows in writes:
+            if event == "insert":
+                rows = [row for row in rows if int(row["id"]) not in counted]
+                counted.update(int(row["id"]) for row in rows)
+            elif event == "delete":
+                rows = [row for row in rows if int(row["id"]) in counted]
+                counted.difference_update(int(row["id"]) for row in rows)
+            self.apply(event, rows)
+
+    def series(self, period="day", start=None, end=None):
+        """Revenue per period bucket between start and end (inclusive)."""
+        bucket_of = PERIODS[period]
+        with self._lock:
+            buckets = self.buckets[period]
+            keys = sorted(k for k in buckets
+                          if (start is None or k >= bucket_of(start)) and (end is None or k <= end))
+            return [{"period": k.isoformat(), "revenue": round(buckets[k][0], 2), "payments": buckets[k][1]}
+                    for k in keys if buckets[k][1]]
+
+    def methods(self):
+        with self._lock:
+            return [{"method": m, "revenue": round(v[0], 2), "payments": v[1]}
+                    for m, v in sorted(self.by_method.items()) if v[1]]
+
+    def summary(self):
+        with self._lock:
+            return {"revenue": round(self.total, 2), "payments": self.count}
+
+# -------------------- Membership --------------------
+class MembershipAggregates:
+    """Per-plan sorted start/end dates so active counts and churn are bisects."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.members = {}                 # id -> (plan, start, end)
+        self.ends = defaultdict(list)     # plan -> sorted end dates
+        self.starts = defaultdict(list)   # plan -> sorted start dates
+
+    def _insert(self, member_id, plan, start, end):
+        self.members[member_id] = (plan, start, end)
+        bisect.insort(self.ends[plan], end)
+        bisect.insort(self.starts[plan], start)
+
+    def _remove(self, member_id):
+        old = self.members.pop(member_id, None)
+        if old is None:
+            return
+        plan, start, end = old
+        del self.ends[plan][bisect.bisect_left(self.ends[plan], end)]
+        del self.starts[plan][bisect.bisect_left(self.starts[plan], start)]
+
+    def apply(self, event, rows):
+        """GymratManager listener."""
+        with self._lock:
+            for row in rows:
+                member_id = str(row["id"])
+                old = self.members.get(member_id)
+                self._remove(member_id)
+                if event == "delete":
+                    continue
+                plan = row.get("plan", old[0] if old else None)
+                start = to_day(row["start_date"]) if row.get("start_date") else (old[1] if old else date.today())
+                end = row.get("end_date", old[2] if old else None)
+                if end is not None:
+                    self._insert(member_id, plan, start, to_day(end))
+
+    def backfill(self, rows):
+        with self._lock:
+            self._reset()
+            for row in rows:
+                if row.get("end_date"):
+                    self.members[str(row["id"])] = (row["plan"], to_day(row.get("start_date") or date.today()),
+                                                    to_day(row["end_date"]))
+            for plan, start, end in self.members.values():
+                self.ends[plan].append(end)
+                self.starts[plan].append(start)
+            for plan in self.ends:
+                self.ends[plan].sort()
+                self.starts[plan].sort()
+
+    def active_per_plan(self, today=None):
+        today = today or date.today()
+        with self._lock:
+            return {plan: len(ends) - bisect.bisect_left(ends, today)
+                    for plan, ends in sorted(self.ends.items(), key=lambda item: str(item[0])) if ends}
+
+    def churn(self, start, end):
+        """Members whose plan ended in [start, end) over those active on `start`."""
+        with self._lock:
+            ended = active = 0
+            for plan, ends in self.ends.items():
+                lo = bisect.bisect_left(ends, start)
+                ended += bisect.bisect_left(ends, end) - lo
+                joined_later = len(self.starts[plan]) - bisect.bisect_right(self.starts[plan], start)
+                active += (len(ends) - lo) - joined_later
+        return {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "ended": ended,
+            "active_at_start": active,
+            "churn_rate": round(ended / active, 4) if active > 0 else None,
+        }
+
+# -------------------- Store --------------------
+class AnalyticsStore:
+    """Revenue and membership aggregates kept current by manager write listeners.
+
+    Writes seen while `load` scans are queued and replayed afterwards;
+    payments are matched by id so the scan and the replay never both
+    count one. Member writes are upserts by id and replay as they are.
+    """
+
+    def __init__(self):
+        self.revenue = RevenueAggregates()
+        self.membership = MembershipAggregates()
+        self._pending = []
+        self._lock = threading.Lock()
+        self._loading = False
+        self.ready = False
+
+    def on_payment_write(self, event, rows):
+        self._dispatch(self.revenue, event, rows)
+
+    def on_member_write(self, event, rows):
+        self._dispatch(self.membership, event, rows)
+
+    def _dispatch(self, target, event, rows):
+        with self._lock:
+            if not self.ready:
+                # Between loads the next scan picks the write up, so only a running load queues it.
+                if self._loading:
+                    self._pending.append((target, event, rows))
+                return
+        target.apply(event, rows)
+
+    def load(self, gymrat_mgr, payment_mgr):
+        """Backfill both aggregates from full scans, then replay writes seen meanwhile."""
+        with self._lock:
+            self.ready, self._loading = False, True
+        try:
+            self.membership.backfill(gymrat_mgr.iter_members(["plan", "start_date", "end_date"]))
+            scanned = self.revenue.backfill(payment_mgr.iter_payment_pages(["amount", "payment_date", "method"]))
+        except Exception:
+            logger.exception("Could not backfill analytics")
+            with self._lock:
+                self._pending, self._loading = [], False
+            return
+        with self._lock:
+            pending, self._pending = self._pending, []
+            for target, event, rows in pending:
+                if target is self.membership:
+                    target.apply(event, rows)
+            self.revenue.replay([(event, rows) for target, event, rows in pending if target is self.revenue], scanned)
+            self.ready, self._loading = True, False
+        logger.info("Analytics loaded: %d payments, %d members",
+                    self.revenue.count, len(self.membership.members))
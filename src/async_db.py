@@ -0,0 +1,200 @@
+import os
+import asyncio
+from src.cache import cached, invalidate_members, invalidate_payments
+from src.storage import create_async_storage
+from src.branches import check_branch
+from src.metrics import timed, instrument_async
+from src.db import (
+    get_storage, select_columns, page_args, split_page, member_filters, payment_filters,
+    member_payload, member_update_payload, payment_payload,
+    MEMBER_FIELDS, PAYMENT_FIELDS, DEFAULT_PAGE_SIZE, PAYMENT_HISTORY_LIMIT, LOOKUP_CHUNK_SIZE
+)
+
+# -------------------- Setup --------------------
+# Supabase gets one AsyncClient per process: its postgrest session is a single
+# httpx AsyncClient, so every concurrent request multiplexes over the same
+# keep-alive connection pool instead of tying up a worker thread. Backends
+# without an async driver (SQLite) share src.db's storage through threads.
+# Each branch partition has its own storage, built on first use as in src.db.
+storages = {}
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))  # pooled connections opened per branch by warm_up
+
+def get_async_storage(branch=None):
+    branch = check_branch(branch)
+    storage = storages.get(branch)
+    if storage is None:  # only ever called on the event loop, so no lock
+        storage = storages[branch] = instrument_async(
+            create_async_storage(sync_storage=get_storage(branch), branch=branch))
+    return storage
+
+async def warm_up(branch=None, connections=WARMUP_CONNECTIONS):
+    """Build a branch's storages and open `connections` pooled connections with cheap queries.
+
+    Raises when the backend is misconfigured or unreachable.
+    """
+    await asyncio.to_thread(lambda: get_storage(branch).select("gymrats", "id", limit=1))
+    storage = get_async_storage(branch)
+    await asyncio.gather(*(storage.select("gymrats", "id", limit=1) for _ in range(connections)))
+
+async def close_client():
+    """Close the pooled connections (call on application shutdown)."""
+    for storage in storages.values():
+        await storage.close()
+
+# -------------------- Gymrats Table --------------------
+@timed
+async def add_member(name, phone, plan, start_date=None, end_date=None, branch=None):
+    payload = member_payload(name, phone, plan, start_date, end_date)
+    try:
+        rows = await get_async_storage(branch).insert("gymrats", [payload])
+        invalidate_members()
+        return {"success": True, "data": rows}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@cached("gymrats:list")
+@timed
+async def get_all_members(order_by="start_date", branch=None):
+    try:
+        rows = await get_async_storage(branch).select("gymrats", order_by=order_by)
+        return {"success": True, "data": rows}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@cached("gymrats:page")
+@timed
+async def get_members_page(limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None, plan=None,
+                           status=None, start_from=None, start_to=None, branch=None):
+    try:
+        limit, after = page_args(limit, cursor)
+        storage = get_async_storage(branch)
+        rows = await storage.select("gymrats", select_columns(fields, MEMBER_FIELDS, "start_date"),
+                                    member_filters(plan, status, start_from, start_to),
+                                    order_by="start_date", limit=limit + 1, after=after)
+        rows, next_cursor = split_page(rows, "start_date", limit)
+        return {"success": True, "data": rows, "next_cursor": next_cursor}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+async def select_members(filters, include_payments=False, payment_limit=PAYMENT_HISTORY_LIMIT, branch=None):
+    storage = get_async_storage(branch)
+    if include_payments:
+        return await storage.select_embedded("gymrats", filters, "payments", "gymrat_id",
+                                             order_by="payment_date", limit=payment_limit)
+    return await storage.select("gymrats", filters=filters)
+
+@cached("gymrats:detail", scope="member_id")
+@timed
+async def get_member(member_id, include_payments=False, payment_limit=PAYMENT_HISTORY_LIMIT, branch=None):
+    try:
+        rows = await select_members([("id", "eq", str(member_id))], include_payments, payment_limit, branch)
+        return {"success": True, "data": rows[0] if rows else None}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@timed
+async def get_members_by_ids(member_ids, include_payments=False, payment_limit=PAYMENT_HISTORY_LIMIT, branch=None):
+    try:
+        ids = list(dict.fromkeys(str(i) for i in member_ids))
+        rows = []
+        for start in range(0, len(ids), LOOKUP_CHUNK_SIZE):
+            rows.extend(await select_members([("id", "in", ids[start:start + LOOKUP_CHUNK_SIZE])],
+                                             include_payments, payment_limit, branch))
+        return {"success": True, "data": rows}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@timed
+async def update_member(member_id, new_plan, new_end_date=None, branch=None):
+    payload = member_update_payload(new_plan, new_end_date)
+    try:
+        rows = await get_async_storage(branch).update("gymrats", payload, [("id", "eq", str(member_id))])
+        invalidate_members()
+        return {"success": True, "data": rows}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@timed
+async def delete_member(member_id, branch=None):
+    try:
+        rows = await get_async_storage(branch).delete("gymrats", [("id", "eq", str(member_id))])
+        invalidate_members()
+        return {"success": True, "data": rows}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+# -------------------- Payments Table --------------------
+@timed
+async def add_payment(member_id, amount, payment_date=None, method=None, branch=None):
+    payload = payment_payload(member_id, amount, payment_date, method)
+    try:
+        rows = await get_async_storage(branch).insert("payments", [payload])
+        invalidate_payments([payload["gymrat_id"]])
+        return {"success": True, "data": rows}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@cached("payments:list")
+@timed
+async def get_all_payments(order_by="payment_date", branch=None):
+    try:
+        rows = await get_async_storage(branch).select("payments", order_by=order_by)
+        return {"success": True, "data": rows}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@cached("payments:page")
+@timed
+async def get_payments_page(limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None, method=None,
+                            member_id=None, date_from=None, date_to=None, branch=None):
+    try:
+        limit, after = page_args(limit, cursor)
+        storage = get_async_storage(branch)
+        rows = await storage.select("payments", select_columns(fields, PAYMENT_FIELDS, "payment_date"),
+                                    payment_filters(method, member_id, date_from, date_to),
+                                    order_by="payment_date", limit=limit + 1, after=after)
+        rows, next_cursor = split_page(rows, "payment_date", limit)
+        return {"success": True, "data": rows, "next_cursor": next_cursor}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@cached("payments:member", scope="member_id")
+@timed
+async def get_payments_by_member(member_id, limit=None, branch=None):
+    try:
+        storage = get_async_storage(branch)
+        rows = await storage.select("payments", filters=[("gymrat_id", "eq", str(member_id))],
+                                    order_by="payment_date", limit=limit)
+        return {"success": True, "data": rows}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@timed
+async def delete_payment(payment_id, branch=None):
+    try:
+        rows = await get_async_storage(branch).delete("payments", [("id", "eq", str(payment_id))])
+        invalidate_payments([row["gymrat_id"] for row in rows] if rows else None)
+        return {"success": True, "data": rows}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+# -------------------- Aggregates --------------------
+@timed
+async def count_members(plan=None, status=None, start_from=None, start_to=None, branch=None):
+    """Members matching the list filters, counted by the database."""
+    try:
+        result = await get_async_storage(branch).aggregate("gymrats",
+                                                           member_filters(plan, status, start_from, start_to))
+        return {"success": True, "data": {"count": result["count"]}}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@timed
+async def get_payment_totals(method=None, member_id=None, date_from=None, date_to=None, branch=None):
+    """Count and sum of the payments matching the list filters, computed by the database."""
+    try:
+        result = await get_async_storage(branch).aggregate(
+            "payments", payment_filters(method, member_id, date_from, date_to), "amount")
+        return {"success": True, "data": {"count": result["count"], "sum": result["sum"]}}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
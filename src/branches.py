@@ -0,0 +1,44 @@
+import os
+import re
+
+# -------------------- Setup --------------------
+# Each branch (gym location) keeps its members and payments in a partition
+# of its own: a separate SQLite file, or a separate Postgres schema on
+# Supabase. A query only ever touches one branch's tables, so per-branch
+# reads stay as fast as a single-gym install no matter how many branches
+# are added. DEFAULT_BRANCH owns the original tables (SQLITE_PATH, the
+# public schema) and answers requests that name no branch.
+DEFAULT_BRANCH = os.getenv("DEFAULT_BRANCH", "main")
+BRANCH_ID = re.compile(r"[a-z0-9_]{1,32}")
+
+def parse_branches(value, default=DEFAULT_BRANCH):
+    """The default branch plus the comma separated ids in `value`, validated."""
+    branches = list(dict.fromkeys([default, *(b.strip() for b in (value or "").split(",") if b.strip())]))
+    invalid = [b for b in branches if not BRANCH_ID.fullmatch(b)]
+    if invalid:
+        raise ValueError(f"Invalid branch ids: {', '.join(invalid)} (use a-z, 0-9 and _).")
+    return branches
+
+BRANCHES = parse_branches(os.getenv("BRANCHES"))
+
+def check_branch(branch=None):
+    """The branch a request is for; raises ValueError for branches this deployment does not serve."""
+    if branch is None:
+        return DEFAULT_BRANCH
+    if branch not in BRANCHES:
+        raise ValueError(f"Unknown branch '{branch}'.")
+    return branch
+
+# -------------------- Partitions --------------------
+def sqlite_path(path, branch=None):
+    """gym.sqlite3 for the default branch, gym-<branch>.sqlite3 for the others."""
+    branch = branch or DEFAULT_BRANCH
+    if branch == DEFAULT_BRANCH:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}-{branch}{ext}"
+
+def schema_name(branch=None):
+    """Postgres schema holding a branch's gymrats and payments tables."""
+    branch = branch or DEFAULT_BRANCH
+    return "public" if branch == DEFAULT_BRANCH else f"branch_{branch}"
@@ -0,0 +1,284 @@
+import os
+import time
+import pickle
+import sqlite3
+import inspect
+import functools
+import threading
+from collections import OrderedDict
+
+# -------------------- Setup --------------------
+# CACHE_BACKEND: "memory" (default, per-process LRU), "sqlite" (shared by
+# every worker on the host through CACHE_PATH) or "none" to disable.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_TTL = float(os.getenv("CACHE_TTL", "30"))
+CACHE_MAXSIZE = int(os.getenv("CACHE_MAXSIZE", "1024"))
+CACHE_PATH = os.getenv("CACHE_PATH", "gym_cache.sqlite3")
+
+_MISSING = object()
+
+# -------------------- Backends --------------------
+class LRUCache:
+    """In-process LRU cache with a per-entry TTL.
+
+    Entries are grouped by tag (e.g. "gymrats:page") so a write can drop
+    every key of a namespace without scanning the whole cache.
+    """
+
+    name = "memory"
+
+    def __init__(self, maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, tag, value)
+        self._tags = {}             # tag -> set(keys)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return _MISSING
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return _MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, key, tag, value):
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic() + self.ttl, tag, value)
+            self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def invalidate(self, prefix):
+        with self._lock:
+            for tag in [t for t in self._tags if t.startswith(prefix)]:
+                for key in list(self._tags.get(tag, ())):
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _drop(self, key):
+        _, tag, _ = self._data.pop(key)
+        keys = self._tags.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+class SQLiteCache:
+    """Cache shared by every process on the host, stored in one SQLite file.
+
+    Counters are per process; size and eviction use the shared table.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=CACHE_PATH, maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._local = threading.local()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache "
+                         "(key TEXT PRIMARY KEY, tag TEXT, value BLOB, expires REAL, used REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_tag ON cache(tag)")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_used ON cache(used)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return _MISSING
+        if row[1] < now:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.expirations += 1
+            self.misses += 1
+            return _MISSING
+        conn.execute("UPDATE cache SET used = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key, tag, value):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                     (key, tag, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), now + self.ttl, now))
+        overflow = len(self) - self.maxsize
+        if overflow > 0:
+            conn.execute("DELETE FROM cache WHERE key IN "
+                         "(SELECT key FROM cache ORDER BY used LIMIT ?)", (overflow,))
+            self.evictions += overflow
+
+    def invalidate(self, prefix):
+        cur = self._conn().execute("DELETE FROM cache WHERE tag >= ? AND tag < ?", (prefix, prefix + "\uffff"))
+        self.invalidations += max(cur.rowcount, 0)
+
+    def clear(self):
+        self._conn().execute("DELETE FROM cache")
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+class NullCache:
+    """Disabled cache: every lookup is a miss and nothing is stored."""
+
+    name = "none"
+    hits = misses = evictions = expirations = invalidations = 0
+
+    def get(self, key):
+        return _MISSING
+
+    def set(self, key, tag, value):
+        pass
+
+    def invalidate(self, prefix):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+def create_cache(backend=CACHE_BACKEND):
+    if backend == "sqlite":
+        return SQLiteCache()
+    if backend == "none":
+        return NullCache()
+    return LRUCache()
+
+cache = create_cache()
+
+# A read that started before a write must not store its rows after the
+# write's invalidation. Every invalidation bumps the generation of its
+# table ("gymrats", "payments"); a fill is dropped when the generation of
+# its tag moved while the query ran. Checking and storing happen under the
+# same lock as bumping and dropping, so neither can slip between the other.
+_generations = {}  # table -> invalidations so far
+_fill_lock = threading.Lock()
+
+def generation(tag):
+    return _generations.get(tag.split(":", 1)[0], 0)
+
+def fill(key, tag, value, started):
+    """Store a read result unless its table was invalidated since generation `started`."""
+    with _fill_lock:
+        if generation(tag) == started:
+            cache.set(key, tag, value)
+
+# -------------------- Helpers --------------------
+def stats():
+    """Counters for the active cache backend."""
+    lookups = cache.hits + cache.misses
+    return {
+        "backend": cache.name,
+        "size": len(cache),
+        "hits": cache.hits,
+        "misses": cache.misses,
+        "hit_ratio": round(cache.hits / lookups, 4) if lookups else None,
+        "evictions": cache.evictions,
+        "expirations": cache.expirations,
+        "invalidations": cache.invalidations,
+    }
+
+def invalidate(prefix):
+    table = prefix.split(":", 1)[0]
+    with _fill_lock:
+        _generations[table] = _generations.get(table, 0) + 1
+        cache.invalidate(prefix)
+
+def invalidate_members():
+    """Drop every cached member read after a write to gymrats."""
+    invalidate("gymrats:")
+
+def invalidate_payments(member_ids=None):
+    """Drop cached payment lists, and the per-member lists and member details for `member_ids`.
+
+    With no ids (e.g. a delete whose row is unknown) every payment key goes.
+    """
+    invalidate("payments:list")
+    invalidate("payments:page")
+    if member_ids is None:
+        invalidate("payments:member:")
+        invalidate("gymrats:detail:")
+        return
+    for member_id in set(member_ids):
+        invalidate(f"payments:member:{member_id}:")
+        invalidate(f"gymrats:detail:{member_id}:")
+
+def cached(namespace, scope=None):
+    """Read-through cache decorator for src.db / src.async_db read functions.
+
+    Only successful results are stored. `scope` names an argument whose value
+    becomes part of the tag (e.g. the member id) so writes can invalidate
+    just that member's entries. The sync and async variant of a function
+    use the same namespace and therefore share entries. A result is not
+    stored when its table was invalidated while it was being read. Cached
+    results are shared objects and must not be mutated by callers.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        def key_for(args, kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            tag = namespace
+            if scope is not None:
+                tag = f"{namespace}:{bound.arguments[scope]}:"
+            return f"{tag}|{bound.arguments!r}", tag
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key, tag = key_for(args, kwargs)
+                value = cache.get(key)
+                if value is _MISSING:
+                    started = generation(tag)
+                    value = await func(*args, **kwargs)
+                    if value.get("success"):
+                        fill(key, tag, value, started)
+                return value
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key, tag = key_for(args, kwargs)
+            value = cache.get(key)
+            if value is _MISSING:
+                started = generation(tag)
+                value = func(*args, **kwargs)
+                if value.get("success"):
+                    fill(key, tag, value, started)
+            return value
+        return wrapper
+    return decorator
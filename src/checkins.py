@@ -0,0 +1,218 @@
+import os
+import re
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Setup --------------------
+CHECKIN_FLUSH_INTERVAL = float(os.getenv("CHECKIN_FLUSH_INTERVAL", "1"))  # seconds between bulk writes
+CHECKIN_BATCH_SIZE = int(os.getenv("CHECKIN_BATCH_SIZE", "1000"))         # rows per multi-row insert
+CHECKIN_BUFFER_MAX = int(os.getenv("CHECKIN_BUFFER_MAX", "100000"))       # unwritten taps before new ones are refused
+CHECKIN_DEDUP = float(os.getenv("CHECKIN_DEDUP", "60"))     # a member's repeat taps within this many seconds count once
+CHECKIN_STAY = float(os.getenv("CHECKIN_STAY", "5400"))     # assumed visit length for occupancy (there are no check-outs)
+CHECKIN_RETENTION = 86400   # longest stats window, and the history loaded at startup
+BUCKET_SECONDS = 60
+WINDOW_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+def parse_window(value):
+    """Turn "15m", "1h" or "1d" into seconds, at most CHECKIN_RETENTION."""
+    match = re.fullmatch(r"(\d+)([mhd])", value.strip())
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid window '{value}', expected e.g. 15m, 1h or 1d.")
+    seconds = int(match.group(1)) * WINDOW_UNITS[match.group(2)]
+    if seconds > CHECKIN_RETENTION:
+        raise ValueError(f"Window '{value}' is longer than the {CHECKIN_RETENTION // 3600}h kept in memory.")
+    return seconds
+
+def local_time(value):
+    """A check-in time as a naive local datetime, the way payment dates are stored."""
+    if value is None:
+        return datetime.now()
+    if value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+def partition_key(checked_in_at):
+    # The checkins table is range partitioned by month (see README).
+    return checked_in_at[:7]
+
+# -------------------- Counters --------------------
+class CheckinCounters:
+    """Rolling visit counters for the last CHECKIN_RETENTION seconds.
+
+    Visits are counted per minute; each member's latest check-in gives the
+    unique visitors of a window, the occupancy and repeat-tap detection.
+    Windows are therefore accurate to the minute.
+    """
+
+    def __init__(self, retention=CHECKIN_RETENTION):
+        self.retention = retention
+        self._visits = {}   # minute (epoch // 60) -> check-ins
+        self._last = {}     # member id -> latest check-in (epoch seconds)
+        self._lock = threading.Lock()
+        self.ready = False
+
+    def load(self, rows):
+        """Count stored check-ins (rows with gymrat_id and checked_in_at) from the last `retention` seconds."""
+        visits, last = {}, {}
+        for row in rows:
+            ts = datetime.fromisoformat(str(row["checked_in_at"])).timestamp()
+            minute = int(ts // BUCKET_SECONDS)
+            visits[minute] = visits.get(minute, 0) + 1
+            member_id = str(row["gymrat_id"])
+            if ts > last.get(member_id, 0):
+                last[member_id] = ts
+        # CheckinStore refuses taps until this load is done, so nothing is counted twice.
+        with self._lock:
+            self._visits, self._last = visits, last
+            self.ready = True
+        logger.info("Check-in counters loaded: %d visits", sum(visits.values()))
+
+    def record(self, member_id, ts, dedup=CHECKIN_DEDUP):
+        """Count a check-in; False (and nothing counted) for a repeat tap within `dedup` seconds."""
+        with self._lock:
+            last = self._last.get(member_id)
+            if last is not None and abs(ts - last) < dedup:
+                return False
+            if last is None or ts > last:
+                self._last[member_id] = ts
+            minute = int(ts // BUCKET_SECONDS)
+            self._visits[minute] = self._visits.get(minute, 0) + 1
+            return True
+
+    def prune(self, now=None):
+        cutoff = (now or time.time()) - max(self.retention, CHECKIN_STAY)
+        with self._lock:
+            self._visits = {m: c for m, c in self._visits.items() if (m + 1) * BUCKET_SECONDS > cutoff}
+            self._last = {k: ts for k, ts in self._last.items() if ts > cutoff}
+
+    def stats(self, window, now=None, stay=CHECKIN_STAY):
+        now = now or time.time()
+        first_minute = int((now - window) // BUCKET_SECONDS) + 1
+        with self._lock:
+            visits = sum(c for m, c in self._visits.items() if m >= first_minute)
+            unique = sum(1 for ts in self._last.values() if ts > now - window)
+            occupancy = sum(1 for ts in self._last.values() if now - stay < ts <= now)
+        return {"window_seconds": window, "visits": visits, "unique_members": unique, "occupancy": occupancy}
+
+# -------------------- Store --------------------
+class CheckinStore:
+    """Buffered check-ins of one branch, written to the database in bulk.
+
+    A tap is checked against the active members (the expiry index), counted
+    and buffered without touching the database. A background task writes
+    the buffer every CHECKIN_FLUSH_INTERVAL seconds, or as soon as
+    CHECKIN_BATCH_SIZE taps are waiting, one multi-row insert per batch.
+    The buffer is partitioned by month like the table, so every insert
+    lands in a single partition. A failed write keeps its rows for the next
+    flush; taps still buffered when the process dies are lost, and shutdown
+    flushes what is left.
+    """
+
+    def __init__(self, manager, members, counters, batch_size=CHECKIN_BATCH_SIZE,
+                 interval=CHECKIN_FLUSH_INTERVAL, max_buffer=CHECKIN_BUFFER_MAX):
+        self.manager = manager
+        self.members = members
+        self.counters = counters
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_buffer = max_buffer
+        self.buffered = 0
+        self.flushed = 0
+        self.rejected = 0
+        self._partitions = {}  # "YYYY-MM" -> payloads waiting, oldest first
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = None
+        self._task = None
+
+    @property
+    def ready(self):
+        return self.members.ready and self.counters.ready
+
+    def stats(self):
+        return {"buffered": self.buffered, "flushed": self.flushed, "rejected": self.rejected}
+
+    def accept(self, checkins):
+        """Validate, count and buffer [{"member_id", "checked_in_at"?}, ...]; one result per tap, in order."""
+        results = []
+        for checkin in checkins:
+            member_id = str(checkin["member_id"])
+            when = local_time(checkin.get("checked_in_at"))
+            result = {"member_id": member_id, "checked_in_at": when.isoformat(), "success": False}
+            results.append(result)
+            if not self.members.is_active(member_id, when.date()):
+                result["message"] = "No active membership."
+            elif self.buffered >= self.max_buffer:
+                result["message"] = "Check-in buffer is full; retry shortly."
+                result["retry"] = True
+            elif not self.counters.record(member_id, when.timestamp()):
+                result.update(success=True, duplicate=True, message="Repeat tap; already checked in.")
+            else:
+                payload = {"gymrat_id": member_id, "checked_in_at": result["checked_in_at"]}
+                with self._lock:
+                    self._partitions.setdefault(partition_key(payload["checked_in_at"]), []).append(payload)
+                    self.buffered += 1
+                result.update(success=True, message="Checked in.")
+        if self.buffered >= self.batch_size and self._wake is not None:
+            self._wake.set()
+        return results
+
+    def flush_once(self):
+        """Write everything buffered, oldest partition first; returns the rows written."""
+        with self._flush_lock:
+            with self._lock:
+                partitions, self._partitions = self._partitions, {}
+            written = 0
+            keys = sorted(partitions)
+            for i, key in enumerate(keys):
+                rows = partitions[key]
+                result = self.manager.add_checkins(rows, self.batch_size)
+                stored, rejected = result["data"]["stored"], result["data"]["rejected"]
+                written += stored - len(rejected)
+                self.rejected += len(rejected)
+                for row in rejected:
+                    logger.warning("Dropped check-in of %s: %s", row["gymrat_id"], row["error"])
+                if not result["success"]:
+                    logger.warning("Check-in flush failed, %d rows kept for retry: %s",
+                                   sum(len(partitions[k]) for k in keys[i:]) - stored, result["error"])
+                    partitions[key] = rows[stored:]
+                    with self._lock:
+                        for k in keys[i:]:
+                            if partitions[k]:
+                                self._partitions[k] = partitions[k] + self._partitions.get(k, [])
+                    break
+            with self._lock:
+                self.buffered = sum(len(rows) for rows in self._partitions.values())
+            self.flushed += written
+            return written
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await asyncio.to_thread(self.flush_once)
+                self.counters.prune()
+            except Exception:
+                logger.exception("Check-in flush crashed")
+
+    def start(self):
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await asyncio.to_thread(self.flush_once)
@@ -1,15 +1,48 @@
 import os
-import logging
-from supabase import create_client
-from dotenv import load_dotenv
-from datetime import datetime, date
+import json
+import base64
+import threading
+from datetime import datetime, date, timedelta
+from src.cache import cached, invalidate_members, invalidate_payments
+from src.storage import create_storage
+from src.branches import check_branch
+from src.expiry import EXPIRY_SWEEP_MODE
+from src.metrics import timed, instrument
 
 # -------------------- Setup --------------------
-logging.basicConfig(level=logging.INFO)
-load_dotenv()
-url = os.getenv("SUPABASE_URL")
-key = os.getenv("SUPABASE_KEY")
-supabase = create_client(url, key)
+# Supabase or the embedded SQLite database, chosen by STORAGE_BACKEND, with
+# one partition per branch. Every function below takes the `branch` it
+# works on and only ever queries that branch's tables. A branch's storage
+# is built on first use (or by the API's warm-up), so importing this module
+# opens no connection and a bad configuration fails calls, not the import.
+storages = {}
+_storages_lock = threading.Lock()
+
+def get_storage(branch=None):
+    branch = check_branch(branch)
+    storage = storages.get(branch)
+    if storage is None:
+        with _storages_lock:
+            storage = storages.get(branch)
+            if storage is None:
+                storage = storages[branch] = instrument(create_storage(branch=branch))
+    return storage
+
+def is_permanent(error, branch=None):
+    """Whether retrying a failed write cannot help; a storage that could not even be built is retried."""
+    storage = storages.get(check_branch(branch))
+    return storage is not None and storage.is_permanent(error)
+
+MEMBER_FIELDS = ("id", "name", "age", "phone", "plan", "start_date", "end_date", "expired")
+PAYMENT_FIELDS = ("id", "gymrat_id", "amount", "payment_date", "method")
+CHECKIN_FIELDS = ("id", "gymrat_id", "checked_in_at")
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+MAX_BULK_CHUNK_SIZE = 5000
+PAYMENT_HISTORY_LIMIT = 10
+# Ids per lookup query; keeps the PostgREST `id=in.(...)` URL well under proxy limits.
+LOOKUP_CHUNK_SIZE = 150
 
 # -------------------- Utility --------------------
 def to_iso(value):
@@ -18,50 +51,305 @@ def to_iso(value):
         return value.isoformat()
     return value
 
+def encode_cursor(row, sort_key):
+    """Build an opaque keyset cursor from the last row of a page."""
+    raw = json.dumps([row.get(sort_key), row.get("id")]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor):
+    """Return the (sort_value, id) pair stored in a cursor."""
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor.")
+    return sort_value, row_id
+
+def select_columns(fields, allowed, sort_key):
+    """Validate a field projection; the sort key and id are always kept for cursors."""
+    if not fields:
+        return "*"
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    columns = list(dict.fromkeys(["id", sort_key, *fields]))
+    return ",".join(columns)
+
+def page_args(limit, cursor):
+    """Clamp a page size and decode its cursor; returns (limit, after)."""
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    return limit, decode_cursor(cursor) if cursor else None
+
+def split_page(rows, sort_key, limit):
+    """Trim the look-ahead row off a page and return (rows, next_cursor)."""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1], sort_key)
+    return rows, None
+
+def member_filters(plan=None, status=None, start_from=None, start_to=None):
+    """Member list filters as storage (column, op, value) tuples."""
+    filters = []
+    if plan:
+        filters.append(("plan", "eq", plan))
+    if status == "active":
+        filters.append(("end_date", "gte", to_iso(date.today())))
+    elif status == "expired":
+        filters.append(("end_date", "lt", to_iso(date.today())))
+    if start_from:
+        filters.append(("start_date", "gte", to_iso(start_from)))
+    if start_to:
+        filters.append(("start_date", "lte", to_iso(start_to)))
+    return filters
+
+def payment_filters(method=None, member_id=None, date_from=None, date_to=None):
+    """Payment list filters as storage (column, op, value) tuples."""
+    filters = []
+    if method:
+        filters.append(("method", "eq", method))
+    if member_id:
+        filters.append(("gymrat_id", "eq", str(member_id)))
+    if date_from:
+        filters.append(("payment_date", "gte", to_iso(date_from)))
+    if date_to and not isinstance(date_to, datetime):
+        # A plain date means "up to the end of that day" for a timestamp column
+        filters.append(("payment_date", "lt", to_iso(date_to + timedelta(days=1))))
+    elif date_to:
+        filters.append(("payment_date", "lte", to_iso(date_to)))
+    return filters
+
+def insert_in_chunks(table, payloads, chunk_size=BULK_CHUNK_SIZE, branch=None):
+    """Insert payloads with one multi-row insert per chunk.
+
+    A chunk that fails is retried row by row so a single bad row only
+    costs its own insert. Returns one {"success", "data"/"error"} entry per
+    payload, in input order.
+    """
+    storage = get_storage(branch)
+    results = []
+    for start in range(0, len(payloads), chunk_size):
+        chunk = payloads[start:start + chunk_size]
+        try:
+            rows = storage.insert(table, chunk)
+            results.extend({"success": True, "data": row} for row in rows)
+        except Exception:
+            for payload in chunk:
+                try:
+                    rows = storage.insert(table, [payload])
+                    results.append({"success": True, "data": rows[0] if rows else payload})
+                except Exception as e:
+                    results.append({"success": False, "error": str(e)})
+    return results
+
 # -------------------- Gymrats Table --------------------
-def add_member(name, phone, plan, start_date=None, end_date=None):
+def member_payload(name, phone, plan, start_date=None, end_date=None):
     if start_date is None:
         start_date = date.today()
-    payload = {
+    return {
         "name": name,
         "phone": phone,
         "plan": plan,
         "start_date": to_iso(start_date),
         "end_date": to_iso(end_date) if end_date else None
     }
+
+@timed
+def add_member(name, phone, plan, start_date=None, end_date=None, branch=None):
+    payload = member_payload(name, phone, plan, start_date, end_date)
+    try:
+        rows = get_storage(branch).insert("gymrats", [payload])
+        invalidate_members()
+        return {"success": True, "data": rows}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@timed
+def add_members_bulk(members, chunk_size=BULK_CHUNK_SIZE, branch=None):
+    """Insert many members (dicts of add_member arguments) with chunked multi-row inserts."""
     try:
-        resp = supabase.table("gymrats").insert(payload).execute()
-        return {"success": True, "data": resp.data}
+        payloads = [member_payload(**m) for m in members]
+        results = insert_in_chunks("gymrats", payloads, chunk_size, branch)
+        invalidate_members()
+        return {"success": True, "data": results}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def get_all_members(order_by="start_date"):
+@timed
+def add_members_once(payloads, branch=None):
+    """Insert write-queue member payloads (each carrying its own id) at most once.
+
+    data is {"inserted": rows written now, "existing": rows stored by an
+    earlier attempt}; on failure `permanent` says whether a retry can help.
+    """
+    try:
+        inserted, existing = get_storage(branch).insert_once("gymrats", payloads, "id")
+        if inserted:
+            invalidate_members()
+        return {"success": True, "data": {"inserted": inserted, "existing": existing}}
+    except Exception as e:
+        return {"success": False, "error": str(e), "permanent": is_permanent(e, branch)}
+
+@cached("gymrats:list")
+@timed
+def get_all_members(order_by="start_date", branch=None):
+    try:
+        rows = get_storage(branch).select("gymrats", order_by=order_by)
+        return {"success": True, "data": rows}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@cached("gymrats:page")
+@timed
+def get_members_page(limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None, plan=None,
+                     status=None, start_from=None, start_to=None, branch=None):
+    """Fetch one page of members, newest start_date first, with filters pushed down to the backend."""
+    try:
+        limit, after = page_args(limit, cursor)
+        storage = get_storage(branch)
+        rows = storage.select("gymrats", select_columns(fields, MEMBER_FIELDS, "start_date"),
+                              member_filters(plan, status, start_from, start_to),
+                              order_by="start_date", limit=limit + 1, after=after)
+        rows, next_cursor = split_page(rows, "start_date", limit)
+        return {"success": True, "data": rows, "next_cursor": next_cursor}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+def select_members(filters, include_payments=False, payment_limit=PAYMENT_HISTORY_LIMIT, branch=None):
+    """Member rows, with their latest payments embedded in the same query when asked."""
+    storage = get_storage(branch)
+    if include_payments:
+        return storage.select_embedded("gymrats", filters, "payments", "gymrat_id",
+                                       order_by="payment_date", limit=payment_limit)
+    return storage.select("gymrats", filters=filters)
+
+@cached("gymrats:detail", scope="member_id")
+@timed
+def get_member(member_id, include_payments=False, payment_limit=PAYMENT_HISTORY_LIMIT, branch=None):
+    """One member (data is None when the id is unknown)."""
+    try:
+        rows = select_members([("id", "eq", str(member_id))], include_payments, payment_limit, branch)
+        return {"success": True, "data": rows[0] if rows else None}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@timed
+def get_members_by_ids(member_ids, include_payments=False, payment_limit=PAYMENT_HISTORY_LIMIT, branch=None):
+    """Many members by id, one query per LOOKUP_CHUNK_SIZE ids; unknown ids are left out."""
     try:
-        resp = supabase.table("gymrats").select("*").order(order_by, desc=True).execute()
-        return {"success": True, "data": resp.data}
+        ids = list(dict.fromkeys(str(i) for i in member_ids))
+        rows = []
+        for start in range(0, len(ids), LOOKUP_CHUNK_SIZE):
+            rows.extend(select_members([("id", "in", ids[start:start + LOOKUP_CHUNK_SIZE])],
+                                       include_payments, payment_limit, branch))
+        return {"success": True, "data": rows}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def update_member(member_id, new_plan, new_end_date=None):
+def member_update_payload(new_plan, new_end_date=None):
     payload = {
         "plan": new_plan,
         "end_date": to_iso(new_end_date) if new_end_date else None
     }
+    # A renewal unflags the member in the same write (the column only exists in flag mode).
+    if EXPIRY_SWEEP_MODE == "flag" and new_end_date and str(payload["end_date"])[:10] >= date.today().isoformat():
+        payload["expired"] = False
+    return payload
+
+@timed
+def update_member(member_id, new_plan, new_end_date=None, branch=None):
+    payload = member_update_payload(new_plan, new_end_date)
+    try:
+        rows = get_storage(branch).update("gymrats", payload, [("id", "eq", str(member_id))])
+        invalidate_members()
+        return {"success": True, "data": rows}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@timed
+def delete_member(member_id, branch=None):
+    try:
+        rows = get_storage(branch).delete("gymrats", [("id", "eq", str(member_id))])
+        invalidate_members()
+        return {"success": True, "data": rows}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@timed
+def set_members_expired(member_ids, expired=True, branch=None):
+    """Set the `expired` flag on many members with one query."""
+    try:
+        rows = get_storage(branch).update("gymrats", {"expired": expired}, [("id", "in", [str(i) for i in member_ids])])
+        invalidate_members()
+        return {"success": True, "data": rows}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@timed
+def set_members_plans(groups, branch=None):
+    """Move members to a new plan and end date with one update per group (and LOOKUP_CHUNK_SIZE ids).
+
+    `groups` maps (plan, end_date, current_end_date) to member ids. Only
+    members whose end_date is still current_end_date are updated, so a
+    member changed by someone else since it was read is not extended
+    twice. A chunk that fails is reported per id; the others still apply.
+    """
+    try:
+        storage = get_storage(branch)
+        rows, failed = [], {}
+        for (plan, end_date, current_end_date), ids in groups.items():
+            payload = member_update_payload(plan, end_date)
+            guard = [("end_date", "eq", to_iso(current_end_date))] if current_end_date else []
+            for start in range(0, len(ids), LOOKUP_CHUNK_SIZE):
+                chunk = [str(i) for i in ids[start:start + LOOKUP_CHUNK_SIZE]]
+                try:
+                    rows.extend(storage.update("gymrats", payload, [("id", "in", chunk), *guard]))
+                except Exception as e:
+                    failed.update(dict.fromkeys(chunk, str(e)))
+        invalidate_members()
+        return {"success": True, "data": {"updated": rows, "failed": failed}}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@timed
+def count_members(plan=None, status=None, start_from=None, start_to=None, branch=None):
+    """Members matching the list filters, counted by the database."""
     try:
-        resp = supabase.table("gymrats").update(payload).eq("id", str(member_id)).execute()
-        return {"success": True, "data": resp.data}
+        result = get_storage(branch).aggregate("gymrats", member_filters(plan, status, start_from, start_to))
+        return {"success": True, "data": {"count": result["count"]}}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def delete_member(member_id):
+@timed
+def delete_members(member_ids, branch=None):
+    """Delete many members with one query.
+
+    When the batch fails for good (a member still has payments, which the
+    foreign key protects), it is retried member by member so the others
+    are still deleted; `failed` maps the ids that could not be to errors.
+    """
     try:
-        resp = supabase.table("gymrats").delete().eq("id", str(member_id)).execute()
-        return {"success": True, "data": resp.data}
+        storage = get_storage(branch)
+        ids = [str(i) for i in member_ids]
+        failed = {}
+        try:
+            rows = storage.delete("gymrats", [("id", "in", ids)])
+        except Exception as e:
+            if not storage.is_permanent(e):
+                raise
+            rows = []
+            for member_id in ids:
+                try:
+                    rows.extend(storage.delete("gymrats", [("id", "eq", member_id)]))
+                except Exception as row_error:
+                    if not storage.is_permanent(row_error):
+                        raise
+                    failed[member_id] = str(row_error)
+        invalidate_members()
+        return {"success": True, "data": rows, "failed": failed}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 # -------------------- Payments Table --------------------
-def add_payment(member_id, amount, payment_date=None, method=None):
+def payment_payload(member_id, amount, payment_date=None, method=None):
     if payment_date is None:
         payment_date = datetime.now()
     payload = {
@@ -71,29 +359,138 @@ def add_payment(member_id, amount, payment_date=None, method=None):
     }
     if method:
         payload["method"] = method
+    return payload
+
+@timed
+def add_payment(member_id, amount, payment_date=None, method=None, branch=None):
+    payload = payment_payload(member_id, amount, payment_date, method)
+    try:
+        rows = get_storage(branch).insert("payments", [payload])
+        invalidate_payments([payload["gymrat_id"]])
+        return {"success": True, "data": rows}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@timed
+def add_payments_bulk(payments, chunk_size=BULK_CHUNK_SIZE, branch=None):
+    """Insert many payments (dicts of add_payment arguments) with chunked multi-row inserts."""
+    try:
+        payloads = [payment_payload(**p) for p in payments]
+        results = insert_in_chunks("payments", payloads, chunk_size, branch)
+        invalidate_payments([p["gymrat_id"] for p in payloads])
+        return {"success": True, "data": results}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@timed
+def add_payments_once(payloads, branch=None):
+    """Insert write-queue payment payloads at most once, keyed on their idempotency_key."""
+    try:
+        inserted, existing = get_storage(branch).insert_once("payments", payloads, "idempotency_key")
+        if inserted:
+            invalidate_payments([row["gymrat_id"] for row in inserted])
+        return {"success": True, "data": {"inserted": inserted, "existing": existing}}
+    except Exception as e:
+        return {"success": False, "error": str(e), "permanent": is_permanent(e, branch)}
+
+@cached("payments:list")
+@timed
+def get_all_payments(order_by="payment_date", branch=None):
+    try:
+        rows = get_storage(branch).select("payments", order_by=order_by)
+        return {"success": True, "data": rows}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@cached("payments:page")
+@timed
+def get_payments_page(limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None, method=None,
+                      member_id=None, date_from=None, date_to=None, branch=None):
+    """Fetch one page of payments, newest payment_date first, with filters pushed down to the backend."""
+    try:
+        limit, after = page_args(limit, cursor)
+        storage = get_storage(branch)
+        rows = storage.select("payments", select_columns(fields, PAYMENT_FIELDS, "payment_date"),
+                              payment_filters(method, member_id, date_from, date_to),
+                              order_by="payment_date", limit=limit + 1, after=after)
+        rows, next_cursor = split_page(rows, "payment_date", limit)
+        return {"success": True, "data": rows, "next_cursor": next_cursor}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+@cached("payments:member", scope="member_id")
+@timed
+def get_payments_by_member(member_id, limit=None, branch=None):
+    """A member's payments, newest first (at most `limit` when given)."""
     try:
-        resp = supabase.table("payments").insert(payload).execute()
-        return {"success": True, "data": resp.data}
+        storage = get_storage(branch)
+        rows = storage.select("payments", filters=[("gymrat_id", "eq", str(member_id))],
+                              order_by="payment_date", limit=limit)
+        return {"success": True, "data": rows}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def get_all_payments(order_by="payment_date"):
+@timed
+def delete_payment(payment_id, branch=None):
     try:
-        resp = supabase.table("payments").select("*").order(order_by, desc=True).execute()
-        return {"success": True, "data": resp.data}
+        rows = get_storage(branch).delete("payments", [("id", "eq", str(payment_id))])
+        invalidate_payments([row["gymrat_id"] for row in rows] if rows else None)
+        return {"success": True, "data": rows}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def get_payments_by_member(member_id):
+@timed
+def get_payment_totals(method=None, member_id=None, date_from=None, date_to=None, branch=None):
+    """Count and sum of the payments matching the list filters, computed by the database."""
     try:
-        resp = supabase.table("payments").select("*").eq("gymrat_id", str(member_id)).execute()
-        return {"success": True, "data": resp.data}
+        result = get_storage(branch).aggregate("payments", payment_filters(method, member_id, date_from, date_to),
+                                               "amount")
+        return {"success": True, "data": {"count": result["count"], "sum": result["sum"]}}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
-def delete_payment(payment_id):
+# -------------------- Checkins Table --------------------
+@timed
+def add_checkins(payloads, chunk_size=BULK_CHUNK_SIZE, branch=None):
+    """Insert check-ins in order with one multi-row insert per chunk.
+
+    A chunk the database refuses for good (e.g. a deleted member) is retried
+    row by row and its bad rows come back under "rejected". Any other error
+    stops the call; data["stored"] counts the payloads handled before it, so
+    the caller can keep the rest for a retry.
+    """
+    stored, rejected = 0, []
+    try:
+        storage = get_storage(branch)
+        for start in range(0, len(payloads), chunk_size):
+            chunk = payloads[start:start + chunk_size]
+            try:
+                storage.insert("checkins", chunk)
+            except Exception as e:
+                if not storage.is_permanent(e):
+                    raise
+                for payload in chunk:
+                    try:
+                        storage.insert("checkins", [payload])
+                    except Exception as row_error:
+                        if not storage.is_permanent(row_error):
+                            raise
+                        rejected.append({**payload, "error": str(row_error)})
+                    stored += 1  # counted per row, so a failure part way only leaves the rest
+            stored = start + len(chunk)
+        return {"success": True, "data": {"stored": stored, "rejected": rejected}}
+    except Exception as e:
+        return {"success": False, "error": str(e), "data": {"stored": stored, "rejected": rejected}}
+
+@timed
+def get_checkins_page(limit=MAX_PAGE_SIZE, cursor=None, since=None, branch=None):
+    """Check-ins newest first, from `since` on; returns next_cursor for the following page."""
     try:
-        resp = supabase.table("payments").delete().eq("id", str(payment_id)).execute()
-        return {"success": True, "data": resp.data}
+        limit, after = page_args(limit, cursor)
+        filters = [("checked_in_at", "gte", to_iso(since))] if since else []
+        rows = get_storage(branch).select("checkins", ",".join(CHECKIN_FIELDS), filters=filters,
+                                          order_by="checked_in_at", limit=limit + 1, after=after)
+        rows, next_cursor = split_page(rows, "checked_in_at", limit)
+        return {"success": True, "data": rows, "next_cursor": next_cursor}
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -0,0 +1,82 @@
+import orjson
+from operator import itemgetter
+
+try:
+    import msgpack
+except ImportError:  # MessagePack responses are optional
+    msgpack = None
+
+# -------------------- Setup --------------------
+# List routes answer in the format asked for with ?format= or the Accept
+# header. "columnar" is JSON with one array per column instead of one
+# object per row, so field names are sent once per page instead of once per
+# row.
+MEDIA_TYPES = {
+    "json": "application/json",
+    "columnar": "application/vnd.gymrat.columnar+json",
+    "msgpack": "application/msgpack",
+}
+ACCEPT_ALIASES = {"application/x-msgpack": "msgpack", "application/vnd.msgpack": "msgpack"}
+
+def available_formats():
+    return [f for f in MEDIA_TYPES if f != "msgpack" or msgpack is not None]
+
+def negotiate(accept, fmt=None):
+    """Response format for an Accept header; an explicit `fmt` wins.
+
+    Unknown or unavailable media types fall back to JSON, which every
+    client understands; an unknown explicit `fmt` is an error.
+    """
+    formats = available_formats()
+    if fmt is not None:
+        if fmt not in formats:
+            raise ValueError(f"Unsupported format '{fmt}'. Use one of: {', '.join(formats)}.")
+        return fmt
+    by_type = {media: name for name, media in MEDIA_TYPES.items() if name in formats}
+    by_type.update({media: name for media, name in ACCEPT_ALIASES.items() if name in formats})
+    best, best_q = "json", 0.0
+    for part in (accept or "").split(","):
+        media, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media in by_type and q > best_q:
+            best, best_q = by_type[media], q
+    return best
+
+# -------------------- Encoders --------------------
+def _default(value):
+    return str(value)
+
+def to_columns(rows):
+    """{field: [values...]} for a list of row dicts; missing fields are null."""
+    fields = dict.fromkeys(field for row in rows[:1] for field in row)
+    try:  # a page normally selects the same fields for every row
+        if all(len(row) == len(fields) for row in rows):
+            return {field: list(map(itemgetter(field), rows)) for field in fields}
+    except KeyError:
+        pass
+    fields = dict.fromkeys(field for row in rows for field in row)
+    return {field: [row.get(field) for row in rows] for field in fields}
+
+def encode_json(content):
+    # orjson writes dates, datetimes and UUIDs natively.
+    return orjson.dumps(content, default=_default)
+
+def encode_columnar(content):
+    if isinstance(content.get("data"), list):
+        content = {**content, "data": to_columns(content["data"])}
+    return orjson.dumps(content, default=_default)
+
+def encode_msgpack(content):
+    return msgpack.packb(content, default=_default, datetime=False)
+
+ENCODERS = {"json": encode_json, "columnar": encode_columnar, "msgpack": encode_msgpack}
+
+def encode(content, fmt):
+    """Encode a manager envelope (with list `data`) as `fmt`; returns bytes."""
+    return ENCODERS[fmt](content)
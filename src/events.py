@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+from collections import deque
+
+# -------------------- Setup --------------------
+EVENT_TABLES = ("gymrats", "payments")
+EVENTS_BACKLOG = int(os.getenv("EVENTS_BACKLOG", "5000"))        # events kept for Last-Event-ID resumes
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "1000"))  # undelivered events before a client must resync
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", "15"))
+# Streams end after this long and the client reconnects with Last-Event-ID,
+# so open streams never hold up a shutdown or a deploy for long.
+EVENTS_MAX_STREAM = float(os.getenv("EVENTS_MAX_STREAM", "300"))
+
+def sse(data, event=None, event_id=None):
+    """One server-sent event, encoded."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {data}")
+    return ("\n".join(lines) + "\n\n").encode()
+
+class Subscription:
+    def __init__(self, tables, size, last_seq):
+        self.tables = set(tables)
+        self.queue = asyncio.Queue(size)
+        self.last_seq = last_seq  # events up to here were replayed already
+        self.overflowed = False
+
+# -------------------- Feed --------------------
+class ChangeFeed:
+    """In-process pub/sub of member and payment writes.
+
+    Manager write listeners publish one event per write, with every row it
+    touched. An event is encoded once and the same bytes go to every
+    subscriber. Ids are "<epoch>-<seq>"; the epoch changes on every process
+    start, so a client resuming against another process knows its copy
+    must be reloaded. Recent events are kept so a reconnecting client only
+    receives what it missed.
+    """
+
+    def __init__(self, backlog=EVENTS_BACKLOG, queue_size=EVENTS_QUEUE_SIZE):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.queue_size = queue_size
+        self.published = 0
+        self._seq = 0
+        self._backlog = deque(maxlen=backlog)  # (seq, table, message)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._loop = None
+
+    def bind(self, loop):
+        """Deliver on `loop` (call from the lifespan)."""
+        self._loop = loop
+
+    def stats(self):
+        return {"subscribers": len(self._subscribers), "published": self.published, "epoch": self.epoch,
+                "seq": self._seq}
+
+    def listener(self, table):
+        """A manager write listener that publishes `table` changes."""
+        def on_write(event, rows):
+            if rows:
+                self.publish(table, event, rows)
+        return on_write
+
+    def publish(self, table, event, rows):
+        data = json.dumps({"table": table, "op": event, "rows": rows}, default=str)
+        with self._lock:
+            self._seq += 1
+            message = sse(data, "change", f"{self.epoch}-{self._seq}")
+            self._backlog.append((self._seq, table, message))
+            self.published += 1
+            loop = self._loop
+            # Listeners run on worker threads as well as on the loop; scheduling
+            # under the lock keeps deliveries in sequence order.
+            if loop is not None and not loop.is_closed():
+                loop.call_soon_threadsafe(self._deliver, self._seq, table, message)
+
+    def _deliver(self, seq, table, message):
+        for sub in list(self._subscribers):
+            if table not in sub.tables or seq <= sub.last_seq or sub.overflowed:
+                continue
+            try:
+                sub.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # A full queue means the stream is not blocked; it sees the flag on its next get.
+                sub.overflowed = True
+
+    def subscribe(self, tables, last_event_id=None):
+        """Returns (subscription, replay); replay is None when the client must reload instead."""
+        with self._lock:
+            replay = self._replay(tables, last_event_id)
+            sub = Subscription(tables, self.queue_size, self._seq)
+            self._subscribers.add(sub)
+        return sub, replay
+
+    def unsubscribe(self, sub):
+        self._subscribers.discard(sub)
+
+    def _replay(self, tables, last_event_id):
+        if not last_event_id:
+            return []
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq >= self._seq:
+            return []
+        if not self._backlog or self._backlog[0][0] > seq + 1:
+            return None  # the missed events were already dropped from the backlog
+        return [message for s, table, message in self._backlog if s > seq and table in tables]
+
+    async def stream(self, tables, last_event_id=None, max_stream=EVENTS_MAX_STREAM, heartbeat=EVENTS_HEARTBEAT):
+        """Server-sent event body for one client."""
+        sub, replay = self.subscribe(tables, last_event_id)
+        try:
+            yield b"retry: 1000\n\n"
+            if replay is None:
+                yield self._reset("resync", sub.last_seq)
+            else:
+                for message in replay:
+                    yield message
+            deadline = time.monotonic() + max_stream
+            while time.monotonic() < deadline:
+                try:
+                    message = await asyncio.wait_for(sub.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if sub.overflowed:
+                    yield self._reset("overflow", self._seq)
+                    return
+                if message is None:  # feed closed
+                    return
+                yield message
+        finally:
+            self.unsubscribe(sub)
+
+    def _reset(self, reason, seq):
+        # The client reloads its copy, then resumes after `seq`.
+        return sse(json.dumps({"reason": reason}), "reset", f"{self.epoch}-{seq}")
+
+    def close(self):
+        """End every open stream (on shutdown)."""
+        for sub in list(self._subscribers):
+            try:
+                sub.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                sub.overflowed = True
@@ -0,0 +1,214 @@
+import os
+import re
+import bisect
+import asyncio
+import logging
+import threading
+from datetime import date, timedelta
+from src.startup import load_until_ready
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Setup --------------------
+# EXPIRY_SWEEP_MODE: "off" (index only), "flag" (set gymrats.expired = true,
+# needs the `expired` column from the README) or "delete".
+EXPIRY_SWEEP_MODE = os.getenv("EXPIRY_SWEEP_MODE", "off")
+EXPIRY_SWEEP_INTERVAL = float(os.getenv("EXPIRY_SWEEP_INTERVAL", "3600"))
+EXPIRY_BATCH_SIZE = int(os.getenv("EXPIRY_BATCH_SIZE", "500"))
+
+def index_fields(mode=EXPIRY_SWEEP_MODE):
+    """Member columns the index keeps; `expired` only exists in flag mode."""
+    fields = ["name", "phone", "plan", "end_date"]
+    if mode == "flag":
+        fields.append("expired")
+    return fields
+
+def parse_within(value):
+    """Turn "7", "7d" or "2w" into a number of days."""
+    match = re.fullmatch(r"(\d+)([dw]?)", value.strip())
+    if not match:
+        raise ValueError(f"Invalid duration '{value}', expected e.g. 7d or 2w.")
+    days = int(match.group(1))
+    return days * 7 if match.group(2) == "w" else days
+
+def to_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+def is_indexed(end, expired, today):
+    """Whether a member belongs in the index; an expired flag on a current term is stale."""
+    return end is not None and (not expired or end >= today)
+
+# -------------------- Index --------------------
+class ExpiryIndex:
+    """Members sorted by end_date for O(log n) range lookups.
+
+    Built once from a full scan, then kept current through GymratManager
+    write listeners. Members already flagged as expired are left out,
+    unless their end_date is today or later (renewed, not yet unflagged).
+    """
+
+    def __init__(self):
+        self._keys = []   # sorted (end_date, id)
+        self._rows = {}   # id -> row
+        self._lock = threading.Lock()
+        self._pending = []  # writes seen while a load was running
+        self._loading = False
+        self.ready = False
+
+    def __len__(self):
+        return len(self._rows)
+
+    def load(self, rows):
+        with self._lock:
+            self._loading = True
+        try:
+            keys, by_id = [], {}
+            today = date.today()
+            for row in rows:
+                end = to_date(row.get("end_date"))
+                if is_indexed(end, row.get("expired"), today):
+                    keys.append((end, str(row["id"])))
+                    by_id[str(row["id"])] = row
+            keys.sort()
+        except Exception:
+            with self._lock:
+                self._loading, self._pending = False, []
+            raise
+        with self._lock:
+            self._loading = False
+            self._keys, self._rows = keys, by_id
+            pending, self._pending = self._pending, []
+            for event, row in pending:
+                self._apply(event, row)
+            self.ready = True
+
+    def on_write(self, event, rows):
+        """GymratManager listener."""
+        with self._lock:
+            for row in rows:
+                if self.ready:
+                    self._apply(event, row)
+                elif self._loading:  # before a load starts its scan sees the write anyway
+                    self._pending.append((event, row))
+
+    def remove(self, member_id):
+        with self._lock:
+            self._remove(str(member_id))
+
+    def is_active(self, member_id, day):
+        """Whether `member_id` has a membership running on `day` (an end_date of `day` or later)."""
+        row = self._rows.get(member_id)
+        return row is not None and to_date(row.get("end_date")) >= day
+
+    def expiring(self, start, end):
+        """Rows with start <= end_date <= end, soonest first."""
+        with self._lock:
+            lo = bisect.bisect_left(self._keys, (start, ""))
+            hi = bisect.bisect_right(self._keys, (end, "\uffff"))
+            return [self._rows[member_id] for _, member_id in self._keys[lo:hi]]
+
+    def expired_before(self, day, limit):
+        """Up to `limit` rows whose end_date is before `day`."""
+        with self._lock:
+            hi = bisect.bisect_left(self._keys, (day, ""))
+            return [self._rows[member_id] for _, member_id in self._keys[:min(hi, limit)]]
+
+    def _apply(self, event, row):
+        member_id = str(row.get("id"))
+        self._remove(member_id)
+        if event == "delete":
+            return
+        merged = {**self._rows.get(member_id, {}), **row}
+        end = to_date(merged.get("end_date"))
+        if is_indexed(end, merged.get("expired"), date.today()):
+            bisect.insort(self._keys, (end, member_id))
+            self._rows[member_id] = merged
+
+    def _remove(self, member_id):
+        row = self._rows.pop(member_id, None)
+        if row is None:
+            return
+        key = (to_date(row.get("end_date")), member_id)
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+
+# -------------------- Sweeper --------------------
+class ExpirySweeper:
+    """Background task that loads the index and retires expired members in batches."""
+
+    def __init__(self, index, manager, mode=EXPIRY_SWEEP_MODE,
+                 interval=EXPIRY_SWEEP_INTERVAL, batch_size=EXPIRY_BATCH_SIZE):
+        self.index = index
+        self.manager = manager
+        self.mode = mode
+        self.interval = interval
+        self.batch_size = batch_size
+        self._restore = set()
+        self._lock = threading.Lock()
+        self._task = None
+
+    def on_write(self, event, rows):
+        """GymratManager listener: a renewed member that was flagged gets unflagged."""
+        if self.mode != "flag" or event != "update":
+            return
+        today = date.today()
+        with self._lock:
+            for row in rows:
+                end = to_date(row.get("end_date"))
+                if row.get("expired") and end is not None and end >= today:
+                    self._restore.add(str(row["id"]))
+
+    def sweep_once(self, today=None):
+        """Expire everything that ended before `today`; returns the number of members processed."""
+        today = today or date.today()
+        with self._lock:
+            restore, self._restore = list(self._restore), set()
+        for start in range(0, len(restore), self.batch_size):
+            self.manager.restore_members(restore[start:start + self.batch_size])
+
+        processed = 0
+        while True:
+            due = self.index.expired_before(today, self.batch_size)
+            if not due:
+                break
+            ids = [row["id"] for row in due]
+            result = self.manager.expire_members(ids, self.mode)
+            if not result["success"]:
+                logger.error("Expiry sweep failed: %s", result.get("error"))
+                break
+            if result["failed"]:
+                # Kept (e.g. members with payment history); they stay out of
+                # the index so the next batch does not retry them.
+                logger.warning("Expiry sweep kept %d members: %s", len(result["failed"]),
+                               next(iter(result["failed"].values())))
+            for member_id in ids:  # also drop ids the backend did not return
+                self.index.remove(member_id)
+            processed += len(ids) - len(result["failed"])
+        if processed:
+            logger.info("Expiry sweep %s %d members", self.mode, processed)
+        return processed
+
+    async def run(self):
+        await load_until_ready("expiry index", lambda: self.index.load(self.manager.iter_members(index_fields(self.mode))),
+                               lambda: self.index.ready)
+        logger.info("Expiry index loaded with %d members", len(self.index))
+        while self.mode in ("flag", "delete"):
+            try:
+                await asyncio.to_thread(self.sweep_once)
+            except Exception:
+                logger.exception("Expiry sweep crashed")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
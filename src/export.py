@@ -0,0 +1,120 @@
+import io
+import csv
+import json
+from src.db import MEMBER_FIELDS, PAYMENT_FIELDS
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+# -------------------- Setup --------------------
+MEMBER_EXPORT_FIELDS = ["id", "name", "age", "phone", "plan", "start_date", "end_date"]
+PAYMENT_EXPORT_FIELDS = ["id", "gymrat_id", "amount", "payment_date", "method"]
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# Numeric columns get a real Parquet type; everything else is written as text.
+NUMERIC_COLUMNS = {"age": "int64", "amount": "float64"}
+
+def available_formats():
+    return [f for f in MEDIA_TYPES if f != "parquet" or pa is not None]
+
+# -------------------- Encoders --------------------
+async def encode_csv(pages, fields):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    async for rows in pages:
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+async def encode_ndjson(pages, fields):
+    async for rows in pages:
+        yield "".join(json.dumps({f: row.get(f) for f in fields}, default=str) + "\n" for row in rows).encode()
+
+class _Drain:
+    """Write-only sink for ParquetWriter that hands bytes back as they are produced.
+
+    Parquet footers store absolute offsets, so tell() keeps counting while
+    the buffered bytes are drained between row groups.
+    """
+
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+async def encode_parquet(pages, fields):
+    schema = pa.schema([(f, getattr(pa, NUMERIC_COLUMNS[f])() if f in NUMERIC_COLUMNS else pa.string())
+                        for f in fields])
+    sink = _Drain()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema)
+    async for rows in pages:
+        columns = {f: [row.get(f) if f in NUMERIC_COLUMNS or row.get(f) is None else str(row.get(f))
+                       for row in rows] for f in fields}
+        writer.write_table(pa.table(columns, schema=schema))  # one row group per page
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+ENCODERS = {"csv": encode_csv, "ndjson": encode_ndjson, "parquet": encode_parquet}
+
+def check(fmt, fields, allowed):
+    """Raise ValueError for unknown fields or an unavailable format."""
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if fmt not in available_formats():
+        raise ValueError(f"Unsupported export format '{fmt}'. Available: {', '.join(available_formats())}.")
+
+async def prefetch(pages):
+    """Fetch the first page of `pages` now; returns an async iterator over every page.
+
+    A database error on the first page then raises before the response
+    has sent its status, instead of truncating a 200 body.
+    """
+    first = await anext(pages)
+
+    async def chained():
+        yield first
+        async for rows in pages:
+            yield rows
+    return chained()
+
+def encode(pages, fmt, fields, allowed):
+    """Stream an async iterable of row pages as `fmt`, one page in memory at a time.
+
+    Arguments are validated up front because errors raised once the
+    response has started streaming can only abort the connection.
+    """
+    check(fmt, fields, allowed)
+    return ENCODERS[fmt](pages, fields)
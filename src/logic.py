@@ -1,60 +1,620 @@
+import asyncio
+import logging
+import calendar
+from datetime import date, timedelta
+from src import async_db
+from src.branches import check_branch
 from src.db import (
-    add_member, get_all_members, update_member, delete_member,
-    add_payment, get_all_payments, get_payments_by_member, delete_payment
+    add_member, add_members_bulk, get_all_members, get_members_page, update_member, delete_member,
+    delete_members, set_members_expired, set_members_plans, get_member, get_members_by_ids, PAYMENT_HISTORY_LIMIT,
+    add_members_once, add_payments_once, payment_payload,
+    add_payment, add_payments_bulk, get_all_payments, get_payments_page, get_payments_by_member, delete_payment,
+    add_checkins, get_checkins_page, count_members, get_payment_totals,
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, BULK_CHUNK_SIZE, MAX_BULK_CHUNK_SIZE
 )
 
+logger = logging.getLogger(__name__)
+
+def bulk_report(results, noun):
+    """Summarise per-row insert results into the manager response shape."""
+    inserted = sum(1 for r in results if r["success"])
+    failed = len(results) - inserted
+    return {
+        "success": True,
+        "message": f"Inserted {inserted} {noun}, {failed} failed.",
+        "inserted": inserted,
+        "failed": failed,
+        "results": results,
+    }
+
+def once_report(result, payloads, key, describe):
+    """One add_* style response per write-queue payload from an add_*_once result."""
+    stored = {str(row[key]): row for row in result["data"]["inserted"] + result["data"]["existing"]}
+    responses = []
+    for payload in payloads:
+        row = stored.get(str(payload[key]))
+        if row is None:
+            responses.append({"success": False, "message": "Row was not stored.", "permanent": False})
+        else:
+            responses.append({"success": True, "message": describe(payload), "data": [row]})
+    return {"success": True, "data": responses}
+
+class WriteListeners:
+    """Mixin that lets in-process indexes follow a manager's successful writes.
+
+    Listeners are called as `listener(event, rows)` with event one of
+    "insert", "update" or "delete" and the rows returned by the database.
+    """
+
+    def __init__(self):
+        self._listeners = []
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def _notify(self, event, rows):
+        for listener in self._listeners:
+            try:
+                listener(event, rows or [])
+            except Exception:
+                logger.exception("Write listener %r failed on %s", listener, event)
+
+# Each manager method comes in a sync flavour (src.db) and an `_async`
+# flavour (src.async_db); both shape the db result through the same
+# private `_..._response` helper so the two paths cannot drift apart.
+# A manager serves one branch: every call goes to that branch's partition
+# and its listeners only hear about that branch's writes.
+# Counts and sums come from the branch's SnapshotStore (src.snapshot) once
+# it is loaded, without a query; until then the database computes them.
+
 # ===================== Gymrat Manager =====================
-class GymratManager:
-    """Handles all operations related to gym members."""
+class GymratManager(WriteListeners):
+    """Handles all operations related to gym members of one branch."""
 
-    def add_member(self, name, phone, plan, start_date=None, end_date=None):
-        result = add_member(name, phone, plan, start_date, end_date)
+    def __init__(self, branch=None, snapshots=None):
+        super().__init__()
+        self.branch = check_branch(branch)
+        self.snapshots = snapshots
+
+    # ---- response shaping ----
+    def _added_response(self, name, result):
         if result["success"]:
+            self._notify("insert", result["data"])
             return {"success": True, "message": f"Member '{name}' added successfully.", "data": result["data"]}
         return {"success": False, "message": f"Failed to add member '{name}'.", "error": result.get("error")}
 
-    def get_all_members(self):
-        result = get_all_members()
+    def _list_response(self, result):
         if result["success"]:
             return {"success": True, "data": result["data"], "message": "Fetched all members successfully."}
         return {"success": False, "message": "Failed to fetch members.", "error": result.get("error")}
 
-    def update_member(self, member_id, new_plan, new_end_date=None):
-        result = update_member(member_id, new_plan, new_end_date)
+    def _count_response(self, result, source="database"):
         if result["success"]:
+            return {"success": True, "data": result["data"], "source": source,
+                    "message": f"Counted {result['data']['count']} members."}
+        return {"success": False, "message": "Failed to count members.", "error": result.get("error")}
+
+    def _snapshot_count(self, plan, status, start_from, start_to):
+        if self.snapshots is None or not self.snapshots.ready:
+            return None
+        count = self.snapshots.members.count(plan, status, start_from, start_to)
+        return self._count_response({"success": True, "data": {"count": count}}, "snapshot")
+
+    def _page_response(self, result):
+        if result["success"]:
+            return {"success": True, "data": result["data"], "next_cursor": result["next_cursor"],
+                    "message": f"Fetched {len(result['data'])} members."}
+        return {"success": False, "message": "Failed to fetch members.", "error": result.get("error")}
+
+    def _member_response(self, member_id, result):
+        if not result["success"]:
+            return {"success": False, "message": f"Failed to fetch member '{member_id}'.", "error": result.get("error")}
+        if result["data"] is None:
+            return {"success": True, "data": None, "message": f"Member '{member_id}' not found."}
+        return {"success": True, "data": result["data"], "message": f"Fetched member '{member_id}'."}
+
+    def _lookup_response(self, member_ids, result):
+        """Order lookup rows as requested and list the ids that matched nothing."""
+        if not result["success"]:
+            return {"success": False, "message": "Failed to look up members.", "error": result.get("error")}
+        by_id = {str(row["id"]): row for row in result["data"]}
+        requested = list(dict.fromkeys(str(i) for i in member_ids))
+        rows = [by_id[i] for i in requested if i in by_id]
+        missing = [i for i in requested if i not in by_id]
+        return {"success": True, "data": rows, "missing": missing,
+                "message": f"Found {len(rows)} of {len(requested)} members."}
+
+    def _updated_response(self, member_id, result):
+        if result["success"]:
+            self._notify("update", result["data"])
             return {"success": True, "message": f"Member '{member_id}' updated successfully.", "data": result["data"]}
         return {"success": False, "message": f"Failed to update member '{member_id}'.", "error": result.get("error")}
 
-    def delete_member(self, member_id):
-        result = delete_member(member_id)
+    def _deleted_response(self, member_id, result):
         if result["success"]:
+            self._notify("delete", result["data"])
             return {"success": True, "message": f"Member '{member_id}' deleted successfully.", "data": result["data"]}
         return {"success": False, "message": f"Failed to delete member '{member_id}'.", "error": result.get("error")}
 
+    # ---- sync ----
+    def add_member(self, name, phone, plan, start_date=None, end_date=None):
+        return self._added_response(name, add_member(name, phone, plan, start_date, end_date, branch=self.branch))
+
+    def add_members_bulk(self, members, chunk_size=BULK_CHUNK_SIZE):
+        result = add_members_bulk(members, chunk_size, branch=self.branch)
+        if result["success"]:
+            self._notify("insert", [r["data"] for r in result["data"] if r["success"]])
+            return bulk_report(result["data"], "members")
+        return {"success": False, "message": "Failed to add members.", "error": result.get("error")}
+
+    def add_members_once(self, payloads):
+        """Write queued member payloads; listeners only hear about rows stored by this call."""
+        result = add_members_once(payloads, branch=self.branch)
+        if not result["success"]:
+            return result
+        self._notify("insert", result["data"]["inserted"])
+        return once_report(result, payloads, "id", lambda p: f"Member '{p['name']}' added successfully.")
+
+    def get_all_members(self):
+        return self._list_response(get_all_members(branch=self.branch))
+
+    def get_members_page(self, limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None, plan=None,
+                         status=None, start_from=None, start_to=None):
+        result = get_members_page(limit, cursor, fields, plan, status, start_from, start_to, branch=self.branch)
+        return self._page_response(result)
+
+    def get_member(self, member_id, include_payments=False, payment_limit=PAYMENT_HISTORY_LIMIT):
+        result = get_member(member_id, include_payments, payment_limit, branch=self.branch)
+        return self._member_response(member_id, result)
+
+    def lookup_members(self, member_ids, include_payments=False, payment_limit=PAYMENT_HISTORY_LIMIT):
+        result = get_members_by_ids(member_ids, include_payments, payment_limit, branch=self.branch)
+        return self._lookup_response(member_ids, result)
+
+    def update_member(self, member_id, new_plan, new_end_date=None):
+        return self._updated_response(member_id, update_member(member_id, new_plan, new_end_date, branch=self.branch))
+
+    def delete_member(self, member_id):
+        return self._deleted_response(member_id, delete_member(member_id, branch=self.branch))
+
+    def count_members(self, plan=None, status=None, start_from=None, start_to=None):
+        """Members matching the list filters."""
+        return (self._snapshot_count(plan, status, start_from, start_to)
+                or self._count_response(count_members(plan, status, start_from, start_to, branch=self.branch)))
+
+    def iter_members(self, fields=None, page_size=MAX_PAGE_SIZE):
+        """Yield every member page by page, bypassing the read cache (for index builds)."""
+        fetch = get_members_page.__wrapped__
+        cursor = None
+        while True:
+            result = fetch(page_size, cursor, fields, branch=self.branch)
+            if not result["success"]:
+                raise RuntimeError(result.get("error"))
+            yield from result["data"]
+            cursor = result["next_cursor"]
+            if cursor is None:
+                return
+
+    def expire_members(self, member_ids, mode="flag"):
+        """Flag or delete many expired members in one query."""
+        if mode == "delete":
+            result, event = delete_members(member_ids, branch=self.branch), "delete"
+        else:
+            result, event = set_members_expired(member_ids, True, branch=self.branch), "update"
+        if result["success"]:
+            self._notify(event, result["data"])
+            return {"success": True, "message": f"Expired {len(result['data'])} members ({mode}).",
+                    "data": result["data"], "failed": result.get("failed", {})}
+        return {"success": False, "message": "Failed to expire members.", "error": result.get("error")}
+
+    def restore_members(self, member_ids):
+        """Clear the expired flag of renewed members."""
+        result = set_members_expired(member_ids, False, branch=self.branch)
+        if result["success"]:
+            self._notify("update", result["data"])
+            return {"success": True, "message": f"Restored {len(result['data'])} members.", "data": result["data"]}
+        return {"success": False, "message": "Failed to restore members.", "error": result.get("error")}
+
+    def set_members_plans(self, groups):
+        """Apply grouped plan changes (see RenewalEngine); listeners hear about every updated row."""
+        result = set_members_plans(groups, branch=self.branch)
+        if result["success"]:
+            self._notify("update", result["data"]["updated"])
+        return result
+
+    # ---- async ----
+    async def add_member_async(self, name, phone, plan, start_date=None, end_date=None):
+        result = await async_db.add_member(name, phone, plan, start_date, end_date, branch=self.branch)
+        return self._added_response(name, result)
+
+    async def get_all_members_async(self):
+        return self._list_response(await async_db.get_all_members(branch=self.branch))
+
+    async def get_members_page_async(self, limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None, plan=None,
+                                     status=None, start_from=None, start_to=None):
+        result = await async_db.get_members_page(limit, cursor, fields, plan, status, start_from, start_to,
+                                                 branch=self.branch)
+        return self._page_response(result)
+
+    async def iter_member_pages_async(self, fields=None, page_size=MAX_PAGE_SIZE, **filters):
+        """Yield filtered member pages one at a time, bypassing the read cache (for exports)."""
+        fetch = async_db.get_members_page.__wrapped__
+        cursor = None
+        while True:
+            result = await fetch(page_size, cursor, fields, **filters, branch=self.branch)
+            if not result["success"]:
+                raise RuntimeError(result.get("error"))
+            yield result["data"]
+            cursor = result["next_cursor"]
+            if cursor is None:
+                return
+
+    async def get_member_async(self, member_id, include_payments=False, payment_limit=PAYMENT_HISTORY_LIMIT):
+        result = await async_db.get_member(member_id, include_payments, payment_limit, branch=self.branch)
+        return self._member_response(member_id, result)
+
+    async def lookup_members_async(self, member_ids, include_payments=False, payment_limit=PAYMENT_HISTORY_LIMIT):
+        result = await async_db.get_members_by_ids(member_ids, include_payments, payment_limit, branch=self.branch)
+        return self._lookup_response(member_ids, result)
+
+    async def update_member_async(self, member_id, new_plan, new_end_date=None):
+        result = await async_db.update_member(member_id, new_plan, new_end_date, branch=self.branch)
+        return self._updated_response(member_id, result)
+
+    async def delete_member_async(self, member_id):
+        return self._deleted_response(member_id, await async_db.delete_member(member_id, branch=self.branch))
+
+    async def count_members_async(self, plan=None, status=None, start_from=None, start_to=None):
+        return (self._snapshot_count(plan, status, start_from, start_to)
+                or self._count_response(await async_db.count_members(plan, status, start_from, start_to,
+                                                                     branch=self.branch)))
+
 # ===================== Payment Manager =====================
-class PaymentManager:
-    """Handles all operations related to payments."""
+class PaymentManager(WriteListeners):
+    """Handles all operations related to payments of one branch."""
 
-    def add_payment(self, member_id, amount, payment_date=None, method=None):
-        result = add_payment(member_id, amount, payment_date, method)
+    def __init__(self, branch=None, snapshots=None):
+        super().__init__()
+        self.branch = check_branch(branch)
+        self.snapshots = snapshots
+
+    # ---- response shaping ----
+    def _added_response(self, member_id, amount, result):
         if result["success"]:
+            self._notify("insert", result["data"])
             return {"success": True, "message": f"Payment of {amount} added for member '{member_id}'.", "data": result["data"]}
         return {"success": False, "message": f"Failed to add payment for member '{member_id}'.", "error": result.get("error")}
 
-    def get_all_payments(self):
-        result = get_all_payments()
+    def _list_response(self, result):
         if result["success"]:
             return {"success": True, "data": result["data"], "message": "Fetched all payments successfully."}
         return {"success": False, "message": "Failed to fetch payments.", "error": result.get("error")}
 
-    def get_payments_by_member(self, member_id):
-        result = get_payments_by_member(member_id)
+    def _page_response(self, result):
+        if result["success"]:
+            return {"success": True, "data": result["data"], "next_cursor": result["next_cursor"],
+                    "message": f"Fetched {len(result['data'])} payments."}
+        return {"success": False, "message": "Failed to fetch payments.", "error": result.get("error")}
+
+    def _totals_response(self, result, source="database"):
+        if result["success"]:
+            return {"success": True, "data": result["data"], "source": source,
+                    "message": f"Summed {result['data']['count']} payments."}
+        return {"success": False, "message": "Failed to sum payments.", "error": result.get("error")}
+
+    def _snapshot_totals(self, method, member_id, date_from, date_to):
+        if self.snapshots is None or not self.snapshots.ready:
+            return None
+        totals = self.snapshots.payments.totals(method, member_id, date_from, date_to)
+        return self._totals_response({"success": True, "data": totals}, "snapshot")
+
+    def _member_payments_response(self, member_id, result):
         if result["success"]:
             return {"success": True, "data": result["data"], "message": f"Fetched payments for member '{member_id}' successfully."}
         return {"success": False, "message": f"Failed to fetch payments for member '{member_id}'.", "error": result.get("error")}
 
-    def delete_payment(self, payment_id):
-        result = delete_payment(payment_id)
+    def _deleted_response(self, payment_id, result):
         if result["success"]:
+            self._notify("delete", result["data"])
             return {"success": True, "message": f"Payment '{payment_id}' deleted successfully.", "data": result["data"]}
         return {"success": False, "message": f"Failed to delete payment '{payment_id}'.", "error": result.get("error")}
+
+    # ---- sync ----
+    def add_payment(self, member_id, amount, payment_date=None, method=None):
+        result = add_payment(member_id, amount, payment_date, method, branch=self.branch)
+        return self._added_response(member_id, amount, result)
+
+    def add_payments_bulk(self, payments, chunk_size=BULK_CHUNK_SIZE):
+        result = add_payments_bulk(payments, chunk_size, branch=self.branch)
+        if result["success"]:
+            self._notify("insert", [r["data"] for r in result["data"] if r["success"]])
+            return bulk_report(result["data"], "payments")
+        return {"success": False, "message": "Failed to add payments.", "error": result.get("error")}
+
+    def add_payments_once(self, payloads):
+        """Write queued payment payloads; listeners only hear about rows stored by this call."""
+        result = add_payments_once(payloads, branch=self.branch)
+        if not result["success"]:
+            return result
+        self._notify("insert", result["data"]["inserted"])
+        return once_report(result, payloads, "idempotency_key",
+                           lambda p: f"Payment of {p['amount']} added for member '{p['gymrat_id']}'.")
+
+    def get_all_payments(self):
+        return self._list_response(get_all_payments(branch=self.branch))
+
+    def get_payments_page(self, limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None, method=None,
+                          member_id=None, date_from=None, date_to=None):
+        result = get_payments_page(limit, cursor, fields, method, member_id, date_from, date_to, branch=self.branch)
+        return self._page_response(result)
+
+    def get_payments_by_member(self, member_id, limit=None):
+        return self._member_payments_response(member_id, get_payments_by_member(member_id, limit, branch=self.branch))
+
+    def delete_payment(self, payment_id):
+        return self._deleted_response(payment_id, delete_payment(payment_id, branch=self.branch))
+
+    def payment_totals(self, method=None, member_id=None, date_from=None, date_to=None):
+        """Count and sum of the payments matching the list filters."""
+        return (self._snapshot_totals(method, member_id, date_from, date_to)
+                or self._totals_response(get_payment_totals(method, member_id, date_from, date_to, branch=self.branch)))
+
+    def iter_payment_pages(self, fields=None, page_size=MAX_PAGE_SIZE):
+        """Yield every payment page (a list of rows), bypassing the read cache."""
+        fetch = get_payments_page.__wrapped__
+        cursor = None
+        while True:
+            result = fetch(page_size, cursor, fields, branch=self.branch)
+            if not result["success"]:
+                raise RuntimeError(result.get("error"))
+            yield result["data"]
+            cursor = result["next_cursor"]
+            if cursor is None:
+                return
+
+    # ---- async ----
+    async def add_payment_async(self, member_id, amount, payment_date=None, method=None):
+        result = await async_db.add_payment(member_id, amount, payment_date, method, branch=self.branch)
+        return self._added_response(member_id, amount, result)
+
+    async def get_all_payments_async(self):
+        return self._list_response(await async_db.get_all_payments(branch=self.branch))
+
+    async def get_payments_page_async(self, limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None, method=None,
+                                      member_id=None, date_from=None, date_to=None):
+        result = await async_db.get_payments_page(limit, cursor, fields, method, member_id, date_from, date_to,
+                                                  branch=self.branch)
+        return self._page_response(result)
+
+    async def iter_payment_pages_async(self, fields=None, page_size=MAX_PAGE_SIZE, **filters):
+        """Yield filtered payment pages one at a time, bypassing the read cache (for exports)."""
+        fetch = async_db.get_payments_page.__wrapped__
+        cursor = None
+        while True:
+            result = await fetch(page_size, cursor, fields, **filters, branch=self.branch)
+            if not result["success"]:
+                raise RuntimeError(result.get("error"))
+            yield result["data"]
+            cursor = result["next_cursor"]
+            if cursor is None:
+                return
+
+    async def get_payments_by_member_async(self, member_id, limit=None):
+        result = await async_db.get_payments_by_member(member_id, limit, branch=self.branch)
+        return self._member_payments_response(member_id, result)
+
+    async def delete_payment_async(self, payment_id):
+        return self._deleted_response(payment_id, await async_db.delete_payment(payment_id, branch=self.branch))
+
+    async def payment_totals_async(self, method=None, member_id=None, date_from=None, date_to=None):
+        return (self._snapshot_totals(method, member_id, date_from, date_to)
+                or self._totals_response(await async_db.get_payment_totals(method, member_id, date_from, date_to,
+                                                                           branch=self.branch)))
+
+# ===================== Checkin Manager =====================
+class CheckinManager:
+    """Handles the stored check-ins of one branch; taps are buffered by src.checkins.CheckinStore."""
+
+    def __init__(self, branch=None):
+        self.branch = check_branch(branch)
+
+    def add_checkins(self, payloads, chunk_size=BULK_CHUNK_SIZE):
+        return add_checkins(payloads, chunk_size, branch=self.branch)
+
+    def iter_checkins(self, since=None, page_size=MAX_PAGE_SIZE):
+        """Yield the check-ins from `since` on, newest first, page by page."""
+        cursor = None
+        while True:
+            result = get_checkins_page(page_size, cursor, since, branch=self.branch)
+            if not result["success"]:
+                raise RuntimeError(result.get("error"))
+            yield from result["data"]
+            cursor = result["next_cursor"]
+            if cursor is None:
+                return
+
+# ===================== Renewals =====================
+# Term length in calendar months and price of every plan.
+PLAN_RULES = {
+    "Monthly": {"months": 1, "price": 1000.0},
+    "Quarterly": {"months": 3, "price": 2700.0},
+    "Yearly": {"months": 12, "price": 9600.0},
+}
+
+def add_months(day, months):
+    """`day` moved by whole calendar months, clamped to the end of shorter months."""
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+def to_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+def unused_credit(end_date, rule, today):
+    """Value of the prepaid days from today to end_date under `rule`.
+
+    Whole terms count at the plan price, the remaining part of a term at
+    its daily rate.
+    """
+    terms, term_start = 0, add_months(end_date, -rule["months"])
+    while term_start >= today:
+        terms += 1
+        term_start = add_months(end_date, -rule["months"] * (terms + 1))
+    term_end = add_months(end_date, -rule["months"] * terms)
+    return rule["price"] * (terms + (term_end - today).days / (term_end - term_start).days)
+
+def plan_renewal(member, plan=None, today=None):
+    """The next term of `member` on `plan` (their current plan by default).
+
+    A renewal follows on from the current term, or starts today once it
+    has lapsed. An upgrade to a dearer plan starts today and credits every
+    unused day of the current term at the old plan's daily rate; credit
+    beyond the new price extends the new term at the new plan's daily
+    rate, so prepaid time is never lost. Any other plan change waits for
+    the current term to end. Raises ValueError for plans without a rule.
+    """
+    today = today or date.today()
+    current, plan = member.get("plan"), plan or member.get("plan")
+    if plan not in PLAN_RULES:
+        raise ValueError(f"Unknown plan '{plan}'. Use one of: {', '.join(PLAN_RULES)}.")
+    rule, old = PLAN_RULES[plan], PLAN_RULES.get(current)
+    if plan == current:
+        kind = "renew"
+    elif old is not None and rule["price"] > old["price"]:
+        kind = "upgrade"
+    else:
+        kind = "change"
+    end_date = to_date(member.get("end_date"))
+    active = end_date is not None and end_date >= today
+    start, credit = (end_date if active else today), 0.0
+    new_end = add_months(start, rule["months"])
+    if kind == "upgrade" and active:
+        credit = round(unused_credit(end_date, old, today), 2)
+        new_end = add_months(today, rule["months"])
+        surplus = credit - rule["price"]
+        if surplus > 0:
+            new_end += timedelta(days=int(surplus * (new_end - today).days / rule["price"]))
+    return {"plan": plan, "end_date": new_end, "kind": kind, "credit": credit,
+            "amount": round(max(rule["price"] - credit, 0.0), 2)}
+
+class RenewalEngine:
+    """Renews or changes the plans of many members of one branch in one go.
+
+    Members are grouped by new plan and end date, so a month-end run over
+    thousands of members costs a few bulk updates, and the matching
+    payments go in right after with chunked multi-row inserts. A payment's
+    idempotency key is the member and the end date it pays for, so one
+    term is never charged twice.
+    """
+
+    def __init__(self, gymrat_mgr, payment_mgr):
+        self.gymrat_mgr = gymrat_mgr
+        self.payment_mgr = payment_mgr
+
+    def _plan(self, renewals, members, today):
+        """One result per renewal, plus the ids to update grouped for set_members_plans."""
+        results, groups, seen = [], {}, set()
+        for renewal in renewals:
+            member_id = str(renewal["member_id"])
+            result = {"member_id": member_id, "success": False}
+            results.append(result)
+            member = members.get(member_id)
+            if member is None:
+                result["message"] = "Member not found."
+                continue
+            if member_id in seen:
+                result["message"] = "Member is listed more than once."
+                continue
+            seen.add(member_id)
+            try:
+                result.update(plan_renewal(member, renewal.get("plan"), today))
+            except ValueError as e:
+                result["message"] = str(e)
+                continue
+            result.update(previous_plan=member.get("plan"), previous_end_date=member.get("end_date"))
+            groups.setdefault((result["plan"], result["end_date"], member.get("end_date")), []).append(member_id)
+        return results, groups
+
+    def _record_payments(self, results, method, chunk_size):
+        payloads = [{**payment_payload(r["member_id"], r["amount"], method=method),
+                     "idempotency_key": f"renewal:{r['member_id']}:{r['end_date'].isoformat()}"}
+                    for r in results if r["success"] and r["amount"] > 0]
+        by_member = {r["member_id"]: r for r in results if r["success"]}
+        for start in range(0, len(payloads), chunk_size):
+            chunk = payloads[start:start + chunk_size]
+            paid = self.payment_mgr.add_payments_once(chunk)
+            responses = paid["data"] if paid["success"] else [{"success": False, "message": paid.get("error")}] * len(chunk)
+            for payload, response in zip(chunk, responses):
+                result = by_member[payload["gymrat_id"]]
+                result["payment"] = response["data"][0] if response["success"] else None
+                if not response["success"]:
+                    result["payment_error"] = response.get("message")
+        return sum(1 for r in results if r.get("payment"))
+
+    def renew(self, renewals, method=None, record_payments=True, today=None, chunk_size=BULK_CHUNK_SIZE):
+        """Renew [{"member_id", "plan"?}, ...]; results come back one per entry, in order."""
+        today = today or date.today()
+        lookup = self.gymrat_mgr.lookup_members([r["member_id"] for r in renewals])
+        if not lookup["success"]:
+            return {"success": False, "message": "Failed to renew members.", "error": lookup.get("error")}
+        results, groups = self._plan(renewals, {str(row["id"]): row for row in lookup["data"]}, today)
+        update = self.gymrat_mgr.set_members_plans(groups)
+        if not update["success"]:
+            return {"success": False, "message": "Failed to renew members.", "error": update.get("error")}
+        updated = {str(row["id"]) for row in update["data"]["updated"]}
+        failed = update["data"]["failed"]
+        for result in results:
+            if "kind" not in result:
+                continue
+            if result["member_id"] in updated:
+                result["success"] = True
+            else:
+                result["message"] = failed.get(result["member_id"], "Member changed since it was read; not renewed.")
+        paid = self._record_payments(results, method, chunk_size) if record_payments else 0
+        renewed = sum(1 for r in results if r["success"])
+        return {
+            "success": True,
+            "message": f"Renewed {renewed} of {len(renewals)} members in {len(groups)} groups, {paid} payments recorded.",
+            "renewed": renewed,
+            "failed": len(renewals) - renewed,
+            "groups": len(groups),
+            "payments": paid,
+            "results": results,
+        }
+
+# ===================== Branches =====================
+async def branch_summary(gymrat_mgr, payment_mgr, date_from=None, date_to=None):
+    """Member, active member, payment and revenue totals of one branch."""
+    members, active, payments = await asyncio.gather(
+        gymrat_mgr.count_members_async(),
+        gymrat_mgr.count_members_async(status="active"),
+        payment_mgr.payment_totals_async(date_from=date_from, date_to=date_to),
+    )
+    for result in (members, active, payments):
+        if not result["success"]:
+            return {"success": False, "error": result.get("error")}
+    return {"success": True, "data": {"members": members["data"]["count"], "active_members": active["data"]["count"],
+                                      "payments": payments["data"]["count"], "revenue": payments["data"]["sum"]}}
+
+async def summarize_branches(branches, date_from=None, date_to=None):
+    """Per-branch and combined totals of {branch id: (GymratManager, PaymentManager)}, all branches at once.
+
+    A branch whose query fails is reported with its error and left out of
+    the total instead of failing the whole summary.
+    """
+    results = await asyncio.gather(*(branch_summary(*managers, date_from, date_to) for managers in branches.values()))
+    rows, total, failed = [], {"members": 0, "active_members": 0, "payments": 0, "revenue": 0}, []
+    for branch, result in zip(branches, results):
+        if not result["success"]:
+            failed.append(branch)
+            rows.append({"branch": branch, "error": result.get("error")})
+            continue
+        rows.append({"branch": branch, **result["data"]})
+        for key in total:
+            total[key] += result["data"][key]
+    message = f"Summarised {len(branches) - len(failed)} of {len(branches)} branches."
+    if failed:
+        message += f" Failed: {', '.join(failed)}."
+    return {"success": len(failed) < len(branches), "data": rows, "total": total, "message": message}
@@ -0,0 +1,314 @@
+import time
+import inspect
+import functools
+import threading
+from contextvars import ContextVar
+from src.storage.base import Storage, AsyncStorage
+
+# -------------------- Registry --------------------
+# A small in-process registry rendered in the Prometheus text format, so
+# /metrics needs no extra dependency. Values are per process: scrape each
+# worker separately.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = []
+_collectors = []
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def label_text(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{escape(v)}"' for n, v in pairs) + "}"
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{label_text(self.labels, k)} {v}" for k, v in items]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self._values.items()]
+        lines = self.header()
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{label_text(self.labels, labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_bucket{label_text(self.labels, labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{self.name}_sum{label_text(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{label_text(self.labels, labels)} {count}")
+        return lines
+
+def add_collector(collect):
+    """Register a callable returning [(name, kind, help, value)] read at scrape time."""
+    _collectors.append(collect)
+
+def render():
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collect in _collectors:
+        for name, kind, help, value in collect():
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+REQUESTS = Counter("http_requests_total", "HTTP requests by route and status.", ("method", "route", "status"))
+ERRORS = Counter("http_request_errors_total", "HTTP requests that failed with a 5xx or an exception.", ("method", "route"))
+IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served.")
+LATENCY = Histogram("http_request_duration_seconds", "Time from request start to the last body byte.", ("method", "route"))
+PHASES = Histogram("http_request_phase_seconds",
+                   "Request time split into storage round trips (db), JSON rendering (render) and the rest (app).",
+                   ("route", "phase"))
+DB_CALLS = Histogram("db_call_duration_seconds", "src.db / src.async_db function time, cache hits excluded.",
+                     ("module", "function"))
+DB_FAILURES = Counter("db_call_failures_total", "src.db / src.async_db calls that returned success=False.",
+                      ("module", "function"))
+STORAGE_CALLS = Histogram("storage_query_duration_seconds", "Backend round trip per storage operation.",
+                          ("backend", "op", "table"))
+
+# -------------------- Per-request timings --------------------
+class RequestTimings:
+    __slots__ = ("db", "render")
+
+    def __init__(self):
+        self.db = 0.0
+        self.render = 0.0
+
+# asyncio.to_thread and run_in_threadpool copy the context, so storage calls
+# made from worker threads still add to the request's RequestTimings.
+current_timings = ContextVar("current_timings", default=None)
+
+def add_timing(field, seconds):
+    timings = current_timings.get()
+    if timings is not None:
+        setattr(timings, field, getattr(timings, field) + seconds)
+
+# -------------------- Storage / db timing --------------------
+class TimedStorage(Storage):
+    """Wraps a Storage and times each backend round trip."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.name = storage.name
+
+    def _timed(self, op, table, call, *args):
+        start = time.perf_counter()
+        try:
+            return call(table, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            STORAGE_CALLS.observe(elapsed, self.name, op, table)
+            add_timing("db", elapsed)
+
+    def insert(self, table, rows):
+        return self._timed("insert", table, self.storage.insert, rows)
+
+    def insert_once(self, table, rows, key):
+        return self._timed("insert_once", table, self.storage.insert_once, rows, key)
+
+    def is_permanent(self, error):
+        return self.storage.is_permanent(error)
+
+    def select(self, table, columns="*", filters=(), order_by=None, limit=None, after=None):
+        return self._timed("select", table, self.storage.select, columns, filters, order_by, limit, after)
+
+    def select_embedded(self, table, filters, embed, foreign_key, order_by=None, limit=None):
+        return self._timed("select_embedded", table, self.storage.select_embedded,
+                           filters, embed, foreign_key, order_by, limit)
+
+    def aggregate(self, table, filters=(), column=None):
+        return self._timed("aggregate", table, self.storage.aggregate, filters, column)
+
+    def update(self, table, values, filters):
+        return self._timed("update", table, self.storage.update, values, filters)
+
+    def delete(self, table, filters):
+        return self._timed("delete", table, self.storage.delete, filters)
+
+    def close(self):
+        self.storage.close()
+
+class TimedAsyncStorage(AsyncStorage):
+    """Async flavour of TimedStorage."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.name = storage.name
+
+    async def _timed(self, op, table, call, *args):
+        start = time.perf_counter()
+        try:
+            return await call(table, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            STORAGE_CALLS.observe(elapsed, self.name, op, table)
+            add_timing("db", elapsed)
+
+    async def insert(self, table, rows):
+        return await self._timed("insert", table, self.storage.insert, rows)
+
+    async def select(self, table, columns="*", filters=(), order_by=None, limit=None, after=None):
+        return await self._timed("select", table, self.storage.select, columns, filters, order_by, limit, after)
+
+    async def select_embedded(self, table, filters, embed, foreign_key, order_by=None, limit=None):
+        return await self._timed("select_embedded", table, self.storage.select_embedded,
+                                 filters, embed, foreign_key, order_by, limit)
+
+    async def aggregate(self, table, filters=(), column=None):
+        return await self._timed("aggregate", table, self.storage.aggregate, filters, column)
+
+    async def update(self, table, values, filters):
+        return await self._timed("update", table, self.storage.update, values, filters)
+
+    async def delete(self, table, filters):
+        return await self._timed("delete", table, self.storage.delete, filters)
+
+    async def close(self):
+        await self.storage.close()
+
+def instrument(storage):
+    return TimedStorage(storage)
+
+def instrument_async(storage):
+    # A thread wrapper around an already timed Storage is measured inside its threads.
+    if isinstance(getattr(storage, "storage", None), TimedStorage):
+        return storage
+    return TimedAsyncStorage(storage)
+
+def timed(func):
+    """Record the duration of a src.db / src.async_db function, and its failures.
+
+    Apply below @cached so cache hits are not counted as database calls.
+    """
+    labels = (func.__module__.rsplit(".", 1)[-1], func.__name__)
+
+    def record(start, result):
+        DB_CALLS.observe(time.perf_counter() - start, *labels)
+        if isinstance(result, dict) and not result.get("success", True):
+            DB_FAILURES.inc(*labels)
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = await func(*args, **kwargs)
+            record(start, result)
+            return result
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        record(start, result)
+        return result
+    return wrapper
+
+# -------------------- Middleware --------------------
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status, errors and in-flight requests per route.
+
+    Routes are labelled by their template (/members/{member_id}), never the
+    raw path, to keep label cardinality bounded. `profiler` (optional) is
+    told about every request so it can dump stacks for slow ones.
+    """
+
+    def __init__(self, app, profiler=None):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        IN_FLIGHT.inc()
+        if self.profiler:
+            self.profiler.request_started()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            status = 500
+            raise
+        finally:
+            end = time.perf_counter()
+            elapsed = end - start
+            IN_FLIGHT.dec()
+            current_timings.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            REQUESTS.inc(method, path, str(status))
+            LATENCY.observe(elapsed, method, path)
+            if status >= 500:
+                ERRORS.inc(method, path)
+            PHASES.observe(timings.db, path, "db")
+            PHASES.observe(timings.render, path, "render")
+            PHASES.observe(max(elapsed - timings.db - timings.render, 0.0), path, "app")
+            if self.profiler:
+                self.profiler.request_finished(method, path, start, end)
@@ -0,0 +1,136 @@
+import os
+import re
+import sys
+import time
+import logging
+import threading
+from collections import deque, Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Setup --------------------
+# PROFILE_SLOW_MS > 0 turns the profiler on: every request slower than that
+# gets its stack samples written to PROFILE_DIR as a folded-stack file
+# (one "frame;frame;frame count" line per stack), which flamegraph.pl,
+# speedscope and inferno read directly. It can also be toggled at runtime
+# through POST /debug/profiler.
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_DUMPS = int(os.getenv("PROFILE_MAX_DUMPS", "200"))
+
+# Leaf frames of threads that are parked, not working.
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+def fold(frame):
+    """Collapse a frame chain into a root-first "file:function;..." string, or None when idle."""
+    code = frame.f_code
+    if (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+        return None
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class SamplingProfiler:
+    """Samples every thread's stack while requests are in flight.
+
+    Samples go into a ring buffer covering the last `window` seconds. When
+    a request ends slower than `slow_ms`, the samples taken during it are
+    written out. The samples are process wide, so a dump also shows other
+    requests that overlapped the slow one, which is often the cause.
+    """
+
+    def __init__(self, slow_ms=PROFILE_SLOW_MS, interval_ms=PROFILE_INTERVAL_MS,
+                 out_dir=PROFILE_DIR, max_dumps=PROFILE_MAX_DUMPS, window=30.0):
+        self.slow_ms = slow_ms
+        self.interval_ms = interval_ms
+        self.out_dir = out_dir
+        self.max_dumps = max_dumps
+        self.window = window
+        self.dumps = 0
+        self._active = 0
+        self._samples = deque(maxlen=max(1, int(window * 1000 / interval_ms)))
+        self._pending = deque()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self.slow_ms > 0
+
+    def status(self):
+        return {"enabled": self.enabled, "slow_ms": self.slow_ms, "interval_ms": self.interval_ms,
+                "out_dir": self.out_dir, "dumps": self.dumps, "max_dumps": self.max_dumps}
+
+    def configure(self, slow_ms):
+        """Turn the profiler on (slow_ms > 0) or off (0) at runtime."""
+        self.slow_ms = slow_ms
+        if self.enabled:
+            self.start()
+        else:
+            self.stop()
+
+    def start(self):
+        if self.enabled and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self._samples.clear()
+
+    def request_started(self):
+        self._active += 1
+
+    def request_finished(self, method, route, start, end):
+        self._active -= 1
+        if (self.enabled and (end - start) * 1000 >= self.slow_ms
+                and self.dumps + len(self._pending) < self.max_dumps):
+            self._pending.append((method, route, start, end))
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval_ms / 1000):
+            if self._active > 0:
+                now = time.perf_counter()
+                for ident, frame in sys._current_frames().items():
+                    if ident == own:
+                        continue
+                    stack = fold(frame)
+                    if stack is not None:
+                        if ident not in names:
+                            names = {t.ident: t.name for t in threading.enumerate()}
+                        self._samples.append((now, f"{names.get(ident, ident)};{stack}"))
+            while self._pending:
+                self._dump(*self._pending.popleft())
+
+    def _dump(self, method, route, start, end):
+        stacks = Counter(stack for ts, stack in list(self._samples) if start <= ts <= end)
+        if not stacks:
+            return
+        os.makedirs(self.out_dir, exist_ok=True)
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+        name = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{method}-{slug}-{int((end - start) * 1000)}ms.folded"
+        path = os.path.join(self.out_dir, name)
+        try:
+            with open(path, "w") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.dumps += 1
+            logger.info("Profiled slow request %s %s (%.0f ms) -> %s", method, route, (end - start) * 1000, path)
+        except OSError:
+            logger.exception("Could not write profile %s", path)
@@ -0,0 +1,195 @@
+import re
+import heapq
+import bisect
+import logging
+import threading
+import unicodedata
+from itertools import islice
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Setup --------------------
+SEARCH_FIELDS = ["name", "phone", "plan", "end_date"]
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+# Share of the query's trigrams a name must contain to count as a match.
+MIN_SIMILARITY = 0.5
+# Posting-list entries counted per name query; the rarest trigrams go first,
+# so very common ones ("  a") only matter when nothing rarer narrowed it down.
+CANDIDATE_BUDGET = 50000
+RESCORE_LIMIT = 200
+
+def normalize_phone(value):
+    return re.sub(r"\D", "", str(value or ""))
+
+def phone_keys(phone):
+    """Digits of a number, plus its last ten digits so "+91 98..." is found by "98..."."""
+    digits = normalize_phone(phone)
+    if not digits:
+        return set()
+    keys = {digits}
+    if len(digits) > 10:
+        keys.add(digits[-10:])
+    return keys
+
+def normalize_name(value):
+    text = unicodedata.normalize("NFKD", str(value or ""))
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", text).split())
+
+def trigrams(text, partial=False):
+    """pg_trgm style trigrams: each word padded with two leading and one trailing space.
+
+    With `partial` the last word gets no trailing gram, since the user may
+    still be typing it.
+    """
+    words = text.split()
+    grams = set()
+    for i, word in enumerate(words):
+        padded = f"  {word}" if partial and i == len(words) - 1 else f"  {word} "
+        grams.update(padded[j:j + 3] for j in range(len(padded) - 2))
+    return grams
+
+# -------------------- Index --------------------
+class MemberSearchIndex:
+    """In-memory phone-prefix and fuzzy name lookup over every member.
+
+    Phone prefixes are range lookups on a sorted list of normalized numbers,
+    which is a trie flattened into one array: the same prefix walk as a
+    node trie, with one tuple per number instead of one dict per digit.
+    Names go into a trigram inverted index. Built once from a full scan,
+    then kept current through GymratManager write listeners.
+    """
+
+    def __init__(self):
+        self._phones = []   # sorted (digits, id)
+        self._grams = {}    # trigram -> set of ids
+        self._rows = {}     # id -> row
+        self._names = {}    # id -> normalized name
+        self._lock = threading.Lock()
+        self._pending = []  # writes seen while a load was running
+        self._loading = False
+        self.ready = False
+
+    def __len__(self):
+        return len(self._rows)
+
+    def load(self, rows):
+        with self._lock:
+            self._loading = True
+        try:
+            phones, grams, by_id, names = [], {}, {}, {}
+            for row in rows:
+                member_id = str(row["id"])
+                by_id[member_id] = row
+                names[member_id] = normalize_name(row.get("name"))
+                phones.extend((key, member_id) for key in phone_keys(row.get("phone")))
+                for gram in trigrams(names[member_id]):
+                    grams.setdefault(gram, set()).add(member_id)
+            phones.sort()
+        except Exception:
+            with self._lock:
+                self._loading, self._pending = False, []
+            raise
+        with self._lock:
+            self._loading = False
+            self._phones, self._grams, self._rows, self._names = phones, grams, by_id, names
+            pending, self._pending = self._pending, []
+            for event, row in pending:
+                self._apply(event, row)
+            self.ready = True
+        logger.info("Search index loaded with %d members", len(by_id))
+
+    def on_write(self, event, rows):
+        """GymratManager listener."""
+        with self._lock:
+            for row in rows:
+                if self.ready:
+                    self._apply(event, row)
+                elif self._loading:  # before a load starts its scan sees the write anyway
+                    self._pending.append((event, row))
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Phone-prefix matches for digit queries, fuzzy name matches otherwise."""
+        if not re.search(r"[^\d\s()+\-.]", query):
+            digits = normalize_phone(query)
+            return self.search_phone(digits, limit) if digits else []
+        return self.search_name(query, limit)
+
+    def search_phone(self, digits, limit=SEARCH_LIMIT):
+        with self._lock:
+            results, seen = [], set()
+            i = bisect.bisect_left(self._phones, (digits, ""))
+            while i < len(self._phones) and len(results) < limit:
+                key, member_id = self._phones[i]
+                if not key.startswith(digits):
+                    break
+                if member_id not in seen:
+                    seen.add(member_id)
+                    results.append({**self._rows[member_id], "match": "phone", "score": 1.0})
+                i += 1
+            return results
+
+    def search_name(self, query, limit=SEARCH_LIMIT):
+        text = normalize_name(query)
+        wanted = trigrams(text, partial=True)
+        if not wanted:
+            return []
+        with self._lock:
+            postings = sorted((self._grams.get(g, set()) for g in wanted), key=len)
+            # Names holding every query trigram: a C-level intersection, rarest set first.
+            exact = postings[0].intersection(*postings[1:])
+            candidates = list(islice(exact, RESCORE_LIMIT))
+            if len(candidates) < limit:
+                candidates += self._fuzzy_candidates(postings, len(wanted), exact)
+            scored = []
+            for member_id in candidates:
+                name = self._names[member_id]
+                score = 1.0 if text in name else len(wanted & trigrams(name)) / len(wanted)
+                if score >= MIN_SIMILARITY:
+                    scored.append((-score, len(name), name, member_id))
+            scored.sort()
+            return [{**self._rows[member_id], "match": "name", "score": round(-neg, 3)}
+                    for neg, _, _, member_id in scored[:limit]]
+
+    def _fuzzy_candidates(self, postings, wanted, exclude):
+        """Ids sharing enough trigrams to reach MIN_SIMILARITY (typos, missing letters)."""
+        counts, budget, counted = Counter(), CANDIDATE_BUDGET, 0
+        for posting in postings:
+            if counts and len(posting) > budget:
+                break
+            counts.update(posting)
+            budget -= len(posting)
+            counted += 1
+        # Trigrams skipped for budget could still match, so count them as possible hits.
+        need = MIN_SIMILARITY * wanted - (len(postings) - counted)
+        found = [(n, member_id) for member_id, n in counts.items() if n >= need and member_id not in exclude]
+        return [member_id for _, member_id in heapq.nlargest(RESCORE_LIMIT, found)]
+
+    def _apply(self, event, row):
+        member_id = str(row.get("id"))
+        self._remove(member_id)
+        if event == "delete":
+            return
+        self._rows[member_id] = {k: row.get(k) for k in ("id", *SEARCH_FIELDS)}
+        self._names[member_id] = normalize_name(row.get("name"))
+        for key in phone_keys(row.get("phone")):
+            bisect.insort(self._phones, (key, member_id))
+        for gram in trigrams(self._names[member_id]):
+            self._grams.setdefault(gram, set()).add(member_id)
+
+    def _remove(self, member_id):
+        row = self._rows.pop(member_id, None)
+        if row is None:
+            return
+        for key in phone_keys(row.get("phone")):
+            i = bisect.bisect_left(self._phones, (key, member_id))
+            if i < len(self._phones) and self._phones[i] == (key, member_id):
+                del self._phones[i]
+        for gram in trigrams(self._names.pop(member_id, "")):
+            posting = self._grams.get(gram)
+            if posting is not None:
+                posting.discard(member_id)
+                if not posting:
+                    del self._grams[gram]
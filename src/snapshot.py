@@ -0,0 +1,434 @@
+import sys
+import logging
+import itertools
+import threading
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Utility --------------------
+EPOCH = datetime(1970, 1, 1)
+NO_DAY = np.iinfo(np.int32).min   # end_date of a member without one: neither active nor expired
+
+def to_days(value):
+    """Days since 1970-01-01 of a date or an ISO date/timestamp string."""
+    if isinstance(value, datetime):
+        value = value.date()
+    elif not isinstance(value, date):
+        value = date.fromisoformat(str(value)[:10])
+    return (value - EPOCH.date()).days
+
+def to_day_array(values):
+    """to_days of many ISO dates in one NumPy pass; a missing date is NO_DAY."""
+    days = np.array([str(v)[:10] if v else "NaT" for v in values], dtype="datetime64[D]").astype(np.int64)
+    return np.where(days == np.iinfo(np.int64).min, NO_DAY, days).astype(np.int32)
+
+def to_seconds(values):
+    """Epoch seconds of naive ISO timestamps (as stored), parsed in one NumPy pass."""
+    return (np.array([str(v).replace(" ", "T")[:26] for v in values], dtype="datetime64[us]")
+            .astype("datetime64[s]").astype(np.int64))
+
+def to_epoch(value):
+    """Epoch seconds of a naive datetime; a date counts from its midnight."""
+    if type(value) is date:
+        value = datetime.combine(value, datetime.min.time())
+    return int((value - EPOCH).total_seconds())
+
+def time_bounds(date_from, date_to):
+    """Epoch-second bounds [lo, hi) of a payment date range; a plain date_to includes that whole day."""
+    lo = to_epoch(date_from) if date_from else None
+    if not date_to:
+        return lo, None
+    if type(date_to) is date:
+        return lo, to_epoch(date_to + timedelta(days=1))
+    return lo, to_epoch(date_to) + 1
+
+class StringPool:
+    """Interned strings (plans, methods, member ids) behind small integer codes; -1 is None."""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        if value is None:
+            return -1
+        value = str(value)
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(sys.intern(value))
+        return code
+
+    def find(self, value):
+        """Code of a known value; -2, which matches no row, otherwise."""
+        return self.codes.get(str(value), -2)
+
+    def value(self, code):
+        return self.values[code] if code >= 0 else None
+
+    def nbytes(self):
+        return (sys.getsizeof(self.codes) + sys.getsizeof(self.values)
+                + sum(sys.getsizeof(v) for v in self.values))
+
+class Columns:
+    """Parallel NumPy arrays of one length, grown by doubling like a list."""
+
+    def __init__(self, dtypes, capacity=1024):
+        self.size = 0
+        self.arrays = {name: np.zeros(capacity, dtype) for name, dtype in dtypes.items()}
+
+    def __getitem__(self, name):
+        return self.arrays[name][:self.size]
+
+    def reserve(self, size):
+        capacity = len(next(iter(self.arrays.values())))
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2)
+        for name, old in self.arrays.items():
+            new = np.zeros(capacity, old.dtype)
+            new[:self.size] = old[:self.size]
+            self.arrays[name] = new
+
+    def extend(self, values):
+        """Append rows given as {column: sequence of equal length}; other columns are left zero."""
+        n = len(next(iter(values.values())))
+        self.reserve(self.size + n)
+        for name, column in values.items():
+            self.arrays[name][self.size:self.size + n] = column
+        self.size += n
+
+    def keep(self, mask):
+        """Drop every row where `mask` is False."""
+        kept = int(mask.sum())
+        for array in self.arrays.values():
+            array[:kept] = array[:self.size][mask]
+        self.size = kept
+
+    def trim(self):
+        """Release the spare capacity (after a bulk load)."""
+        self.arrays = {name: array[:self.size].copy() for name, array in self.arrays.items()}
+
+    def nbytes(self):
+        return sum(array[:self.size].nbytes for array in self.arrays.values())
+
+# -------------------- Row views --------------------
+class PaymentRow:
+    """One snapshot payment, read from the columns on access (valid until the next write)."""
+
+    __slots__ = ("_snapshot", "_index")
+
+    def __init__(self, snapshot, index):
+        self._snapshot = snapshot
+        self._index = index
+
+    @property
+    def id(self):
+        return int(self._snapshot.columns["id"][self._index])
+
+    @property
+    def gymrat_id(self):
+        return self._snapshot.member_ids.value(int(self._snapshot.columns["member"][self._index]))
+
+    @property
+    def amount(self):
+        return float(self._snapshot.columns["amount"][self._index])
+
+    @property
+    def payment_date(self):
+        return EPOCH + timedelta(seconds=int(self._snapshot.columns["paid_at"][self._index]))
+
+    @property
+    def method(self):
+        return self._snapshot.methods.value(int(self._snapshot.columns["method"][self._index]))
+
+    def to_dict(self):
+        return {"id": self.id, "gymrat_id": self.gymrat_id, "amount": self.amount,
+                "payment_date": self.payment_date.isoformat(), "method": self.method}
+
+class MemberRow:
+    """One snapshot member, read from the columns on access."""
+
+    __slots__ = ("_snapshot", "_index")
+
+    def __init__(self, snapshot, index):
+        self._snapshot = snapshot
+        self._index = index
+
+    @property
+    def id(self):
+        return self._snapshot.ids.value(self._index)
+
+    @property
+    def plan(self):
+        return self._snapshot.plans.value(int(self._snapshot.columns["plan"][self._index]))
+
+    @property
+    def start_date(self):
+        return EPOCH.date() + timedelta(days=int(self._snapshot.columns["start"][self._index]))
+
+    @property
+    def end_date(self):
+        end = int(self._snapshot.columns["end"][self._index])
+        return None if end == NO_DAY else EPOCH.date() + timedelta(days=end)
+
+    def to_dict(self):
+        end = self.end_date
+        return {"id": self.id, "plan": self.plan, "start_date": self.start_date.isoformat(),
+                "end_date": end.isoformat() if end else None}
+
+# -------------------- Payments --------------------
+class PaymentSnapshot:
+    """Every payment of a branch as columns: ~27 bytes a row instead of a dict per row.
+
+    Ids, timestamps (epoch seconds) and amounts are NumPy arrays; member ids
+    and methods are interned once and stored as codes. Counts and sums are
+    boolean masks over the columns. Deleted rows are masked out and dropped
+    once they are a quarter of the table.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.columns = Columns({"id": np.int64, "member": np.int32, "paid_at": np.int64,
+                                "amount": np.float64, "method": np.int16, "alive": np.bool_})
+        self.member_ids = StringPool()
+        self.methods = StringPool()
+        self.dead = 0
+
+    def _extend(self, rows):
+        if not rows:
+            return
+        self.columns.extend({
+            "id": np.fromiter((int(r["id"]) for r in rows), np.int64, len(rows)),
+            "member": np.fromiter((self.member_ids.code(r.get("gymrat_id")) for r in rows), np.int32, len(rows)),
+            "paid_at": to_seconds(r["payment_date"] for r in rows),
+            "amount": np.fromiter((float(r["amount"]) for r in rows), np.float64, len(rows)),
+            "method": np.fromiter((self.methods.code(r.get("method")) for r in rows), np.int16, len(rows)),
+            "alive": np.ones(len(rows), np.bool_),
+        })
+
+    def _delete(self, ids):
+        found = np.isin(self.columns["id"], np.fromiter((int(i) for i in ids), np.int64)) & self.columns["alive"]
+        self.columns["alive"][found] = False
+        self.dead += int(found.sum())
+        if self.dead * 4 > self.columns.size:
+            self.columns.keep(self.columns["alive"])
+            self.dead = 0
+
+    def unseen(self, rows):
+        """The rows whose id is not in the snapshot yet (a replayed insert the scan already loaded)."""
+        with self._lock:
+            ids = np.fromiter((int(r["id"]) for r in rows), np.int64, len(rows))
+            known = np.isin(ids, self.columns["id"])
+        return [row for row, seen in zip(rows, known.tolist()) if not seen]
+
+    def apply(self, event, rows):
+        """PaymentManager listener."""
+        with self._lock:
+            if event == "insert":
+                self._extend(rows)
+            elif event == "delete":
+                self._delete([row["id"] for row in rows])
+
+    def backfill(self, pages):
+        """Rebuild from an iterable of payment row lists (id, gymrat_id, amount, payment_date, method)."""
+        with self._lock:
+            self._reset()
+        for rows in pages:
+            with self._lock:
+                self._extend(rows)
+        with self._lock:
+            self.columns.trim()
+
+    def __len__(self):
+        return self.columns.size - self.dead
+
+    def mask(self, method=None, member_id=None, date_from=None, date_to=None):
+        """Rows matching payment_filters' arguments (call with the lock held)."""
+        mask = self.columns["alive"].copy()
+        if method:
+            mask &= self.columns["method"] == self.methods.find(method)
+        if member_id:
+            mask &= self.columns["member"] == self.member_ids.find(member_id)
+        lo, hi = time_bounds(date_from, date_to)
+        if lo is not None:
+            mask &= self.columns["paid_at"] >= lo
+        if hi is not None:
+            mask &= self.columns["paid_at"] < hi
+        return mask
+
+    def totals(self, method=None, member_id=None, date_from=None, date_to=None):
+        """{"count", "sum"} of the matching payments, like the storage aggregate."""
+        with self._lock:
+            mask = self.mask(method, member_id, date_from, date_to)
+            return {"count": int(np.count_nonzero(mask)),
+                    "sum": round(float(self.columns["amount"][mask].sum()), 2)}
+
+    def rows(self, method=None, member_id=None, date_from=None, date_to=None, limit=None):
+        """Row views of the matching payments, newest first."""
+        with self._lock:
+            index = np.flatnonzero(self.mask(method, member_id, date_from, date_to))
+            index = index[np.argsort(self.columns["paid_at"][index], kind="stable")[::-1]][:limit]
+            return [PaymentRow(self, int(i)) for i in index]
+
+    def nbytes(self):
+        return self.columns.nbytes() + self.member_ids.nbytes() + self.methods.nbytes()
+
+# -------------------- Members --------------------
+class MemberSnapshot:
+    """Every member of a branch as columns; a member's row is the code of its interned id."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.columns = Columns({"plan": np.int16, "start": np.int32, "end": np.int32, "alive": np.bool_})
+        self.ids = StringPool()
+        self.plans = StringPool()
+
+    def _grow(self):
+        # Rows are id codes, so every interned id needs a row.
+        if len(self.ids.values) > self.columns.size:
+            self.columns.extend({"alive": np.zeros(len(self.ids.values) - self.columns.size, np.bool_)})
+
+    def _set_many(self, rows):
+        """Insert or replace complete member rows (id, plan, start_date, end_date) in one pass."""
+        index = np.fromiter((self.ids.code(r["id"]) for r in rows), np.int64, len(rows))
+        self._grow()
+        columns = self.columns
+        columns["plan"][index] = np.fromiter((self.plans.code(r.get("plan")) for r in rows), np.int16, len(rows))
+        columns["start"][index] = to_day_array(r.get("start_date") for r in rows)
+        columns["end"][index] = to_day_array(r.get("end_date") for r in rows)
+        columns["alive"][index] = True
+
+    def _set(self, row):
+        index = self.ids.code(row["id"])
+        self._grow()
+        columns = self.columns
+        # Update results may leave columns out; those keep their snapshot values.
+        if "plan" in row:
+            columns["plan"][index] = self.plans.code(row["plan"])
+        if row.get("start_date"):
+            columns["start"][index] = to_days(row["start_date"])
+        elif not columns["alive"][index]:
+            columns["start"][index] = to_days(date.today())
+        if "end_date" in row:
+            columns["end"][index] = to_days(row["end_date"]) if row["end_date"] else NO_DAY
+        elif not columns["alive"][index]:
+            columns["end"][index] = NO_DAY
+        columns["alive"][index] = True
+
+    def apply(self, event, rows):
+        """GymratManager listener."""
+        with self._lock:
+            for row in rows:
+                if event == "delete":
+                    index = self.ids.find(row["id"])
+                    if index >= 0:
+                        self.columns["alive"][index] = False
+                else:
+                    self._set(row)
+
+    def backfill(self, rows, chunk_size=10000):
+        """Rebuild from member rows (id, plan, start_date, end_date)."""
+        rows = iter(rows)
+        with self._lock:
+            self._reset()
+        while chunk := list(itertools.islice(rows, chunk_size)):
+            with self._lock:
+                self._set_many(chunk)
+        with self._lock:
+            self.columns.trim()
+
+    def __len__(self):
+        return int(np.count_nonzero(self.columns["alive"]))
+
+    def mask(self, plan=None, status=None, start_from=None, start_to=None, today=None):
+        """Rows matching member_filters' arguments (call with the lock held)."""
+        columns = self.columns
+        mask = columns["alive"].copy()
+        if plan:
+            mask &= columns["plan"] == self.plans.find(plan)
+        if status:
+            today = to_days(today or date.today())
+            mask &= columns["end"] != NO_DAY
+            mask &= (columns["end"] >= today) if status == "active" else (columns["end"] < today)
+        if start_from:
+            mask &= columns["start"] >= to_days(start_from)
+        if start_to:
+            mask &= columns["start"] <= to_days(start_to)
+        return mask
+
+    def count(self, plan=None, status=None, start_from=None, start_to=None, today=None):
+        with self._lock:
+            return int(np.count_nonzero(self.mask(plan, status, start_from, start_to, today)))
+
+    def rows(self, plan=None, status=None, start_from=None, start_to=None, today=None, limit=None):
+        with self._lock:
+            index = np.flatnonzero(self.mask(plan, status, start_from, start_to, today))[:limit]
+            return [MemberRow(self, int(i)) for i in index]
+
+    def nbytes(self):
+        return self.columns.nbytes() + self.ids.nbytes() + self.plans.nbytes()
+
+# -------------------- Store --------------------
+class SnapshotStore:
+    """Member and payment snapshots of a branch, kept current by manager write listeners.
+
+    Until `load` has scanned both tables, writes are queued and `ready` is
+    False; managers answer from the database meanwhile. A queued payment
+    insert the scan already picked up is not replayed. Member writes are
+    upserts by id, so replaying them is safe as is.
+    """
+
+    def __init__(self):
+        self.members = MemberSnapshot()
+        self.payments = PaymentSnapshot()
+        self._pending = []
+        self._lock = threading.Lock()
+        self._loading = False
+        self.ready = False
+
+    def on_member_write(self, event, rows):
+        self._dispatch(self.members, event, rows)
+
+    def on_payment_write(self, event, rows):
+        self._dispatch(self.payments, event, rows)
+
+    def _dispatch(self, target, event, rows):
+        with self._lock:
+            if not self.ready:
+                # Between loads the next scan picks the write up, so only a running load queues it.
+                if self._loading:
+                    self._pending.append((target, event, rows))
+                return
+        target.apply(event, rows)
+
+    def load(self, gymrat_mgr, payment_mgr):
+        """Fill both snapshots from full scans, then replay the writes seen meanwhile."""
+        with self._lock:
+            self.ready, self._loading = False, True
+        try:
+            self.members.backfill(gymrat_mgr.iter_members(["plan", "start_date", "end_date"]))
+            self.payments.backfill(payment_mgr.iter_payment_pages(["gymrat_id", "amount", "payment_date", "method"]))
+        except Exception:
+            logger.exception("Could not load the snapshots")
+            with self._lock:
+                self._pending, self._loading = [], False
+            return
+        with self._lock:
+            pending, self._pending = self._pending, []
+            for target, event, rows in pending:
+                if target is self.payments and event == "insert":
+                    rows = self.payments.unseen(rows)
+                target.apply(event, rows)
+            self.ready, self._loading = True, False
+        logger.info("Snapshots loaded: %d members, %d payments (%.1f MB)", len(self.members), len(self.payments),
+                    (self.members.nbytes() + self.payments.nbytes()) / 1e6)
@@ -0,0 +1,109 @@
+import os
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Setup --------------------
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "10"))  # seconds the lifespan waits for the first attempt
+WARMUP_RETRY = float(os.getenv("WARMUP_RETRY", "5"))       # seconds between attempts after a failure
+LOAD_RETRY_MAX = float(os.getenv("LOAD_RETRY_MAX", "300"))  # longest wait between index load attempts
+PROBE_PATHS = frozenset({"/healthz", "/readyz"})
+
+# -------------------- Warm-up --------------------
+class Startup:
+    """Runs the warm-up of a worker and keeps its startup timings.
+
+    Timings are seconds since `started` (taken as the API module starts
+    importing): "imported", "lifespan", "warm", "ready" (the first
+    /readyz answered 200) and "first_request", each recorded once. The lifespan waits up to
+    WARMUP_TIMEOUT for the first warm-up attempt, so a healthy worker opens
+    its connections before serving; a worker whose backend is down or
+    misconfigured starts anyway, fails /readyz and keeps retrying in the
+    background.
+    """
+
+    def __init__(self, started):
+        self.started = started
+        self.timings = {}
+        self.warm = False
+        self.error = None
+        self.attempts = 0
+        self._task = None
+
+    def mark(self, phase):
+        if phase not in self.timings:
+            self.timings[phase] = round(time.perf_counter() - self.started, 4)
+
+    async def _run(self, warm_up, retry, attempted):
+        while True:
+            self.attempts += 1
+            try:
+                await warm_up()
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                logger.warning("Warm-up attempt %d failed: %s", self.attempts, self.error)
+            else:
+                self.warm, self.error = True, None
+                self.mark("warm")
+                return
+            finally:
+                attempted.set()
+            await asyncio.sleep(retry)
+
+    async def start(self, warm_up, timeout=WARMUP_TIMEOUT, retry=WARMUP_RETRY):
+        """Run `warm_up` (an async callable) until it succeeds; returns after the first attempt or `timeout`."""
+        attempted = asyncio.Event()
+        self._task = asyncio.create_task(self._run(warm_up, retry, attempted))
+        try:
+            await asyncio.wait_for(attempted.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Warm-up still running after %ss; serving while it finishes.", timeout)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def samples(self):
+        """Metrics collector: startup phases as gauges (-1 until reached)."""
+        return [(f"startup_{phase}_seconds", "gauge", f"Seconds from API import to {phase.replace('_', ' ')}.",
+                 self.timings.get(phase, -1))
+                for phase in ("imported", "warm", "ready", "first_request")]
+
+async def load_until_ready(name, load, ready, retry=WARMUP_RETRY, max_delay=LOAD_RETRY_MAX):
+    """Run the blocking `load` in a thread until `ready()` is true.
+
+    A load that raises or leaves its index unready (one that logs and
+    swallows its error) is retried with exponential backoff, so a
+    transient database error at startup does not keep a worker unready.
+    """
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            await asyncio.to_thread(load)
+        except Exception:
+            logger.exception("Loading the %s failed", name)
+        if ready():
+            return
+        delay = min(max_delay, retry * 2 ** (attempts - 1))
+        logger.warning("%s not loaded after %d attempts; retrying in %.0fs", name, attempts, delay)
+        await asyncio.sleep(delay)
+
+class FirstRequestMiddleware:
+    """Records when the first request other than a probe finished (pure ASGI, one dict lookup per request)."""
+
+    def __init__(self, app, startup):
+        self.app = app
+        self.startup = startup
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or "first_request" in self.startup.timings or scope["path"] in PROBE_PATHS:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.startup.mark("first_request")
@@ -0,0 +1,40 @@
+import os
+from src.storage.base import Storage, AsyncStorage, FILTER_OPS
+from src.branches import sqlite_path, schema_name
+
+# -------------------- Backend selection --------------------
+# STORAGE_BACKEND=supabase (default) uses SUPABASE_URL / SUPABASE_KEY.
+# STORAGE_BACKEND=sqlite uses the embedded database at SQLITE_PATH and needs
+# no network or credentials.
+# `branch` picks the partition: its own SQLite file or Postgres schema.
+
+def storage_backend():
+    return os.getenv("STORAGE_BACKEND", "supabase").lower()
+
+def create_storage(backend=None, branch=None):
+    """Build the blocking Storage of one branch for the configured backend."""
+    backend = backend or storage_backend()
+    if backend == "sqlite":
+        from src.storage.sqlite_backend import SQLiteStorage
+        return SQLiteStorage(sqlite_path(os.getenv("SQLITE_PATH", "gym.sqlite3"), branch))
+    if backend == "supabase":
+        from src.storage.supabase_backend import SupabaseStorage
+        return SupabaseStorage(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"), schema=schema_name(branch))
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}'.")
+
+def create_async_storage(backend=None, sync_storage=None, branch=None):
+    """Build the AsyncStorage of one branch for the configured backend.
+
+    Backends without a native async client run the blocking one in threads.
+    """
+    backend = backend or storage_backend()
+    if backend == "supabase":
+        from src.storage.supabase_backend import AsyncSupabaseStorage
+        return AsyncSupabaseStorage(
+            os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"),
+            timeout=float(os.getenv("SUPABASE_TIMEOUT", "30")),
+            pool_size=int(os.getenv("SUPABASE_POOL_SIZE", "20")),
+            schema=schema_name(branch),
+        )
+    from src.storage.sqlite_backend import AsyncThreadStorage
+    return AsyncThreadStorage(sync_storage or create_storage(backend, branch))
@@ -0,0 +1,97 @@
+# -------------------- Storage interface --------------------
+# Every backend implements the same four table operations. Filters are
+# backend-neutral (column, op, value) tuples so src.db can build a query
+# once and each backend translates it:
+#
+#   ("plan", "eq", "Monthly"), ("end_date", "gte", "2024-01-01"),
+#   ("id", "in", ["a", "b"])
+#
+# `select(..., order_by=col, after=(value, id))` returns rows ordered by
+# (col, id) descending, starting strictly after the given keyset position.
+#
+# `select_embedded` returns parent rows with their child rows nested under
+# the child table's name, newest first and at most `limit` per parent,
+# in a single round trip (a PostgREST embedded select / one SQL statement).
+#
+# `aggregate(table, filters, column)` returns {"count": rows matching,
+# "sum": total of `column` over them} computed by the database, without
+# fetching the rows.
+#
+# `insert_once(table, rows, key)` is the retry-safe insert used by the write
+# queue: rows whose `key` value is already stored are skipped, so replaying a
+# batch after a crash or timeout never writes a row twice.
+
+FILTER_OPS = ("eq", "neq", "gt", "gte", "lt", "lte", "in")
+
+class Storage:
+    """Interface for a table store used by src.db."""
+
+    name = "base"
+
+    def insert(self, table, rows):
+        """Insert a list of row dicts and return the stored rows (with ids)."""
+        raise NotImplementedError
+
+    def select(self, table, columns="*", filters=(), order_by=None, limit=None, after=None):
+        raise NotImplementedError
+
+    def select_embedded(self, table, filters, embed, foreign_key, order_by=None, limit=None):
+        """Select rows of `table` with `row[embed]` = their rows of `embed` (joined on `foreign_key`)."""
+        raise NotImplementedError
+
+    def aggregate(self, table, filters=(), column=None):
+        """{"count", "sum"} of the matching rows; sum is None without `column`."""
+        raise NotImplementedError
+
+    def insert_once(self, table, rows, key):
+        """Insert rows whose unique `key` column is not stored yet.
+
+        Returns (inserted rows, already stored rows for the other keys).
+        """
+        raise NotImplementedError
+
+    def is_permanent(self, error):
+        """Whether a failed write would fail again on retry (constraint or invalid data)."""
+        return isinstance(error, (ValueError, TypeError))
+
+    def update(self, table, values, filters):
+        """Update matching rows and return them."""
+        raise NotImplementedError
+
+    def delete(self, table, filters):
+        """Delete matching rows and return them."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class AsyncStorage:
+    """Async flavour of Storage, used by src.async_db."""
+
+    name = "base"
+
+    async def insert(self, table, rows):
+        raise NotImplementedError
+
+    async def select(self, table, columns="*", filters=(), order_by=None, limit=None, after=None):
+        raise NotImplementedError
+
+    async def select_embedded(self, table, filters, embed, foreign_key, order_by=None, limit=None):
+        raise NotImplementedError
+
+    async def aggregate(self, table, filters=(), column=None):
+        raise NotImplementedError
+
+    async def update(self, table, values, filters):
+        raise NotImplementedError
+
+    async def delete(self, table, filters):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+def check_filters(filters):
+    for _, op, _ in filters:
+        if op not in FILTER_OPS:
+            raise ValueError(f"Unsupported filter operator '{op}'.")
@@ -0,0 +1,274 @@
+import json
+import uuid
+import asyncio
+import sqlite3
+import threading
+from src.storage.base import Storage, AsyncStorage, check_filters
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS gymrats (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    age INTEGER,
+    phone TEXT UNIQUE NOT NULL,
+    plan TEXT NOT NULL,
+    start_date TEXT NOT NULL DEFAULT (date('now')),
+    end_date TEXT,
+    expired INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS gymrats_start_date ON gymrats(start_date, id);
+CREATE INDEX IF NOT EXISTS gymrats_end_date ON gymrats(end_date);
+CREATE INDEX IF NOT EXISTS gymrats_plan ON gymrats(plan);
+
+CREATE TABLE IF NOT EXISTS payments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    gymrat_id TEXT REFERENCES gymrats(id),
+    amount REAL NOT NULL,
+    payment_date TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%f', 'now')),
+    method TEXT,
+    idempotency_key TEXT
+);
+CREATE INDEX IF NOT EXISTS payments_payment_date ON payments(payment_date, id);
+CREATE INDEX IF NOT EXISTS payments_gymrat_id ON payments(gymrat_id, payment_date);
+
+CREATE TABLE IF NOT EXISTS checkins (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    gymrat_id TEXT NOT NULL REFERENCES gymrats(id) ON DELETE CASCADE,
+    checked_in_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS checkins_checked_in_at ON checkins(checked_in_at, id);
+CREATE INDEX IF NOT EXISTS checkins_gymrat_id ON checkins(gymrat_id, checked_in_at);
+"""
+
+# Columns added after a table was first shipped, applied to existing files.
+MIGRATIONS = [
+    ("payments", "idempotency_key", "ALTER TABLE payments ADD COLUMN idempotency_key TEXT"),
+]
+INDEXES = """
+CREATE UNIQUE INDEX IF NOT EXISTS payments_idempotency_key ON payments(idempotency_key);
+"""
+
+# Tables whose id is generated client side (uuid) rather than by SQLite.
+UUID_TABLES = {"gymrats"}
+BOOL_COLUMNS = {"expired"}
+SQL_OPS = {"eq": "=", "neq": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+def to_dict(cursor, row):
+    record = {}
+    for (name, *_), value in zip(cursor.description, row):
+        record[name] = bool(value) if name in BOOL_COLUMNS and value is not None else value
+    return record
+
+class SQLiteStorage(Storage):
+    """Embedded backend for on-prem, offline and benchmark deployments.
+
+    One connection per thread (WAL lets readers run beside the writer).
+    All statements are parameterised, so sqlite3's statement cache reuses
+    the prepared statement for every call with the same shape.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path, statement_cache=256):
+        self.path = path
+        self.statement_cache = statement_cache
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        for table, column, sql in MIGRATIONS:
+            if column not in self._table_columns(table):
+                conn.execute(sql)
+        conn.executescript(INDEXES)
+        self.columns = {table: self._table_columns(table) for table in ("gymrats", "payments", "checkins")}
+
+    def _table_columns(self, table):
+        return [row["name"] for row in self._conn().execute(f"PRAGMA table_info({table})")]
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   cached_statements=self.statement_cache)
+            conn.row_factory = to_dict
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _check_columns(self, table, columns):
+        known = self.columns.get(table)
+        if known is None:
+            raise ValueError(f"Unknown table '{table}'.")
+        unknown = [c for c in columns if c not in known]
+        if unknown:
+            raise ValueError(f"Unknown columns for {table}: {', '.join(unknown)}")
+
+    def _where(self, table, filters):
+        check_filters(filters)
+        self._check_columns(table, [column for column, _, _ in filters])
+        clauses, params = [], []
+        for column, op, value in filters:
+            if op == "in":
+                values = list(value)
+                if not values:
+                    clauses.append("0")
+                    continue
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+            else:
+                clauses.append(f"{column} {SQL_OPS[op]} ?")
+                params.append(value)
+        return clauses, params
+
+    def insert(self, table, rows):
+        if not rows:
+            return []
+        if table in UUID_TABLES:
+            rows = [{"id": str(uuid.uuid4()), **row} for row in rows]
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        self._check_columns(table, columns)
+        sql = (f"INSERT INTO {table} ({', '.join(columns)}) "
+               f"VALUES ({', '.join('?' * len(columns))}) RETURNING *")
+        conn = self._conn()
+        inserted = []
+        conn.execute("BEGIN")
+        try:
+            for row in rows:
+                inserted.append(conn.execute(sql, [row.get(c) for c in columns]).fetchone())
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return inserted
+
+    def insert_once(self, table, rows, key):
+        if not rows:
+            return [], []
+        if table in UUID_TABLES:
+            rows = [{"id": str(uuid.uuid4()), **row} for row in rows]
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        self._check_columns(table, [*columns, key])
+        # RETURNING only yields rows that were actually inserted.
+        sql = (f"INSERT INTO {table} ({', '.join(columns)}) "
+               f"VALUES ({', '.join('?' * len(columns))}) ON CONFLICT({key}) DO NOTHING RETURNING *")
+        conn = self._conn()
+        inserted = []
+        conn.execute("BEGIN")
+        try:
+            for row in rows:
+                stored = conn.execute(sql, [row.get(c) for c in columns]).fetchone()
+                if stored is not None:
+                    inserted.append(stored)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        done = {r[key] for r in inserted}
+        missing = [row[key] for row in rows if row[key] not in done]
+        existing = self.select(table, filters=[(key, "in", missing)]) if missing else []
+        return inserted, existing
+
+    def is_permanent(self, error):
+        return isinstance(error, sqlite3.IntegrityError) or super().is_permanent(error)
+
+    def select(self, table, columns="*", filters=(), order_by=None, limit=None, after=None):
+        if columns != "*":
+            self._check_columns(table, columns.split(","))
+        clauses, params = self._where(table, filters)
+        if after is not None:
+            self._check_columns(table, [order_by])
+            value, last_id = after
+            clauses.append(f"({order_by} < ? OR ({order_by} = ? AND id < ?))")
+            params.extend([value, value, last_id])
+        sql = f"SELECT {columns} FROM {table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        if order_by:
+            self._check_columns(table, [order_by])
+            sql += f" ORDER BY {order_by} DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return self._conn().execute(sql, params).fetchall()
+
+    def select_embedded(self, table, filters, embed, foreign_key, order_by=None, limit=None):
+        self._check_columns(embed, [foreign_key, *([order_by] if order_by else [])])
+        clauses, params = self._where(table, filters)
+        # A correlated subquery per parent walks the (foreign_key, order_by)
+        # index and stops after `limit` rows; json_group_array nests them.
+        inner = f"SELECT * FROM {embed} WHERE {foreign_key} = {table}.id"
+        if order_by:
+            inner += f" ORDER BY {order_by} DESC, id DESC"
+        inner_params = []
+        if limit is not None:
+            inner += " LIMIT ?"
+            inner_params.append(int(limit))
+        fields = ", ".join(f"'{c}', {c}" for c in self.columns[embed])
+        sql = (f"SELECT {table}.*, (SELECT json_group_array(json_object({fields})) FROM ({inner})) "
+               f"AS {embed} FROM {table}")
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        rows = self._conn().execute(sql, [*inner_params, *params]).fetchall()
+        for row in rows:
+            children = json.loads(row[embed])
+            if order_by:
+                children.sort(key=lambda c: (c[order_by], c["id"]), reverse=True)
+            row[embed] = children
+        return rows
+
+    def aggregate(self, table, filters=(), column=None):
+        clauses, params = self._where(table, filters)
+        if column is not None:
+            self._check_columns(table, [column])
+        sql = f"SELECT COUNT(*) AS count, {f'SUM({column})' if column else 'NULL'} AS sum FROM {table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        row = self._conn().execute(sql, params).fetchone()
+        return {"count": row["count"], "sum": (row["sum"] or 0) if column else None}
+
+    def update(self, table, values, filters):
+        self._check_columns(table, list(values))
+        clauses, params = self._where(table, filters)
+        sql = f"UPDATE {table} SET {', '.join(f'{c} = ?' for c in values)}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return self._conn().execute(sql + " RETURNING *", [*values.values(), *params]).fetchall()
+
+    def delete(self, table, filters):
+        clauses, params = self._where(table, filters)
+        sql = f"DELETE FROM {table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return self._conn().execute(sql + " RETURNING *", params).fetchall()
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+class AsyncThreadStorage(AsyncStorage):
+    """Runs a blocking Storage in worker threads for src.async_db."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.name = storage.name
+
+    async def insert(self, table, rows):
+        return await asyncio.to_thread(self.storage.insert, table, rows)
+
+    async def select(self, table, columns="*", filters=(), order_by=None, limit=None, after=None):
+        return await asyncio.to_thread(self.storage.select, table, columns, filters, order_by, limit, after)
+
+    async def select_embedded(self, table, filters, embed, foreign_key, order_by=None, limit=None):
+        return await asyncio.to_thread(self.storage.select_embedded, table, filters, embed, foreign_key, order_by, limit)
+
+    async def aggregate(self, table, filters=(), column=None):
+        return await asyncio.to_thread(self.storage.aggregate, table, filters, column)
+
+    async def update(self, table, values, filters):
+        return await asyncio.to_thread(self.storage.update, table, values, filters)
+
+    async def delete(self, table, filters):
+        return await asyncio.to_thread(self.storage.delete, table, filters)
@@ -0,0 +1,154 @@
+import asyncio
+import httpx
+from postgrest.exceptions import APIError
+from supabase import create_client, acreate_client, ClientOptions, AsyncClientOptions
+from src.storage.base import Storage, AsyncStorage, check_filters
+
+# Postgres error classes a retry cannot fix: 22 (invalid data) and 23 (constraint violations).
+PERMANENT_SQLSTATES = ("22", "23")
+# Except 23514, also raised as "no partition of relation found for row": the
+# schema is missing a partition (e.g. next month's check-ins), not the row
+# being wrong, so the write is kept and retried once the partition exists.
+RETRYABLE_SQLSTATES = ("23514",)
+
+POSTGREST_OPS = {"eq": "eq", "neq": "neq", "gt": "gt", "gte": "gte", "lt": "lt", "lte": "lte", "in": "in_"}
+
+def apply_filters(query, filters):
+    check_filters(filters)
+    for column, op, value in filters:
+        query = getattr(query, POSTGREST_OPS[op])(column, value)
+    return query
+
+def apply_order(query, order_by, limit, after):
+    if after is not None:
+        value, last_id = after
+        query = query.or_(f'{order_by}.lt."{value}",and({order_by}.eq."{value}",id.lt."{last_id}")')
+    if order_by:
+        query = query.order(order_by, desc=True).order("id", desc=True)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+def apply_embed_order(query, embed, order_by, limit):
+    # PostgREST applies ordering and limits on an embedded resource per parent row.
+    if order_by:
+        query = query.order(order_by, desc=True, foreign_table=embed).order("id", desc=True, foreign_table=embed)
+    if limit is not None:
+        query = query.limit(limit, foreign_table=embed)
+    return query
+
+def aggregate_columns(column):
+    # PostgREST aggregate functions; they need db-aggregates-enabled (see README).
+    return f"count(),{column}.sum()" if column else "count()"
+
+def to_aggregate(rows, column):
+    row = rows[0] if rows else {}
+    return {"count": row.get("count", 0), "sum": (row.get("sum") or 0) if column else None}
+
+# -------------------- Sync --------------------
+class SupabaseStorage(Storage):
+    """Tables in one schema of a Supabase (PostgREST) project."""
+
+    name = "supabase"
+
+    def __init__(self, url, key, schema="public"):
+        self.client = create_client(url, key, options=ClientOptions(schema=schema))
+
+    def insert(self, table, rows):
+        return self.client.table(table).insert(rows).execute().data
+
+    def select(self, table, columns="*", filters=(), order_by=None, limit=None, after=None):
+        query = apply_filters(self.client.table(table).select(columns), filters)
+        return apply_order(query, order_by, limit, after).execute().data
+
+    def insert_once(self, table, rows, key):
+        if not rows:
+            return [], []
+        # ignore-duplicates upsert: the response only holds the rows it inserted.
+        inserted = self.client.table(table).upsert(rows, on_conflict=key, ignore_duplicates=True).execute().data
+        done = {str(r[key]) for r in inserted}
+        missing = [row[key] for row in rows if str(row[key]) not in done]
+        existing = self.select(table, filters=[(key, "in", missing)]) if missing else []
+        return inserted, existing
+
+    def is_permanent(self, error):
+        if isinstance(error, APIError):
+            code = str(error.code or "")
+            return code.startswith(PERMANENT_SQLSTATES) and code not in RETRYABLE_SQLSTATES
+        return super().is_permanent(error)
+
+    def select_embedded(self, table, filters, embed, foreign_key, order_by=None, limit=None):
+        # The join follows the database foreign key, so `foreign_key` is implied.
+        query = apply_filters(self.client.table(table).select(f"*,{embed}(*)"), filters)
+        return apply_embed_order(query, embed, order_by, limit).execute().data
+
+    def aggregate(self, table, filters=(), column=None):
+        query = apply_filters(self.client.table(table).select(aggregate_columns(column)), filters)
+        return to_aggregate(query.execute().data, column)
+
+    def update(self, table, values, filters):
+        return apply_filters(self.client.table(table).update(values), filters).execute().data
+
+    def delete(self, table, filters):
+        return apply_filters(self.client.table(table).delete(), filters).execute().data
+
+# -------------------- Async --------------------
+class AsyncSupabaseStorage(AsyncStorage):
+    """One async client per process over a single pooled httpx.AsyncClient."""
+
+    name = "supabase"
+
+    def __init__(self, url, key, timeout=30.0, pool_size=20, schema="public"):
+        self.url = url
+        self.key = key
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.schema = schema
+        self.client = None
+        self._lock = asyncio.Lock()
+        # httpcore rescans its whole wait queue on every connection state change,
+        # so requests beyond the pool size are parked here instead of inside it.
+        self._inflight = asyncio.Semaphore(pool_size)
+
+    async def _table(self, table):
+        if self.client is None:
+            async with self._lock:
+                if self.client is None:
+                    http = httpx.AsyncClient(
+                        timeout=self.timeout,
+                        limits=httpx.Limits(max_connections=self.pool_size,
+                                            max_keepalive_connections=self.pool_size),
+                    )
+                    options = AsyncClientOptions(httpx_client=http, schema=self.schema)
+                    self.client = await acreate_client(self.url, self.key, options=options)
+        return self.client.table(table)
+
+    async def _execute(self, query):
+        async with self._inflight:
+            return (await query.execute()).data
+
+    async def insert(self, table, rows):
+        return await self._execute((await self._table(table)).insert(rows))
+
+    async def select(self, table, columns="*", filters=(), order_by=None, limit=None, after=None):
+        query = apply_filters((await self._table(table)).select(columns), filters)
+        return await self._execute(apply_order(query, order_by, limit, after))
+
+    async def select_embedded(self, table, filters, embed, foreign_key, order_by=None, limit=None):
+        query = apply_filters((await self._table(table)).select(f"*,{embed}(*)"), filters)
+        return await self._execute(apply_embed_order(query, embed, order_by, limit))
+
+    async def aggregate(self, table, filters=(), column=None):
+        query = apply_filters((await self._table(table)).select(aggregate_columns(column)), filters)
+        return to_aggregate(await self._execute(query), column)
+
+    async def update(self, table, values, filters):
+        return await self._execute(apply_filters((await self._table(table)).update(values), filters))
+
+    async def delete(self, table, filters):
+        return await self._execute(apply_filters((await self._table(table)).delete(), filters))
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.postgrest.aclose()
+            self.client = None
@@ -0,0 +1,93 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from email.utils import formatdate
+
+# -------------------- Setup --------------------
+VERSIONS_CHANGELOG = int(os.getenv("VERSIONS_CHANGELOG", "10000"))  # changed rows kept per table for ?since=
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header names `etag` (weak comparison, "*" matches anything)."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+# -------------------- Versions --------------------
+class TableVersion:
+    """Version counter and recent changes of one table, fed by a manager's writes.
+
+    Every write call bumps the version once, whatever the number of rows.
+    Versions are "<epoch>-<seq>" like change feed ids: the epoch changes on
+    every process start, so a version handed out by another process (or
+    before a restart) never matches and the client reloads. The latest
+    change of each row is kept, up to `size` rows, so `changes_since`
+    answers delta syncs without a query; rows deleted since are returned
+    as ids.
+    """
+
+    def __init__(self, table, size=VERSIONS_CHANGELOG):
+        self.table = table
+        self.size = size
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.floor = 0           # changes up to here may have been dropped from the log
+        self.modified = time.time()
+        self._changes = OrderedDict()  # row id -> (seq, row or None once deleted), oldest first
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return f"{self.epoch}-{self.seq}"
+
+    def on_write(self, event, rows):
+        """Manager write listener."""
+        if not rows:
+            return
+        with self._lock:
+            self.seq += 1
+            self.modified = time.time()
+            for row in rows:
+                key = str(row["id"])
+                self._changes.pop(key, None)
+                self._changes[key] = (self.seq, None if event == "delete" else row)
+            while len(self._changes) > self.size:
+                _, (seq, _) = self._changes.popitem(last=False)
+                self.floor = seq
+
+    def headers(self, *variant):
+        """ETag and Last-Modified of a view of the table; `variant` tells views of the same version apart."""
+        etag = "-".join([self.version, *(str(part) for part in variant)])
+        return {"ETag": f'"{etag}"', "Last-Modified": formatdate(self.modified, usegmt=True),
+                "X-Table-Version": self.version}
+
+    def changes_since(self, version, fields=None):
+        """Rows changed after `version` and the ids deleted since, as a list envelope.
+
+        None when `version` is from another process or older than the log,
+        in which case the client has to reload the whole list.
+        """
+        epoch, _, seq = version.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        with self._lock:
+            if seq < self.floor or seq > self.seq:
+                return None
+            rows, deleted = [], []
+            for row_id, (row_seq, row) in reversed(self._changes.items()):
+                if row_seq <= seq:
+                    break
+                if row is None:
+                    deleted.append(row_id)
+                else:
+                    rows.append(row)
+            current = self.version
+        if fields:
+            rows = [{key: row.get(key) for key in dict.fromkeys(["id", *fields])} for row in rows]
+        return {"success": True, "data": rows, "deleted": deleted, "version": current}
@@ -0,0 +1,336 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from src.branches import DEFAULT_BRANCH
+
+logger = logging.getLogger(__name__)
+
+# -------------------- Setup --------------------
+# Single-row POST /members/ and POST /payments/ are first written to a local
+# SQLite queue under their idempotency key, then to the backend.
+# WRITE_QUEUE_MODE "sync" (default) writes through before answering and only
+# answers 202 when the backend is unreachable; "async" answers 202 as soon as
+# the entry is on disk and leaves the write to the background flusher.
+# WRITE_QUEUE_SYNC=FULL fsyncs every entry, so accepted writes also survive a
+# power cut (NORMAL survives process crashes), at roughly 1 ms per write.
+WRITE_QUEUE_MODE = os.getenv("WRITE_QUEUE_MODE", "sync")
+WRITE_QUEUE_PATH = os.getenv("WRITE_QUEUE_PATH", "write_queue.sqlite3")
+WRITE_QUEUE_SYNC = os.getenv("WRITE_QUEUE_SYNC", "NORMAL")
+WRITE_QUEUE_BATCH_SIZE = int(os.getenv("WRITE_QUEUE_BATCH_SIZE", "200"))
+WRITE_QUEUE_MAX_ATTEMPTS = int(os.getenv("WRITE_QUEUE_MAX_ATTEMPTS", "12"))
+# Seconds a finished entry is kept, i.e. how long a key can be replayed.
+WRITE_QUEUE_RETENTION = float(os.getenv("WRITE_QUEUE_RETENTION", "86400"))
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 300.0
+POLL_INTERVAL = 1.0
+PRUNE_INTERVAL = 3600.0
+# Entries written through by the request itself are hidden from the
+# flusher this long, so both do not race for the same row.
+WRITE_THROUGH_GRACE = 60.0
+
+# Flush order: a payment may belong to a member queued in the same batch.
+KINDS = ("member", "payment")
+# Kinds the request writes itself; their entries only record the outcome
+# for Idempotency-Key replays and are never flushed.
+RECORD_KINDS = ("renewal",)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS writes (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    request_hash TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    ref TEXT,
+    branch TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS writes_due ON writes(status, next_attempt);
+CREATE INDEX IF NOT EXISTS writes_updated ON writes(status, updated_at);
+CREATE INDEX IF NOT EXISTS writes_ref ON writes(ref);
+"""
+# Columns added after the queue file format was first shipped.
+MIGRATIONS = [
+    ("branch", "ALTER TABLE writes ADD COLUMN branch TEXT"),
+]
+
+class IdempotencyConflict(Exception):
+    """An idempotency key was reused for a different request."""
+
+def request_hash(kind, body):
+    raw = json.dumps([kind, body], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+def backoff(attempts, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """Delay before retry number `attempts` (1-based): exponential with jitter."""
+    return min(cap, base * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+def to_entry(cursor, row):
+    entry = {name: value for (name, *_), value in zip(cursor.description, row)}
+    for field in ("payload", "result"):
+        if entry.get(field) is not None:
+            entry[field] = json.loads(entry[field])
+    return entry
+
+# -------------------- Queue --------------------
+class WriteQueue:
+    """Durable queue of accepted writes, keyed by idempotency key.
+
+    An entry holds the backend payload and its status: pending, done or
+    failed. Finished entries keep the response they produced, which is
+    replayed to clients that retry with the same key.
+    """
+
+    def __init__(self, path=WRITE_QUEUE_PATH, synchronous=WRITE_QUEUE_SYNC):
+        self.path = path
+        self.synchronous = synchronous
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(writes)")}
+        for column, sql in MIGRATIONS:
+            if column not in columns:
+                conn.execute(sql)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = to_entry
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind, key, payload, body_hash, ref=None, delay=0.0, branch=None):
+        """Store a new entry; returns (entry, created).
+
+        `ref` is the member id the write belongs to and `branch` the
+        partition it is written to. A repeated key returns
+        the stored entry instead, or raises IdempotencyConflict when it came
+        with a different request.
+        """
+        now = time.time()
+        try:
+            self._conn().execute(
+                "INSERT INTO writes (key, kind, request_hash, payload, ref, branch, next_attempt, "
+                "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [key, kind, body_hash, json.dumps(payload), ref, branch, now + delay, now, now])
+        except sqlite3.IntegrityError:
+            entry = self.get(key)
+            if entry is None:
+                raise
+            if entry["request_hash"] != body_hash:
+                raise IdempotencyConflict(key)
+            return entry, False
+        return {"key": key, "kind": kind, "request_hash": body_hash, "payload": payload, "ref": ref, "branch": branch,
+                "status": "pending", "attempts": 0, "next_attempt": now + delay, "result": None, "error": None,
+                "created_at": now, "updated_at": now}, True
+
+    def get(self, key):
+        return self._conn().execute("SELECT * FROM writes WHERE key = ?", [key]).fetchone()
+
+    def due(self, limit, now=None):
+        """Pending entries whose next attempt is due, oldest first."""
+        return self._conn().execute(
+            f"SELECT * FROM writes WHERE status = 'pending' AND next_attempt <= ? "
+            f"AND kind IN ({', '.join('?' * len(KINDS))}) ORDER BY rowid LIMIT ?",
+            [now or time.time(), *KINDS, limit]).fetchall()
+
+    def pending_refs(self, kind, refs):
+        """The subset of `refs` that still have a pending entry of `kind`."""
+        refs = list(set(refs))
+        if not refs:
+            return set()
+        rows = self._conn().execute(
+            f"SELECT ref FROM writes WHERE kind = ? AND status = 'pending' AND ref IN ({', '.join('?' * len(refs))})",
+            [kind, *refs]).fetchall()
+        return {row["ref"] for row in rows}
+
+    def complete(self, key, result):
+        self._finish(key, "done", result)
+
+    def fail(self, key, result):
+        self._finish(key, "failed", result)
+
+    def _finish(self, key, status, result):
+        self._conn().execute(
+            "UPDATE writes SET status = ?, result = ?, error = ?, updated_at = ? WHERE key = ? AND status = 'pending'",
+            [status, json.dumps(result, default=str), result.get("error"), time.time(), key])
+
+    def forget(self, key):
+        """Drop an entry so its key can be used again."""
+        self._conn().execute("DELETE FROM writes WHERE key = ?", [key])
+
+    def retry(self, key, error, delay, count_attempt=True):
+        """Push an entry back by `delay` seconds; returns its attempt count."""
+        row = self._conn().execute(
+            "UPDATE writes SET attempts = attempts + ?, next_attempt = ?, error = ?, updated_at = ? "
+            "WHERE key = ? AND status = 'pending' RETURNING attempts",
+            [int(count_attempt), time.time() + delay, error, time.time(), key]).fetchone()
+        return row["attempts"] if row else 0
+
+    def prune(self, before):
+        """Forget finished entries last touched before `before` (their keys can be reused).
+
+        A record kind entry still pending that long was cut short by a crash.
+        """
+        return self._conn().execute(
+            f"DELETE FROM writes WHERE (status != 'pending' OR kind IN ({', '.join('?' * len(RECORD_KINDS))})) "
+            "AND updated_at < ?", [*RECORD_KINDS, before]).rowcount
+
+    def counts(self):
+        rows = self._conn().execute("SELECT status, COUNT(*) AS n FROM writes GROUP BY status").fetchall()
+        return {"pending": 0, "done": 0, "failed": 0, **{row["status"]: row["n"] for row in rows}}
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+# -------------------- Flusher --------------------
+class WriteQueueFlusher:
+    """Background task that drains the write queue into the backend.
+
+    Due entries are written in batches per branch and kind through the
+    managers' add_*_once methods, which skip rows an earlier attempt already stored.
+    A batch can therefore be replayed after a timeout or a crash, and each
+    accepted write lands in the database exactly once. Failed batches are
+    retried with exponential backoff; a batch rejected by the database is
+    split so one bad row only fails itself.
+    """
+
+    def __init__(self, queue, writers, batch_size=WRITE_QUEUE_BATCH_SIZE,
+                 max_attempts=WRITE_QUEUE_MAX_ATTEMPTS, retention=WRITE_QUEUE_RETENTION,
+                 interval=POLL_INTERVAL):
+        self.queue = queue
+        self.writers = writers  # branch -> kind -> callable(payloads) returning add_*_once responses
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self.interval = interval
+        self.flushed = 0
+        self.retries = 0
+        self._wake = None
+        self._task = None
+
+    def stats(self):
+        return {**self.queue.counts(), "flushed": self.flushed, "retries": self.retries}
+
+    def wake(self):
+        """Flush now instead of at the next poll (called after an async enqueue)."""
+        if self._wake is not None:
+            self._wake.set()
+
+    def flush_once(self, now=None):
+        """Write one batch of due entries; returns how many were processed."""
+        entries = self.queue.due(self.batch_size, now)
+        self.write(entries)
+        return len(entries)
+
+    def write(self, entries):
+        """Write entries to the backend and record each outcome in the queue."""
+        by_branch = {}
+        for entry in entries:  # entries queued before branches existed have none
+            by_branch.setdefault(entry["branch"] or DEFAULT_BRANCH, []).append(entry)
+        for branch, batch in by_branch.items():
+            self._write_branch(branch, batch)
+
+    def _write_branch(self, branch, entries):
+        writers = self.writers.get(branch)
+        if writers is None:
+            for entry in entries:
+                self.queue.fail(entry["key"], {"success": False, "error": f"Unknown branch '{branch}'."})
+            logger.error("%d queued writes for unknown branch '%s' failed", len(entries), branch)
+            return
+        for kind in KINDS:
+            batch = [e for e in entries if e["kind"] == kind]
+            if not batch:
+                continue
+            if kind == "payment":
+                # A payment whose member is still queued waits instead of failing on the foreign key.
+                waiting = self.queue.pending_refs("member", [e["ref"] for e in batch])
+                for entry in batch:
+                    if entry["ref"] in waiting:
+                        self.queue.retry(entry["key"], "Waiting for the queued member.", self.interval,
+                                         count_attempt=False)
+                batch = [e for e in batch if e["ref"] not in waiting]
+                if not batch:
+                    continue
+            self._write_batch(writers[kind], kind, batch)
+
+    def _write_batch(self, writer, kind, batch):
+        result = writer([entry["payload"] for entry in batch])
+        if result["success"]:
+            for entry, response in zip(batch, result["data"]):
+                if response["success"]:
+                    self.queue.complete(entry["key"], response)
+                    self.flushed += 1
+                else:
+                    self._retry(entry, response["message"])
+        elif result.get("permanent") and len(batch) > 1:
+            for entry in batch:
+                self._write_batch(writer, kind, [entry])
+        elif result.get("permanent"):
+            self.queue.fail(batch[0]["key"], {"success": False, "error": result["error"]})
+            logger.warning("Queued %s write %s rejected: %s", kind, batch[0]["key"], result["error"])
+        else:
+            logger.warning("%d queued %s writes failed, will retry: %s", len(batch), kind, result["error"])
+            for entry in batch:
+                self._retry(entry, result["error"])
+
+    def _retry(self, entry, error):
+        self.retries += 1
+        attempts = self.queue.retry(entry["key"], error, backoff(entry["attempts"] + 1))
+        if attempts >= self.max_attempts:
+            self.queue.fail(entry["key"], {"success": False, "error": f"Gave up after {attempts} attempts: {error}"})
+            logger.error("Queued %s write %s failed for good: %s", entry["kind"], entry["key"], error)
+
+    async def write_through(self, entry):
+        """Write one freshly queued entry from the request itself; returns its updated entry."""
+        await asyncio.to_thread(self.write, [entry])
+        return await asyncio.to_thread(self.queue.get, entry["key"])
+
+    async def run(self):
+        self._wake = asyncio.Event()
+        next_prune = 0.0
+        while True:
+            processed = 0
+            try:
+                processed = await asyncio.to_thread(self.flush_once)
+                if time.time() >= next_prune:
+                    pruned = await asyncio.to_thread(self.queue.prune, time.time() - self.retention)
+                    if pruned:
+                        logger.info("Pruned %d finished write queue entries", pruned)
+                    next_prune = time.time() + PRUNE_INTERVAL
+            except Exception:
+                logger.exception("Write queue flush crashed")
+            if processed < self.batch_size:  # a full batch means more are probably due
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
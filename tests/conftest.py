@@ -0,0 +1,22 @@
+import os
+import tempfile
+import pytest
+
+# API.main opens its write queue at import; keep that file out of the working tree.
+os.environ.setdefault("WRITE_QUEUE_PATH", os.path.join(tempfile.mkdtemp(), "write_queue.sqlite3"))
+
+from src import db, cache
+from src.storage.sqlite_backend import SQLiteStorage
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    """Read-through cache entries must not leak from one test database into the next."""
+    monkeypatch.setattr(cache, "cache", cache.LRUCache())
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    """An empty SQLite database serving the default branch."""
+    storage = SQLiteStorage(str(tmp_path / "gym.sqlite3"))
+    monkeypatch.setitem(db.storages, db.check_branch(), storage)
+    yield storage
+    storage.close()
@@ -0,0 +1,26 @@
+from src import cache
+
+def test_read_overlapping_an_invalidation_is_not_cached():
+    rows = ["before"]
+
+    @cache.cached("gymrats:page")
+    def read():
+        result = {"success": True, "data": list(rows)}
+        # A write commits and invalidates while this read is still running.
+        rows[0] = "after"
+        cache.invalidate_members()
+        return result
+
+    assert read()["data"] == ["before"]
+    assert len(cache.cache) == 0
+
+def test_read_without_writes_is_cached():
+    calls = []
+
+    @cache.cached("payments:page")
+    def read(limit):
+        calls.append(limit)
+        return {"success": True, "data": [limit]}
+
+    assert read(10) == read(10)
+    assert calls == [10]
@@ -0,0 +1,39 @@
+import sqlite3
+import pytest
+from src import db
+from src.storage.sqlite_backend import SQLiteStorage
+
+class FlakyStorage(SQLiteStorage):
+    """Rejects multi-row check-in inserts for good and drops the connection on one row."""
+
+    def __init__(self, path, down_on):
+        super().__init__(path)
+        self.down_on = down_on
+
+    def insert(self, table, rows):
+        if table == "checkins" and len(rows) > 1:
+            raise sqlite3.IntegrityError("FOREIGN KEY constraint failed")
+        if table == "checkins" and rows[0]["gymrat_id"] == self.down_on:
+            raise ConnectionError("database went away")
+        return super().insert(table, rows)
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = FlakyStorage(str(tmp_path / "gym.sqlite3"), down_on=None)
+    monkeypatch.setitem(db.storages, db.check_branch(), storage)
+    yield storage
+    storage.close()
+
+def test_transient_error_in_row_retry_counts_rows_handled(storage):
+    members = [db.add_member(f"M{i}", f"55{i}", "Monthly")["data"][0]["id"] for i in range(3)]
+    payloads = [{"gymrat_id": m, "checked_in_at": f"2026-10-18T10:0{i}:00"} for i, m in enumerate(members)]
+    payloads.insert(1, {"gymrat_id": "unknown", "checked_in_at": "2026-10-18T10:05:00"})
+    storage.down_on = members[2]
+
+    result = db.add_checkins(payloads, chunk_size=10)
+
+    assert not result["success"]
+    # The first member's row and the rejected one were handled; the rest is left for a retry.
+    assert result["data"]["stored"] == 3
+    assert [r["gymrat_id"] for r in result["data"]["rejected"]] == ["unknown"]
+    assert len(storage.select("checkins")) == 2
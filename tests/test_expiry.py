@@ -0,0 +1,48 @@
+from datetime import date, timedelta
+from src import db
+from src.logic import GymratManager
+from src.expiry import ExpiryIndex, ExpirySweeper, index_fields
+
+TODAY = date(2026, 10, 18)
+
+def add_member(name, phone, end_date):
+    return db.add_member(name, phone, "Monthly", TODAY - timedelta(days=60), end_date)["data"][0]
+
+def test_delete_sweep_keeps_members_with_payments(storage):
+    lapsed = TODAY - timedelta(days=1)
+    paid = add_member("Paid", "100", lapsed)
+    unpaid = [add_member(f"Unpaid {i}", f"20{i}", lapsed) for i in range(3)]
+    db.add_payment(paid["id"], 800, TODAY - timedelta(days=31))
+
+    manager = GymratManager()
+    index = ExpiryIndex()
+    index.load(manager.iter_members(index_fields("delete")))
+    sweeper = ExpirySweeper(index, manager, mode="delete", batch_size=10)
+
+    assert sweeper.sweep_once(TODAY) == 3
+    remaining = {row["id"] for row in storage.select("gymrats")}
+    assert remaining == {paid["id"]}
+    assert all(index.is_active(m["id"], lapsed) is False for m in unpaid)
+    # The kept member left the index, so the next sweep has nothing to retry.
+    assert sweeper.sweep_once(TODAY) == 0
+
+def test_renewal_unflags_member_in_flag_mode(storage, monkeypatch):
+    monkeypatch.setattr(db, "EXPIRY_SWEEP_MODE", "flag")
+    member = add_member("Lapsed", "300", TODAY - timedelta(days=1))
+    manager = GymratManager()
+    index = ExpiryIndex()
+    index.load(manager.iter_members(index_fields("flag")))
+    manager.add_listener(index.on_write)
+    ExpirySweeper(index, manager, mode="flag").sweep_once(TODAY)
+    assert storage.select("gymrats")[0]["expired"] is True
+
+    renewed_to = date.today() + timedelta(days=30)
+    manager.update_member(member["id"], "Monthly", renewed_to)
+    assert storage.select("gymrats")[0]["expired"] is False
+    assert index.is_active(member["id"], date.today())
+
+def test_index_ignores_stale_flag_on_current_term():
+    index = ExpiryIndex()
+    end = date.today() + timedelta(days=10)
+    index.load([{"id": "a", "end_date": end.isoformat(), "expired": True}])
+    assert index.is_active("a", date.today())
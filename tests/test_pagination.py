@@ -0,0 +1,31 @@
+from datetime import date
+import pytest
+from src import db
+
+def test_cursor_round_trip():
+    cursor = db.encode_cursor({"id": "b7", "start_date": "2026-10-18", "name": "Asha"}, "start_date")
+    assert db.decode_cursor(cursor) == ("2026-10-18", "b7")
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        db.decode_cursor("not-a-cursor")
+    assert db.get_members_page(cursor="not-a-cursor") == {"success": False, "error": "Invalid cursor."}
+
+def test_pages_cover_equal_sort_keys_exactly_once(storage):
+    joined = date(2026, 10, 1)
+    ids = {db.add_member(f"M{i}", f"555{i:04}", "Monthly", joined)["data"][0]["id"] for i in range(7)}
+    db.add_member("Newest", "5559999", "Monthly", date(2026, 10, 2))
+
+    seen, cursor = [], None
+    while True:
+        page = db.get_members_page(limit=3, cursor=cursor)
+        assert page["success"]
+        seen.extend(page["data"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen[0]["name"] == "Newest"
+    tied = [row["id"] for row in seen[1:]]
+    assert sorted(tied) == sorted(ids)
+    assert tied == sorted(tied, reverse=True)  # ties are ordered by id, newest start_date first
@@ -0,0 +1,17 @@
+from datetime import date
+from src.logic import plan_renewal
+
+TODAY = date(2026, 10, 18)
+
+def test_upgrade_credits_every_prepaid_month():
+    renewal = plan_renewal({"plan": "Monthly", "end_date": "2027-03-18"}, "Quarterly", TODAY)
+    assert renewal["credit"] == 5000.0
+    assert renewal["amount"] == 0.0
+    # 2300 of unused credit buys 78 more days of the Quarterly plan.
+    assert renewal["end_date"] == date(2027, 4, 6)
+
+def test_upgrade_credits_part_of_a_term():
+    renewal = plan_renewal({"plan": "Monthly", "end_date": "2026-11-18"}, "Yearly", TODAY)
+    assert renewal["credit"] == 1000.0
+    assert renewal["amount"] == 8600.0
+    assert renewal["end_date"] == date(2027, 10, 18)
@@ -0,0 +1,71 @@
+import pytest
+from src.logic import GymratManager
+from src.versions import TableVersion
+
+@pytest.fixture
+def members(storage):
+    """A GymratManager whose writes feed a TableVersion that keeps two changed rows."""
+    version = TableVersion("gymrats", size=2)
+    manager = GymratManager()
+    manager.add_listener(version.on_write)
+    return manager, version
+
+def add(manager, i):
+    return manager.add_member(f"M{i}", f"555{i:04}", "Monthly")["data"][0]
+
+def test_changes_since_follows_manager_writes(members):
+    manager, version = members
+    start = version.version
+    kept, gone = add(manager, 1), add(manager, 2)
+    manager.delete_member(gone["id"])
+
+    delta = version.changes_since(start)
+    assert [row["id"] for row in delta["data"]] == [kept["id"]]
+    assert delta["deleted"] == [gone["id"]]
+    assert delta["version"] == version.version
+    assert version.changes_since(version.version)["data"] == []
+
+def test_trimmed_history_cannot_answer(members):
+    manager, version = members
+    start = version.version
+    for i in range(3):
+        add(manager, i)
+    assert version.changes_since(start) is None
+    assert version.changes_since("other-process-0") is None
+
+# -------------------- API --------------------
+@pytest.fixture
+def api(members, monkeypatch):
+    """TestClient over API.main with the default branch's member list versioned by `members`."""
+    pytest.importorskip("fastapi")
+    from fastapi.testclient import TestClient
+    from API import main
+
+    manager, version = members
+    branch = main.default_branch
+    monkeypatch.setattr(branch, "members_version", version)
+    monkeypatch.setattr(branch.gymrat_mgr, "_listeners", [version.on_write])
+    return TestClient(main.app), branch.gymrat_mgr, version
+
+def test_since_returns_410_once_history_is_trimmed(api):
+    client, manager, version = api
+    start = version.version
+    for i in range(3):
+        add(manager, i)
+    response = client.get("/members/", params={"since": start})
+    assert response.status_code == 410
+
+def test_since_delta_over_the_api(api):
+    client, manager, version = api
+    start = version.version
+    member = add(manager, 1)
+    response = client.get("/members/", params={"since": start})
+    assert response.status_code == 200
+    assert [row["id"] for row in response.json()["data"]] == [member["id"]]
+    assert response.headers["X-Table-Version"] == version.version
+
+@pytest.mark.parametrize("params", [{"plan": "Monthly"}, {"status": "active"}, {"cursor": "abc"}])
+def test_since_cannot_be_combined_with_filters_or_cursor(api, params):
+    client, _, version = api
+    response = client.get("/members/", params={"since": version.version, **params})
+    assert response.status_code == 400
@@ -0,0 +1,61 @@
+import uuid
+import pytest
+from src.db import member_payload, payment_payload
+from src.logic import GymratManager, PaymentManager
+from src.branches import DEFAULT_BRANCH
+from src.write_queue import WriteQueue, WriteQueueFlusher, IdempotencyConflict, request_hash
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WriteQueue(str(tmp_path / "queue.sqlite3"))
+    yield queue
+    queue.close()
+
+@pytest.fixture
+def flusher(queue, storage):
+    writers = {DEFAULT_BRANCH: {"member": GymratManager().add_members_once,
+                                "payment": PaymentManager().add_payments_once}}
+    return WriteQueueFlusher(queue, writers)
+
+def enqueue_member(queue, key, phone="5550100"):
+    body = {"name": "Asha", "phone": phone, "plan": "Monthly"}
+    payload = {"id": str(uuid.uuid4()), **member_payload(**body)}
+    return queue.enqueue("member", key, payload, request_hash("member", body), payload["id"],
+                         branch=DEFAULT_BRANCH)
+
+def test_replayed_key_returns_the_stored_write(queue, flusher, storage):
+    entry, created = enqueue_member(queue, "key-1")
+    assert created
+    flusher.write([entry])
+
+    replay, created = enqueue_member(queue, "key-1")
+    assert not created
+    assert replay["status"] == "done"
+    assert replay["result"]["data"][0]["id"] == entry["payload"]["id"]
+    assert len(storage.select("gymrats")) == 1
+
+def test_rewriting_a_flushed_entry_stores_it_once(queue, flusher, storage):
+    entry, _ = enqueue_member(queue, "key-1")
+    # A crash after the insert but before the queue recorded it replays the batch.
+    flusher.write([entry])
+    flusher.write([entry])
+    assert len(storage.select("gymrats")) == 1
+    assert queue.counts()["done"] == 1
+
+def test_reused_key_with_a_different_body_conflicts(queue):
+    enqueue_member(queue, "key-1", phone="5550100")
+    with pytest.raises(IdempotencyConflict):
+        enqueue_member(queue, "key-1", phone="5550199")
+
+def test_rejected_write_ends_failed(queue, flusher, storage):
+    body = {"member_id": "no-such-member", "amount": 800}
+    payload = {**payment_payload(**body), "idempotency_key": "pay-1"}
+    entry, _ = queue.enqueue("payment", "pay-1", payload, request_hash("payment", body), payload["gymrat_id"],
+                             branch=DEFAULT_BRANCH)
+    flusher.write([entry])
+
+    stored = queue.get("pay-1")
+    assert stored["status"] == "failed"
+    assert "FOREIGN KEY" in stored["result"]["error"]
+    assert storage.select("payments") == []
+    assert queue.due(10, now=float("inf")) == []